@@ -0,0 +1,282 @@
+import json
+import re
+from array import array
+from lex_token import Token
+from lexer import NumberNode, NumberAccessNode, NumberAssignNode, BinOpNode, UnaryOpNode, HeadNode, children, token_of, shared_nodes
+from position import Source
+
+#######################################
+# AST SERIALIZER
+#######################################
+# Writes an AST to a file-like object as it walks it, and reads one back
+# as the text arrives, both with explicit stacks: memory beyond the AST
+# itself is the depth of the tree, plus a label for each shared node.
+#
+# Every node is written with its token as TYPE VALUE START END, the token
+# type, value and source offsets. VALUE is an int, a float, a JSON string,
+# or nil for none. Identifiers keep their symbol table location as value.
+#
+# S-expressions, one tree, children after their parent:
+#
+#   (head KEYWORD "HEAD" 0 4 (assign IDENTIFIER 0 5 6 (num INT 1 9 10)) nil)
+#
+# The kinds are num, var, assign, unary, bin and head, with 0, 0, 1, 1, 2
+# and 2 children; nil is a missing child. A node the optimiser shared is
+# written once as #n=(...) and after that as #n#.
+#
+# JSON Lines, one node per line, children before their parent:
+#
+#   {"kind": "num", "type": "INT", "value": 1, "start": 9, "end": 10}
+#   {"kind": "assign", "type": "IDENTIFIER", "value": 0, "start": 5, "end": 6}
+#   {"kind": "nil"}
+#   {"kind": "head", "type": "KEYWORD", "value": "HEAD", "start": 0, "end": 4}
+#
+# Each node takes its children from the nodes before it. A shared node has
+# "id": n where it is first written and is {"ref": n} after that.
+#
+# Loaded tokens are Tokens into source, or into a Source without text when
+# none is given, whose positions are then all on line 0.
+
+SEXPR = 'sexpr'
+JSONL = 'jsonl'
+
+KINDS = (
+    ('num', NumberNode, 0),
+    ('var', NumberAccessNode, 0),
+    ('assign', NumberAssignNode, 1),
+    ('unary', UnaryOpNode, 1),
+    ('bin', BinOpNode, 2),
+    ('head', HeadNode, 2),
+)
+KIND_NAMES = {node_type: name for name, node_type, arity in KINDS}
+ARITIES = {name: arity for name, node_type, arity in KINDS}
+
+# Pieces gathered before each write to the file.
+WRITE_BATCH = 4096
+READ_SIZE = 64 * 1024
+
+class FormatError(ValueError):
+    pass
+
+def format_value(value):
+    if value is None: return 'nil'
+    if value.__class__ is str: return json.dumps(value)
+    return repr(value)
+
+def parse_value(text):
+    if text == 'nil': return None
+    if text[0] == '"': return json.loads(text)
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        raise FormatError(f'bad value {text!r}') from None
+
+def default_source():
+    return Source('<ast>', None, array('q', [0]))
+
+def build(kind, fields, kids, source):
+    tok_type, value, start, end = fields
+    tok = Token(tok_type, value, start, end, source)
+    if kind == 'num': return NumberNode(tok)
+    if kind == 'var': return NumberAccessNode(tok)
+    if kind == 'assign': return NumberAssignNode(tok, kids[0])
+    if kind == 'unary': return UnaryOpNode(tok, kids[0])
+    if kind == 'bin': return BinOpNode(kids[0], tok, kids[1])
+    return HeadNode(kids[0], tok, kids[1])
+
+#######################################
+# S-EXPRESSIONS
+#######################################
+
+def dump_sexpr(node, file):
+    shared = shared_nodes(node)
+    labels = {}
+    pieces = []
+    work = [node]
+    while work:
+        item = work.pop()
+        if item.__class__ is str:
+            pieces.append(item)
+        elif item is None:
+            pieces.append('nil')
+        elif id(item) in labels:
+            pieces.append(f'#{labels[id(item)]}#')
+        else:
+            if id(item) in shared:
+                labels[id(item)] = len(labels)
+                pieces.append(f'#{labels[id(item)]}=')
+            tok = token_of(item)
+            pieces.append(f'({KIND_NAMES[item.__class__]} {tok.type} {format_value(tok.value)} {tok.pos_start.idx} {tok.pos_end.idx}')
+            work.append(')')
+            for kid in reversed(children(item)):
+                work.append(kid)
+                work.append(' ')
+        if len(pieces) >= WRITE_BATCH:
+            file.write(''.join(pieces))
+            pieces.clear()
+    pieces.append('\n')
+    file.write(''.join(pieces))
+
+SEXPR_TOKEN = re.compile(r'\s*(?:([()])|("(?:[^"\\]|\\.)*")|#(\d+)([=#])|([^\s()"#]+))')
+
+def sexpr_tokens(file):
+    # Atoms of the text read from file in pieces, with labels as ('=', n)
+    # or ('#', n). An atom that fails to match, or runs into the end of
+    # what was read, may go on in the next piece, so it is matched again
+    # once more has been read.
+    buffer = ''
+    idx = 0
+    eof = False
+    while True:
+        m = SEXPR_TOKEN.match(buffer, idx)
+        if (m is None or m.end() == len(buffer)) and not eof:
+            chunk = file.read(READ_SIZE)
+            if not chunk: eof = True
+            buffer = buffer[idx:] + chunk
+            idx = 0
+            continue
+        if m is None:
+            if buffer[idx:].strip(): raise FormatError(f'unexpected {buffer[idx:].strip()[:20]!r}')
+            return
+        idx = m.end()
+        if m.group(3): yield (m.group(4), int(m.group(3)))
+        else: yield m.group(1) or m.group(2) or m.group(5)
+
+def load_sexpr(file, source=None):
+    source = source or default_source()
+    labelled = {}
+    # One frame per open node: [kind, fields, children, label].
+    frames = []
+    label = None
+    root = []
+    def finish(node):
+        nonlocal label
+        if label is not None:
+            labelled[label] = node
+            label = None
+        (frames[-1][2] if frames else root).append(node)
+
+    for atom in sexpr_tokens(file):
+        if atom.__class__ is tuple:
+            kind, number = atom
+            if kind == '=':
+                label = number
+            elif number in labelled:
+                (frames[-1][2] if frames else root).append(labelled[number])
+            else:
+                raise FormatError(f'#{number}# before #{number}=')
+        elif atom == '(':
+            frames.append([None, [], [], label])
+            label = None
+        elif atom == ')':
+            if not frames: raise FormatError("unmatched ')'")
+            kind, fields, kids, frame_label = frames.pop()
+            if kind is None or len(fields) != 4: raise FormatError(f'incomplete {kind or "node"}')
+            if len(kids) != ARITIES[kind]: raise FormatError(f'{kind} takes {ARITIES[kind]} children, not {len(kids)}')
+            label = frame_label
+            finish(build(kind, fields, kids, source))
+        elif not frames:
+            if atom != 'nil': raise FormatError(f'unexpected {atom!r}')
+            finish(None)
+        else:
+            frame = frames[-1]
+            if frame[0] is None:
+                if atom not in ARITIES: raise FormatError(f'unknown kind {atom!r}')
+                frame[0] = atom
+            elif len(frame[1]) == 0:
+                frame[1].append(atom)
+            elif len(frame[1]) == 1:
+                frame[1].append(parse_value(atom))
+            elif len(frame[1]) < 4:
+                frame[1].append(int(atom))
+            elif atom == 'nil':
+                finish(None)
+            else:
+                raise FormatError(f'unexpected {atom!r}')
+    if frames: raise FormatError('unexpected end of input')
+    if len(root) != 1: raise FormatError(f'expected one tree, found {len(root)}')
+    return root[0]
+
+#######################################
+# JSON LINES
+#######################################
+
+def dump_jsonl(node, file):
+    # Post-order walk with an explicit stack, like vm.Compiler.
+    shared = shared_nodes(node)
+    labels = {}
+    lines = []
+    work = [(node, False)]
+    while work:
+        item, done = work.pop()
+        if item is None:
+            lines.append('{"kind": "nil"}\n')
+        elif id(item) in labels:
+            lines.append(f'{{"ref": {labels[id(item)]}}}\n')
+        elif not done:
+            work.append((item, True))
+            for kid in reversed(children(item)):
+                work.append((kid, False))
+            continue
+        else:
+            tok = token_of(item)
+            entry = {'kind': KIND_NAMES[item.__class__], 'type': tok.type, 'value': tok.value,
+                'start': tok.pos_start.idx, 'end': tok.pos_end.idx}
+            if id(item) in shared:
+                entry['id'] = labels[id(item)] = len(labels)
+            lines.append(json.dumps(entry) + '\n')
+        if len(lines) >= WRITE_BATCH:
+            file.write(''.join(lines))
+            lines.clear()
+    file.write(''.join(lines))
+
+def load_jsonl(file, source=None):
+    source = source or default_source()
+    labelled = {}
+    values = []
+    for number, line in enumerate(file, 1):
+        if not line.strip(): continue
+        try:
+            entry = json.loads(line)
+        except ValueError as exc:
+            raise FormatError(f'line {number}: {exc}') from None
+        if 'ref' in entry:
+            if entry['ref'] not in labelled: raise FormatError(f'line {number}: ref {entry["ref"]} before its node')
+            values.append(labelled[entry['ref']])
+            continue
+        kind = entry.get('kind')
+        if kind == 'nil':
+            values.append(None)
+            continue
+        if kind not in ARITIES: raise FormatError(f'line {number}: unknown kind {kind!r}')
+        arity = ARITIES[kind]
+        if len(values) < arity: raise FormatError(f'line {number}: {kind} takes {arity} children')
+        kids = values[len(values) - arity:]
+        del values[len(values) - arity:]
+        try:
+            fields = (entry['type'], entry['value'], entry['start'], entry['end'])
+        except KeyError as exc:
+            raise FormatError(f'line {number}: missing {exc}') from None
+        node = build(kind, fields, kids, source)
+        if 'id' in entry: labelled[entry['id']] = node
+        values.append(node)
+    if len(values) != 1: raise FormatError(f'expected one tree, found {len(values)}')
+    return values[0]
+
+#######################################
+# DUMP AND LOAD
+#######################################
+
+def dump(node, file, format=SEXPR):
+    if format == SEXPR: dump_sexpr(node, file)
+    elif format == JSONL: dump_jsonl(node, file)
+    else: raise ValueError(f'unknown format {format!r}')
+
+def load(file, format=SEXPR, source=None):
+    if format == SEXPR: return load_sexpr(file, source)
+    if format == JSONL: return load_jsonl(file, source)
+    raise ValueError(f'unknown format {format!r}')
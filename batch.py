@@ -0,0 +1,69 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import lexer
+import node_arena
+
+#######################################
+# BATCH COMPILATION
+#######################################
+# Fans many source files out to a process pool. Files are sent in batches
+# so the per-task overhead of the pool stays small next to compiling
+# thousands of short programs.
+#
+# Results come back from the workers by pickling, which recurses over an
+# AST's nodes, so a worker returns the AST as a NodeArena instead. A file
+# that cannot be compiled at all, such as one that is missing, comes back
+# as a FileError for that file rather than stopping the batch.
+
+BATCH_SIZE = 16
+
+class FileError:
+    def __init__(self, path, details):
+        self.path = path
+        self.error_name = 'File Error'
+        self.details = details
+
+    def as_string(self):
+        return f'{self.error_name}: {self.details}\nFile {self.path}'
+
+def compile_file(path):
+    try:
+        with open(path) as file:
+            result, error, symbol_table = lexer.run_stream(path, file)
+        if error: return path, None, error, symbol_table
+        return path, node_arena.from_tree(result), None, symbol_table
+    except Exception as exc:
+        return path, None, FileError(path, f'{exc.__class__.__name__}: {exc}'), None
+
+def compile_files(paths):
+    return [compile_file(path) for path in paths]
+
+def run_many(paths, workers=None, batch_size=BATCH_SIZE):
+    # Yields (path, arena, error, symbol_table) for every path, in the
+    # order the batches complete; arena.to_tree() gives the AST.
+    paths = list(paths)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(compile_files, paths[i:i + batch_size])
+            for i in range(0, len(paths), batch_size)]
+        for future in as_completed(futures):
+            yield from future.result()
+
+class BatchStats:
+    def __init__(self):
+        self.files = 0
+        self.errors = 0
+        self.bytes = 0
+        self.start = time.perf_counter()
+        self.elapsed = 0.0
+
+    def add(self, path, error):
+        self.files += 1
+        if os.path.isfile(path): self.bytes += os.path.getsize(path)
+        if error: self.errors += 1
+        self.elapsed = time.perf_counter() - self.start
+
+    def __repr__(self):
+        elapsed = self.elapsed or float('inf')
+        return (f'{self.files} files ({self.errors} with errors) in {self.elapsed:.3f}s, '
+            f'{self.files / elapsed:.1f} files/sec, {self.bytes / elapsed / 1024:.1f} KiB/sec')
@@ -0,0 +1,165 @@
+from error import RTError
+from lexer import NumberNode, NumberAccessNode, NumberAssignNode, BinOpNode, UnaryOpNode, HeadNode, shared_nodes, OPERATOR_NODES
+from tokens import TT_PLUS, TT_MINUS, TT_MUL, TT_DIV, TT_EQUAL_EQUAL, TT_NE, TT_LT, TT_GT, TT_LTE, TT_GTE
+from vm import Context, name_of
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+#######################################
+# BATCH EVALUATION
+#######################################
+# Evaluates one program over many rows of bindings at once: every name
+# read before it is assigned takes its values from a column, and each node
+# is evaluated for all rows with one NumPy operation.
+#
+# Types follow the scalar path: int columns and literals stay int64, a
+# float on either side gives float64, '/' always gives float64 and a
+# comparison gives 1 or 0. Unlike Python ints, int64 wraps on overflow.
+#
+# A row that divides by zero does not stop the batch. The row is marked
+# failed at the first node that failed for it, as the VM would stop there,
+# and its values are meaningless from then on.
+
+OPERATORS = {
+    TT_PLUS: 'add',
+    TT_MINUS: 'subtract',
+    TT_MUL: 'multiply',
+    TT_EQUAL_EQUAL: 'equal',
+    TT_NE: 'not_equal',
+    TT_LT: 'less',
+    TT_GT: 'greater',
+    TT_LTE: 'less_equal',
+    TT_GTE: 'greater_equal',
+}
+COMPARISON_TYPES = (TT_EQUAL_EQUAL, TT_NE, TT_LT, TT_GT, TT_LTE, TT_GTE)
+
+NOT_FAILED = -1
+
+class BatchResult:
+    def __init__(self, values, failed_at, nodes, details, display_name):
+        # One array per section, like the list vm.VM.run returns.
+        self.values = values
+        # Per row, the index in nodes of the node the row failed at.
+        self.failed_at = failed_at
+        self.nodes = nodes
+        self.details = details
+        self.display_name = display_name
+
+    @property
+    def mask(self):
+        # True for every row that failed.
+        return self.failed_at != NOT_FAILED
+
+    def error(self, row):
+        # The RTError the scalar path gives for row, or None.
+        index = self.failed_at[row]
+        if index == NOT_FAILED: return None
+        node = self.nodes[index]
+        return RTError(node.pos_start, node.pos_end, self.details[index], Context(self.display_name))
+
+    def errors(self):
+        for row in np.flatnonzero(self.mask):
+            yield int(row), self.error(row)
+
+def column(values):
+    # Anything that is not already float becomes int64, so bools and small
+    # int types follow int arithmetic.
+    array = np.asarray(values)
+    if array.dtype.kind == 'f': return array.astype(np.float64, copy=False)
+    return array.astype(np.int64, copy=False)
+
+def evaluate(node, columns, rows=None, display_name='<program>'):
+    # columns maps names to equal length sequences of values; rows is only
+    # needed when there are none.
+    if np is None: raise ImportError('batch evaluation needs numpy')
+    columns = {name: column(values) for name, values in columns.items()}
+    if rows is None:
+        lengths = {len(values) for values in columns.values()}
+        if len(lengths) > 1: raise ValueError('columns differ in length')
+        rows = lengths.pop() if lengths else 1
+    elif any(len(values) != rows for values in columns.values()):
+        raise ValueError(f'columns must have {rows} rows')
+
+    failed_at = np.full(rows, NOT_FAILED, dtype=np.int64)
+    nodes = []
+    details = []
+    def fail(node, failed, message):
+        # Marks the rows in failed that have not already failed.
+        failed = failed & (failed_at == NOT_FAILED)
+        if failed.any():
+            failed_at[failed] = len(nodes)
+            nodes.append(node)
+            details.append(message)
+
+    environment = dict(columns)
+    shared = shared_nodes(node, OPERATOR_NODES)
+    shared_values = {}
+    values = []
+    # Post-order walk with an explicit stack, like vm.Compiler.
+    work = [(node, False)]
+    while work:
+        node, done = work.pop()
+        if node is None: continue
+        if not done and id(node) in shared_values:
+            values.append(shared_values[id(node)])
+            continue
+        node_type = node.__class__
+
+        if node_type is NumberNode:
+            values.append(node.tok.value)
+            continue
+
+        if node_type is NumberAccessNode:
+            name = name_of(node.Number_name_tok)
+            value = environment.get(name)
+            if value is None:
+                fail(node, np.ones(rows, dtype=bool), f"'{name}' is not defined")
+                value = 0
+            values.append(value)
+            continue
+
+        if node_type is HeadNode:
+            # Each section leaves its value on the stack.
+            work.append((node.right_node, False))
+            work.append((node.left_node, False))
+            continue
+
+        if not done:
+            work.append((node, True))
+            if node_type is BinOpNode:
+                work.append((node.right_node, False))
+                work.append((node.left_node, False))
+            elif node_type is UnaryOpNode:
+                work.append((node.node, False))
+            elif node_type is NumberAssignNode:
+                work.append((node.value_node, False))
+            else:
+                raise TypeError(f'cannot evaluate {node_type.__name__}')
+            continue
+
+        if node_type is BinOpNode:
+            right = values.pop()
+            left = values.pop()
+            op_type = node.op_tok.type
+            if op_type == TT_DIV:
+                zero = np.equal(right, 0)
+                fail(node, np.broadcast_to(zero, (rows,)), 'Division by zero')
+                value = np.true_divide(left, np.where(zero, 1, right))
+            else:
+                value = getattr(np, OPERATORS[op_type])(left, right)
+                if op_type in COMPARISON_TYPES: value = value.astype(np.int64)
+        elif node_type is UnaryOpNode:
+            value = values.pop()
+            if node.op_tok.type == TT_MINUS: value = np.negative(value)
+        else:
+            value = values.pop()
+            environment[name_of(node.Number_name_tok)] = np.broadcast_to(value, (rows,))
+
+        if id(node) in shared: shared_values[id(node)] = value
+        values.append(value)
+
+    sections = [np.broadcast_to(value, (rows,)) for value in values]
+    return BatchResult(sections, failed_at, nodes, details, display_name)
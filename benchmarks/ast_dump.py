@@ -0,0 +1,65 @@
+#######################################
+# AST DUMP BENCHMARK
+#######################################
+# Dumps the AST of one deep chain in each ast_serializer format and loads
+# it back, reporting time and the peak memory each side takes beyond the
+# tree, measured with tracemalloc in a second run, as tracing slows every
+# allocation. The reloaded tree must dump to the same text.
+#
+#   python -m benchmarks.ast_dump [terms]
+
+import filecmp
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import ast_serializer
+import lexer
+from benchmarks.vm_eval import chain_program
+
+def measured(fn, *args):
+    # The result of fn, its time and, from a second run, the peak memory it
+    # took.
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    try:
+        fn(*args)
+        return result, elapsed, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def dump(node, path, format):
+    with open(path, 'w') as file:
+        ast_serializer.dump(node, file, format)
+
+def load(path, format):
+    with open(path) as file:
+        return ast_serializer.load(file, format)
+
+def main(argv):
+    terms = int(argv[0]) if argv else 200000
+    text = chain_program(terms)
+    node, error, symbol_table = lexer.run('<bench>', text, 'buffer')
+    if error: raise SystemExit(error.as_string())
+    print(f'{lexer.count_nodes(node)} nodes, {terms} deep')
+
+    with tempfile.TemporaryDirectory() as directory:
+        for format in (ast_serializer.SEXPR, ast_serializer.JSONL):
+            path = os.path.join(directory, f'ast.{format}')
+            copy = os.path.join(directory, f'copy.{format}')
+            _, dump_time, dump_peak = measured(dump, node, path, format)
+            loaded, load_time, load_peak = measured(load, path, format)
+            dump(loaded, copy, format)
+            if not filecmp.cmp(path, copy, shallow=False):
+                raise SystemExit(f'{format}: reloaded tree dumps differently')
+            del loaded
+            print(f'{format:>6}: {os.path.getsize(path) / 2**20:7.1f} MiB, '
+                f'dump {dump_time:.3f}s peak {dump_peak / 2**20:6.1f} MiB, '
+                f'load {load_time:.3f}s peak {load_peak / 2**20:6.1f} MiB (with the tree)')
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
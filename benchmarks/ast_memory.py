@@ -0,0 +1,49 @@
+#######################################
+# AST MEMORY BENCHMARK
+#######################################
+# Compares the memory held by a parsed AST of node objects with the same
+# AST in a NodeArena, measured with tracemalloc.
+#
+#   python -m benchmarks.ast_memory [terms]
+
+import gc
+import sys
+import tracemalloc
+
+import lexer
+import node_arena
+from benchmarks.vm_eval import chain_program
+
+def traced(fn, *args):
+    # The result of fn and the memory it still holds.
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = fn(*args)
+        gc.collect()
+        return result, tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+def parse(text, engine):
+    node, error, symbol_table = lexer.run('<bench>', text, engine)
+    if error: raise SystemExit(error.as_string())
+    return node
+
+def main(argv):
+    terms = int(argv[0]) if argv else 500000
+    text = chain_program(terms)
+
+    print(f'{len(text)} chars')
+    for engine in ('regex', 'buffer'):
+        node, tree_bytes = traced(parse, text, engine)
+        count = lexer.count_nodes(node)
+        arena, arena_bytes = traced(node_arena.from_tree, node)
+        del node
+        print(f'{engine:>7}: {count} nodes, tree {tree_bytes / 2**20:8.1f} MiB ({tree_bytes / count:5.1f} B/node), '
+            f'arena {arena_bytes / 2**20:8.1f} MiB ({arena_bytes / count:5.1f} B/node), '
+            f'{tree_bytes / arena_bytes:.1f}x less')
+        del arena
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,58 @@
+#######################################
+# BATCH EVALUATION BENCHMARK
+#######################################
+# Compares evaluating one program over many rows of bindings with
+# batch_eval against running the compiled VM program once per row. Needs
+# numpy.
+#
+#   python -m benchmarks.batch_eval [rows] [repeat]
+
+import random
+import sys
+
+import batch_eval
+import lexer
+import vm
+from benchmarks.vm_eval import best_of
+
+PROGRAM = 'HEAD\nscale = (price * qty - discount) / qty\nBODY\nscale * 2 + (price > 10) - discount / (qty + 1)\n'
+COLUMNS = ('price', 'qty', 'discount')
+
+def make_columns(rows):
+    rng = random.Random(0)
+    return {
+        'price': [rng.uniform(1, 20) for _ in range(rows)],
+        'qty': [rng.randrange(0, 50) for _ in range(rows)],
+        'discount': [rng.randrange(0, 5) for _ in range(rows)],
+    }
+
+def run_rows(chunk, columns, rows):
+    slots = [chunk.name_index.get(name) for name in COLUMNS]
+    failed = 0
+    for row in range(rows):
+        machine = vm.VM(chunk)
+        for name, slot in zip(COLUMNS, slots):
+            if slot is not None: machine.slots[slot] = columns[name][row]
+        values, error = machine.run()
+        if error: failed += 1
+    return failed
+
+def main(argv):
+    if batch_eval.np is None: raise SystemExit('numpy is not installed')
+    rows = int(argv[0]) if argv else 100000
+    repeat = int(argv[1]) if len(argv) > 1 else 3
+    node, error, symbol_table = lexer.run('<bench>', PROGRAM)
+    if error: raise SystemExit(error.as_string())
+    columns = make_columns(rows)
+    arrays = {name: batch_eval.column(values) for name, values in columns.items()}
+
+    chunk = vm.compile_node(node)
+    failed, row_time = best_of(repeat, run_rows, chunk, columns, rows)
+    result, batch_time = best_of(repeat, batch_eval.evaluate, node, arrays)
+    assert failed == result.mask.sum()
+    print(f'{rows} rows, {failed} failed')
+    print(f'  vm per row: {row_time * 1000:9.2f}ms')
+    print(f'       batch: {batch_time * 1000:9.2f}ms  {row_time / batch_time:7.1f}x vm per row')
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
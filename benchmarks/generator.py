@@ -0,0 +1,148 @@
+#######################################
+# PROGRAM GENERATOR
+#######################################
+# Generates programs from the constructs the lexer and parser accept, by
+# expanding the productions below at random. Size is set in bytes; shape
+# by the weights and depth in a Shape.
+#
+#   python -m benchmarks.generator [bytes] [seed] > program.txt
+
+import random
+import sys
+
+from keywords import KEYWORDS
+
+# Each nonterminal has (weight name, symbols) alternatives; the first
+# alternative is the one used once an expression is max_depth deep, so
+# it must not recurse. Symbols in PRODUCTIONS expand, anything else is a
+# terminal written by Generator.terminals or literally.
+PRODUCTIONS = {
+    'statement': [
+        ('assignment', ['assignment']),
+        ('expression', ['expr']),
+        ('comment', ['COMMENT']),
+        ('declaration', ['DATATYPE', 'IDENTIFIER']),
+        ('display', ['DISPLAY', 'STRING']),
+        ('keyword', ['KEYWORD']),
+    ],
+    'assignment': [
+        ('assignment', ['IDENTIFIER', '=', 'expr']),
+    ],
+    'expr': [
+        ('leaf', ['term']),
+        ('additive', ['expr', 'ADD_OP', 'term']),
+        ('comparison', ['expr', 'COMPARE_OP', 'term']),
+    ],
+    'term': [
+        ('leaf', ['factor']),
+        ('multiplicative', ['term', 'MUL_OP', 'factor']),
+    ],
+    'factor': [
+        ('leaf', ['NUMBER']),
+        ('name', ['IDENTIFIER']),
+        ('unary', ['ADD_OP', 'factor']),
+        ('paren', ['(', 'expr', ')']),
+    ],
+}
+
+# Keywords that are statements of their own rather than section markers.
+STATEMENT_KEYWORDS = [keyword for keyword in KEYWORDS if keyword not in ('HEAD', 'BODY', '.', '!')]
+
+class Shape:
+    def __init__(self, max_depth=6, sections=2, identifiers=200, weights=None):
+        self.max_depth = max_depth
+        # HEAD plus sections - 1 BODY sections.
+        self.sections = sections
+        self.identifiers = identifiers
+        # Relative weight of each alternative by name; unnamed ones get 1.
+        self.weights = {
+            'assignment': 6, 'expression': 1, 'comment': 1, 'declaration': 1, 'display': 1, 'keyword': 1,
+            'leaf': 4, 'additive': 2, 'comparison': 1, 'multiplicative': 2, 'unary': 1, 'paren': 1,
+        }
+        if weights: self.weights.update(weights)
+
+SHAPES = {
+    'mixed': Shape(),
+    'flat': Shape(max_depth=2, weights={'comment': 2, 'display': 2}),
+    'deep': Shape(max_depth=24, weights={'leaf': 1, 'paren': 3, 'unary': 2}),
+    'assignments': Shape(weights={'assignment': 20}),
+}
+
+class Generator:
+    def __init__(self, shape=None, seed=0):
+        self.shape = shape or SHAPES['mixed']
+        self.random = random.Random(seed)
+        self.names = [f'{"abcdefghij"[i % 10]}{i}' for i in range(self.shape.identifiers)]
+        self.terminals = {
+            'IDENTIFIER': lambda: self.random.choice(self.names),
+            'NUMBER': self.number,
+            'STRING': lambda: '"text %d\\n"' % self.random.randrange(1000),
+            'COMMENT': lambda: '! note %d !' % self.random.randrange(1000),
+            'DATATYPE': lambda: self.random.choice(('Number', 'String')),
+            'KEYWORD': lambda: self.random.choice(STATEMENT_KEYWORDS),
+            'ADD_OP': lambda: self.random.choice('+-'),
+            'MUL_OP': lambda: self.random.choice('*/'),
+            'COMPARE_OP': lambda: self.random.choice(('==', '<', '>', '<=', '>=')),
+        }
+        self.alternatives = {symbol: ([alternative for _, alternative in choices],
+            [self.shape.weights.get(name, 1) for name, _ in choices]) for symbol, choices in PRODUCTIONS.items()}
+
+    def number(self):
+        if self.random.random() < 0.3: return '%d.%d' % (self.random.randrange(100), self.random.randrange(100))
+        return str(self.random.randrange(1000))
+
+    def expand(self, symbol):
+        # Expands with an explicit stack; depth counts the nonterminals
+        # open above a symbol.
+        parts = []
+        work = [(symbol, 0)]
+        while work:
+            symbol, depth = work.pop()
+            choices = self.alternatives.get(symbol)
+            if choices is None:
+                terminal = self.terminals.get(symbol)
+                parts.append(terminal() if terminal else symbol)
+                continue
+            alternatives, weights = choices
+            if depth >= self.shape.max_depth and symbol in ('expr', 'term', 'factor'):
+                alternative = alternatives[0]
+            else:
+                alternative = self.random.choices(alternatives, weights)[0]
+            for child in reversed(alternative):
+                work.append((child, depth + 1))
+        return ' '.join(parts)
+
+    def program(self, size):
+        # About size bytes. Past POOL_BYTES, statements are drawn from a pool
+        # rather than generated, so a 100 MB program takes seconds.
+        lines = []
+        sections = max(1, self.shape.sections)
+        per_section = max(1, size // sections)
+        pool = []
+        pool_bytes = 0
+        for section in range(sections):
+            # The parser keeps the first statement of each section, so that
+            # one is always an assignment.
+            lines.append('HEAD\n' if section == 0 else 'BODY\n')
+            lines.append(self.expand('assignment') + '\n')
+            written = len(lines[-1])
+            while written < per_section:
+                if pool_bytes < POOL_BYTES:
+                    line = self.expand('statement') + '\n'
+                    pool.append(line)
+                    pool_bytes += len(line)
+                else:
+                    line = self.random.choice(pool)
+                lines.append(line)
+                written += len(line)
+        return ''.join(lines)
+
+POOL_BYTES = 1 << 20
+
+def generate(size, shape='mixed', seed=0):
+    return Generator(SHAPES[shape], seed).program(size)
+
+if __name__ == '__main__':
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 1024
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    sys.stdout.write(generate(size, seed=seed))
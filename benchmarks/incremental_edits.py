@@ -0,0 +1,56 @@
+#######################################
+# INCREMENTAL EDIT BENCHMARK
+#######################################
+# Types a statement one character at a time into the BODY section of
+# generated programs of each size, then deletes it again, timing every edit of an
+# IncrementalCompilation with the garbage collector off, as best_of does in
+# vm_eval. The first edit moves the gaps from the end of the text to the
+# edit, so it is shown apart; the rest stay in one place and should cost
+# the same whatever the size of the program.
+#
+#   python -m benchmarks.incremental_edits [bytes,...] [repeat]
+
+import gc
+import sys
+import time
+
+from benchmarks.generator import generate
+from incremental import IncrementalCompilation
+
+STATEMENT = 'k = k1 + 2 * 3\n'
+
+def main(argv):
+    sizes = [int(size) for size in argv[0].split(',')] if argv else [20 * 1024, 2 * 2**20, 20 * 2**20]
+    repeat = int(argv[1]) if len(argv) > 1 else 5
+
+    for size in sizes:
+        text = generate(size)
+        compilation = IncrementalCompilation('<bench>', text)
+        # The generator puts BODY in the middle; an edit to it re-parses all.
+        offset = text.index('\n', len(text) * 3 // 4) + 1
+        times = []
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            compilation.edit(offset, 0, ' ')
+            compilation.edit(offset, 1, '')
+            first = time.perf_counter() - start
+            for _ in range(repeat):
+                for i, char in enumerate(STATEMENT):
+                    start = time.perf_counter()
+                    compilation.edit(offset + i, 0, char)
+                    times.append(time.perf_counter() - start)
+                for i in reversed(range(len(STATEMENT))):
+                    start = time.perf_counter()
+                    compilation.edit(offset + i, 1, '')
+                    times.append(time.perf_counter() - start)
+        finally:
+            gc.enable()
+        if compilation.text != text: raise SystemExit(f'{size} bytes: text differs after the edits')
+        times.sort()
+        print(f'{len(text):>10} chars: first edit {first * 1e3:7.2f}ms, then {len(times)} edits, median {times[len(times) // 2] * 1e6:8.1f}us, '
+            f'max {times[-1] * 1e6:8.1f}us')
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,76 @@
+#######################################
+# LEXER ENGINE BENCHMARK
+#######################################
+# Compares the classic character-at-a-time lexer with the table driven
+# regex engine and the TokenBuffer store on a generated program.
+#
+#   python -m benchmarks.lexer_engines [statements] [repeat]
+
+import gc
+import sys
+import time
+
+import lexer
+
+STATEMENT = 'value_{0} = ({0} + 2.5) * count_{1} - 7 / 3 ! comment {0} !\n'
+
+def generate_program(statements):
+    lines = ['HEAD\n']
+    for i in range(statements):
+        lines.append(STATEMENT.format(i, i % 97))
+    lines.append('BODY\n')
+    lines.append('DISPLAY "done\\n"\n')
+    return ''.join(lines)
+
+def token_key(tok):
+    return (tok.type, tok.value,
+        tok.pos_start.idx, tok.pos_start.ln, tok.pos_start.col,
+        tok.pos_end.idx, tok.pos_end.ln, tok.pos_end.col)
+
+def lex(text, engine):
+    source_lexer = lexer.Lexer('<bench>', text)
+    if engine == 'regex':
+        return source_lexer.scan_tokens()
+    if engine == 'buffer':
+        return source_lexer.make_token_buffer()
+    return source_lexer.make_tokens()
+
+def time_engine(text, engine, repeat):
+    # Like timeit, keep the cyclic collector out of the measurement.
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            tokens, error = lex(text, engine)
+            elapsed = time.perf_counter() - start
+        finally:
+            gc.enable()
+        if error: raise SystemExit(error.as_string())
+        if best is None or elapsed < best:
+            best = elapsed
+    return [token_key(tok) for tok in tokens], best
+
+def main(argv):
+    statements = int(argv[0]) if len(argv) > 0 else 20000
+    repeat = int(argv[1]) if len(argv) > 1 else 3
+    text = generate_program(statements)
+
+    results = {}
+    for engine in lexer.ENGINES:
+        results[engine] = time_engine(text, engine, repeat)
+
+    classic_tokens = results['classic'][0]
+    for engine in lexer.ENGINES:
+        if results[engine][0] != classic_tokens:
+            raise SystemExit(f'{engine} engine disagrees with classic on the generated program')
+
+    print(f'{len(text)} chars, {len(classic_tokens)} tokens, best of {repeat}')
+    for engine in lexer.ENGINES:
+        elapsed = results[engine][1]
+        print(f'{engine:>8}: {elapsed:8.3f}s  {len(classic_tokens) / elapsed:12.0f} tokens/sec'
+            f'  {results["classic"][1] / elapsed:5.2f}x classic')
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,49 @@
+#######################################
+# LINE PROFILE BENCHMARK
+#######################################
+# Compares compiling and running a chain on the VM with doing so under
+# profiler, for the chain broken over lines after every few terms. The
+# profiler looks up the line of every node as it compiles and enters the
+# VM once per line, so shorter lines cost it more.
+#
+#   python -m benchmarks.line_profile [terms] [terms per line,...] [repeat]
+
+import sys
+
+import lexer
+import profiler
+import vm
+from benchmarks.vm_eval import best_of
+
+def lined_program(terms, per_line):
+    ops = ('+', '*', '-', '/')
+    parts = ['1']
+    for i in range(1, terms):
+        parts.append(('\n' if i % per_line == 0 else ' ') + f'{ops[i % 4]} {i % 9 + 1}')
+    return 'HEAD\nresult = ' + ''.join(parts) + '\n'
+
+def run_vm(node, symbol_table):
+    values, error = vm.execute(node, '<bench>', symbol_table)
+    if error: raise SystemExit(error.as_string())
+    return values
+
+def run_profiled(node, symbol_table):
+    values, error, profile = profiler.profile(node, '<bench>', symbol_table)
+    if error: raise SystemExit(error.as_string())
+    return values
+
+def main(argv):
+    terms = int(argv[0]) if argv else 200000
+    widths = [int(width) for width in argv[1].split(',')] if len(argv) > 1 else [1, 10, 100]
+    repeat = int(argv[2]) if len(argv) > 2 else 3
+
+    for per_line in widths:
+        node, error, symbol_table = lexer.run('<bench>', lined_program(terms, per_line), 'buffer')
+        if error: raise SystemExit(error.as_string())
+        expected, plain = best_of(repeat, run_vm, node, symbol_table)
+        values, profiled = best_of(repeat, run_profiled, node, symbol_table)
+        if values != expected: raise SystemExit(f'{per_line} per line: profiled values differ')
+        print(f'{per_line:>4} terms per line: vm {plain:.3f}s, profiled {profiled:.3f}s, {profiled / plain:5.2f}x')
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,65 @@
+#######################################
+# MAPPED LEXING BENCHMARK
+#######################################
+# Compares lexing a file read into a str with the buffer engine against
+# lexing it in place through a memory map. Peak memory is measured with
+# tracemalloc, which does not count the mapped pages: they belong to the
+# page cache and are shared with every other reader of the file.
+#
+#   python -m benchmarks.mapped_lexing [bytes]
+
+import gc
+import mmap
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import lexer
+from benchmarks.generator import generate
+
+def lex_read(path):
+    with open(path) as file:
+        text = file.read()
+    return lexer.Lexer(path, text).make_token_buffer()
+
+def lex_mapped(path):
+    with open(path, 'rb') as file:
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    return lexer.Lexer(path, '').make_mapped_buffer(data)
+
+def measure(fn, path):
+    # Timed without tracing, which slows allocation down several times.
+    gc.collect()
+    start = time.perf_counter()
+    tokens, error = fn(path)
+    elapsed = time.perf_counter() - start
+    if error: raise SystemExit(error.as_string())
+    count = len(tokens)
+    del tokens
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn(path)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return count, elapsed, peak
+
+def main(argv):
+    size = int(argv[0]) if argv else 50 * 2**20
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as file:
+        file.write(generate(size))
+        path = file.name
+    try:
+        print(f'{os.path.getsize(path)} bytes')
+        for name, fn in (('read', lex_read), ('mapped', lex_mapped)):
+            count, elapsed, peak = measure(fn, path)
+            print(f'{name:>7}: {count} tokens in {elapsed:.3f}s, {count / elapsed:10.0f} tokens/sec, {peak / 2**20:8.1f} MiB peak')
+    finally:
+        os.unlink(path)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,50 @@
+#######################################
+# PARALLEL LEXING BENCHMARK
+#######################################
+# Compares the buffer engine against parallel_lexer on one generated text,
+# for each worker count given, and checks that every run gives the same
+# tokens and symbol table as the sequential lexer.
+#
+#   python -m benchmarks.parallel_lexing [bytes] [workers,...]
+
+import os
+import sys
+import time
+
+import lexer
+import parallel_lexer
+from benchmarks.generator import generate
+
+def rows(tokens):
+    return (tokens.types, tokens.starts, tokens.ends, [tokens.value_at(index) for index in range(len(tokens))])
+
+def symbols(symbol_table):
+    return [(name, entry['location'], repr(entry['dataType'])) for name, entry in symbol_table.items()]
+
+def main(argv):
+    size = int(argv[0]) if argv else 50 * 2**20
+    counts = [int(count) for count in argv[1].split(',')] if len(argv) > 1 else [2, 4, os.cpu_count() or 1]
+    text = generate(size)
+    print(f'{len(text)} characters, {os.cpu_count()} CPUs')
+
+    sequential = lexer.Lexer('<bench>', text)
+    start = time.perf_counter()
+    tokens, error = sequential.make_token_buffer()
+    baseline = time.perf_counter() - start
+    if error: raise SystemExit(error.as_string())
+    print(f'{"buffer":>10}: {len(tokens)} tokens in {baseline:.3f}s')
+    expected = rows(tokens), symbols(sequential.symbol_table)
+    del tokens
+
+    for count in counts:
+        parallel = lexer.Lexer('<bench>', text)
+        start = time.perf_counter()
+        tokens, error = parallel_lexer.make_parallel_buffer(parallel, count)
+        elapsed = time.perf_counter() - start
+        if (rows(tokens), symbols(parallel.symbol_table)) != expected:
+            raise SystemExit(f'{count} workers: output differs from the sequential lexer')
+        print(f'{count:>2} workers: {len(tokens)} tokens in {elapsed:.3f}s, {baseline / elapsed:5.2f}x')
+        del tokens
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,158 @@
+#######################################
+# BENCHMARK SUITE
+#######################################
+# Lexes and parses generated programs from 1 KB up to 100 MB and records
+# lexer tokens/sec, parser nodes/sec and peak traced memory as JSON. Given
+# a baseline from an earlier run, results that got worse by more than the
+# threshold are flagged and the exit status is 1.
+#
+#   python -m benchmarks.suite [--sizes 1K,1M] [--output results.json]
+#                              [--baseline old.json] [--threshold 0.1]
+
+import argparse
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import lexer
+from benchmarks.generator import generate, SHAPES
+from tokens import TT_EOF
+
+SIZES = ('1K', '10K', '100K', '1M', '10M', '100M')
+UNITS = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+
+# Measurements where a larger value is better; the rest should not grow.
+HIGHER_IS_BETTER = ('tokens_per_sec', 'nodes_per_sec')
+LOWER_IS_BETTER = ('peak_bytes',)
+
+def parse_size(size):
+    if size[-1:].upper() in UNITS: return int(float(size[:-1]) * UNITS[size[-1:].upper()])
+    return int(size)
+
+def lex(text, engine):
+    source_lexer = lexer.Lexer('<bench>', text)
+    if engine == 'buffer': return source_lexer.make_token_buffer()
+    if engine == 'regex': return source_lexer.scan_tokens()
+    return source_lexer.make_tokens()
+
+def parse_all(tokens, parser_class=lexer.Parser):
+    # The parser keeps only the first statement of a section, which would
+    # leave almost nothing to measure, so every statement is parsed here.
+    # Statements the expression parser rejects (DISPLAY, declarations,
+    # keywords) are stepped over one token at a time.
+    parser = parser_class(tokens)
+    nodes = statements = 0
+    while parser.current_tok.type != TT_EOF:
+        res = parser.expr()
+        if res.error:
+            parser.advance()
+            continue
+        statements += 1
+        nodes += lexer.count_nodes(res.node)
+    return statements, nodes
+
+def timed(fn, *args):
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        result = fn(*args)
+        return result, time.perf_counter() - start
+    finally:
+        gc.enable()
+
+def measure(text, engine, repeat):
+    lex_time = parse_time = None
+    for _ in range(repeat):
+        (tokens, error), elapsed = timed(lex, text, engine)
+        if error: raise SystemExit(error.as_string())
+        lex_time = elapsed if lex_time is None else min(lex_time, elapsed)
+        (statements, nodes), elapsed = timed(parse_all, tokens)
+        parse_time = elapsed if parse_time is None else min(parse_time, elapsed)
+    token_count = len(tokens)
+    del tokens
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        tokens, error = lex(text, engine)
+        parse_all(tokens)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    del tokens
+
+    return {
+        'tokens': token_count,
+        'lex_seconds': lex_time,
+        'tokens_per_sec': token_count / lex_time,
+        'statements': statements,
+        'nodes': nodes,
+        'parse_seconds': parse_time,
+        'nodes_per_sec': nodes / parse_time if parse_time else 0.0,
+        'peak_bytes': peak,
+    }
+
+def compare(results, baseline, threshold):
+    # Returns (key, measurement, old, new) for each result worse than the
+    # baseline's by more than threshold.
+    old_results = {result['key']: result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        old = old_results.get(result['key'])
+        if old is None: continue
+        for name in HIGHER_IS_BETTER:
+            if result[name] < old[name] * (1 - threshold):
+                regressions.append((result['key'], name, old[name], result[name]))
+        for name in LOWER_IS_BETTER:
+            if result[name] > old[name] * (1 + threshold):
+                regressions.append((result['key'], name, old[name], result[name]))
+    return regressions
+
+def main(argv):
+    arg_parser = argparse.ArgumentParser(description='Benchmark the lexer and parser on generated programs.')
+    arg_parser.add_argument('--sizes', default=','.join(SIZES), help='comma separated program sizes, e.g. 1K,10M')
+    arg_parser.add_argument('--shapes', default='mixed', help=f'comma separated shapes from {", ".join(SHAPES)}')
+    arg_parser.add_argument('--engine', choices=lexer.ENGINES, default='buffer')
+    arg_parser.add_argument('--repeat', type=int, default=3, help='timed runs per size; the best is kept')
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('--output', help='write results to this JSON file')
+    arg_parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    arg_parser.add_argument('--threshold', type=float, default=0.1, help='relative change counted as a regression')
+    args = arg_parser.parse_args(argv)
+
+    results = []
+    for shape in args.shapes.split(','):
+        for size in args.sizes.split(','):
+            text = generate(parse_size(size), shape, args.seed)
+            result = {'key': f'{shape}/{size}/{args.engine}', 'shape': shape, 'size': size,
+                'bytes': len(text), 'engine': args.engine}
+            result.update(measure(text, args.engine, args.repeat))
+            del text
+            results.append(result)
+            print(f'{result["key"]:>24}: {result["tokens_per_sec"]:12.0f} tokens/sec'
+                f'  {result["nodes_per_sec"]:12.0f} nodes/sec  {result["peak_bytes"] / 2**20:9.1f} MiB peak')
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        for key, name, old, new in regressions:
+            print(f'REGRESSION {key} {name}: {old:.4g} -> {new:.4g} ({(new - old) / old:+.1%})')
+        if regressions: return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
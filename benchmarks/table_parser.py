@@ -0,0 +1,43 @@
+#######################################
+# TABLE PARSER BENCHMARK
+#######################################
+# Compares Parser.expr with the LL(1) table parser generated from
+# grammar.txt, parsing every statement of generated programs of growing
+# size, and checks that both build the same trees. Time per token should
+# stay flat as the size grows.
+#
+#   python -m benchmarks.table_parser [bytes,...] [shape]
+
+import sys
+
+import lexer
+import ll1_parser
+from benchmarks.generator import generate
+from benchmarks.suite import parse_all, timed
+
+def trees(tokens, parser_class):
+    parser = parser_class(tokens)
+    found = []
+    while parser.current_tok.type != 'EOF':
+        res = parser.expr()
+        if res.error: parser.advance()
+        else: found.append(repr(res.node))
+    return found
+
+def main(argv):
+    sizes = [int(size) for size in argv[0].split(',')] if argv else [100_000, 1_000_000, 4_000_000]
+    shape = argv[1] if len(argv) > 1 else 'mixed'
+    _, build_time = timed(ll1_parser.build_table, open(ll1_parser.GRAMMAR_PATH).read())
+    print(f'table built in {build_time * 1000:.2f}ms')
+    for size in sizes:
+        tokens, error = lexer.Lexer('<bench>', generate(size, shape)).make_token_buffer()
+        if error: raise SystemExit(error.as_string())
+        if size == sizes[0] and trees(tokens, lexer.Parser) != trees(tokens, ll1_parser.TableParser):
+            raise SystemExit('the table parser built different trees')
+        for parser_class in (lexer.Parser, ll1_parser.TableParser):
+            (statements, nodes), elapsed = timed(parse_all, tokens, parser_class)
+            print(f'{size:>9} {parser_class.__name__:>11}: {statements} statements, {nodes} nodes in {elapsed:.3f}s, '
+                f'{elapsed / len(tokens) * 1e9:6.0f} ns/token')
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,47 @@
+#######################################
+# TOKEN MEMORY BENCHMARK
+#######################################
+# Compares the memory held by a list of Token objects with a TokenBuffer
+# holding the same tokens, measured with tracemalloc.
+#
+#   python -m benchmarks.token_memory [tokens]
+
+import gc
+import sys
+import tracemalloc
+
+import lexer
+from benchmarks.lexer_engines import generate_program
+
+# Tokens per statement in benchmarks.lexer_engines.STATEMENT.
+TOKENS_PER_STATEMENT = 13
+
+def measure(text, engine):
+    source_lexer = lexer.Lexer('<bench>', text)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        if engine == 'buffer':
+            tokens, error = source_lexer.make_token_buffer()
+        else:
+            tokens, error = source_lexer.scan_tokens()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    if error: raise SystemExit(error.as_string())
+    return len(tokens), current, peak
+
+def main(argv):
+    target = int(argv[0]) if argv else 1000000
+    text = generate_program(target // TOKENS_PER_STATEMENT)
+
+    print(f'{len(text)} chars')
+    results = {}
+    for engine in ('regex', 'buffer'):
+        count, current, peak = results[engine] = measure(text, engine)
+        print(f'{engine:>7}: {count} tokens, {current / 2**20:8.1f} MiB held '
+            f'({current / count:6.1f} B/token), {peak / 2**20:8.1f} MiB peak')
+    print(f'{"":>7}  {results["regex"][1] / results["buffer"][1]:.1f}x less memory held by the buffer')
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
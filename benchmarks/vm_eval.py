@@ -0,0 +1,134 @@
+#######################################
+# VM BENCHMARK
+#######################################
+# Compares executing deep expressions with the bytecode VM and with
+# generated Python code against a plain recursive tree walk over the same
+# AST. Compilation is timed separately, since a compiled program is meant
+# to be run many times.
+#
+#   python -m benchmarks.vm_eval [terms] [repeat]
+
+import gc
+import io
+import sys
+import time
+
+import lexer
+import pycodegen
+import type_inference
+import vm
+from tokens import TT_PLUS, TT_MINUS, TT_MUL, TT_DIV
+
+# Paren nesting costs several parser frames per level, so it stays shallow.
+NESTING = 120
+
+def chain_program(terms):
+    # One long left-deep chain of binary operators.
+    ops = ('+', '*', '-', '/')
+    parts = ['1']
+    for i in range(1, terms):
+        parts.append(f' {ops[i % 4]} {i % 9 + 1}')
+    return 'HEAD\nresult = ' + ''.join(parts) + '\n'
+
+def nested_program(terms):
+    # Right-nested parentheses repeated along a chain.
+    group = '(' * NESTING + '1' + ''.join(f' + {i % 7 + 1})' for i in range(NESTING))
+    groups = max(1, terms // NESTING)
+    return 'HEAD\nresult = ' + ' - '.join([group] * groups) + '\n'
+
+def float_program(terms):
+    # A chain reading a float variable, with int constants beside it.
+    ops = ('+', '*', '-', '/')
+    parts = ['(x = 1.5)']
+    for i in range(1, terms):
+        parts.append(f' {ops[i % 4]} {i % 9 + 1} + x')
+    return 'HEAD\nresult = ' + ''.join(parts) + '\n'
+
+WORKLOADS = (
+    ('chain', chain_program),
+    ('nested', nested_program),
+    ('floats', float_program),
+)
+
+def tree_walk(node, env):
+    node_type = node.__class__
+    if node_type is lexer.NumberNode:
+        return node.tok.value
+    if node_type is lexer.NumberAccessNode:
+        return env[lexer.name_of(node.Number_name_tok)]
+    if node_type is lexer.BinOpNode:
+        left = tree_walk(node.left_node, env)
+        right = tree_walk(node.right_node, env)
+        op = node.op_tok.type
+        if op == TT_PLUS: return left + right
+        if op == TT_MINUS: return left - right
+        if op == TT_MUL: return left * right
+        if op == TT_DIV: return left / right
+    if node_type is lexer.UnaryOpNode:
+        value = tree_walk(node.node, env)
+        return -value if node.op_tok.type == TT_MINUS else value
+    if node_type is lexer.NumberAssignNode:
+        value = env[lexer.name_of(node.Number_name_tok)] = tree_walk(node.value_node, env)
+        return value
+    raise TypeError(f'cannot evaluate {node_type.__name__}')
+
+def best_of(repeat, fn, *args):
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            result = fn(*args)
+            elapsed = time.perf_counter() - start
+        finally:
+            gc.enable()
+        if best is None or elapsed < best:
+            best = elapsed
+    return result, best
+
+def run_chunk(chunk):
+    values, error = vm.VM(chunk).run()
+    if error: raise SystemExit(error.as_string())
+    return values[0]
+
+def run_python(program):
+    values, error = program.run()
+    if error: raise SystemExit(error.as_string())
+    return values[0]
+
+def main(argv):
+    terms = int(argv[0]) if len(argv) > 0 else 20000
+    repeat = int(argv[1]) if len(argv) > 1 else 5
+    # The tree walk recurses once per node on the chain workload.
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), terms * 4 + 1000))
+
+    print(f'{terms} terms, best of {repeat}')
+    for name, generate in WORKLOADS:
+        node, error, _ = lexer.run_stream('<bench>', io.StringIO(generate(terms)))
+        if error: raise SystemExit(error.as_string())
+        statement = node.left_node
+
+        expected, walk_time = best_of(repeat, tree_walk, statement, {})
+        chunk, compile_time = best_of(repeat, vm.compile_node, statement)
+        value, vm_time = best_of(repeat, run_chunk, chunk)
+        if value != expected:
+            raise SystemExit(f'{name}: VM gives {value!r}, tree walk gives {expected!r}')
+        program, codegen_time = best_of(repeat, lambda: pycodegen.PyCompiler().compile(statement))
+        value, python_time = best_of(repeat, run_python, program)
+        if value != expected:
+            raise SystemExit(f'{name}: generated Python gives {value!r}, tree walk gives {expected!r}')
+        typed_program = pycodegen.PyCompiler(type_inference.infer(statement)).compile(statement)
+        value, typed_time = best_of(repeat, run_python, typed_program)
+        if value != expected:
+            raise SystemExit(f'{name}: typed Python gives {value!r}, tree walk gives {expected!r}')
+
+        print(f'{name:>8}: tree walk {walk_time * 1000:8.2f}ms')
+        print(f'{"":>8}  vm        {vm_time * 1000:8.2f}ms  {walk_time / vm_time:6.2f}x tree walk'
+            f'  compile {compile_time * 1000:8.2f}ms  {len(chunk.code) // 2} instructions')
+        print(f'{"":>8}  python    {python_time * 1000:8.2f}ms  {walk_time / python_time:6.2f}x tree walk'
+            f'  compile {codegen_time * 1000:8.2f}ms')
+        print(f'{"":>8}  typed     {typed_time * 1000:8.2f}ms  {walk_time / typed_time:6.2f}x tree walk')
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,120 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import node_arena
+
+#######################################
+# COMPILE CACHE
+#######################################
+# Results of run() stored on disk under a hash of the source text, the
+# engine and a fingerprint of the files that define the language, so a
+# change to any of them misses instead of returning stale results.
+#
+# Each entry is written to a temporary file and renamed into place, so
+# concurrent processes only ever see whole entries. The cache is kept under
+# max_bytes by deleting the least recently used entries; a hit refreshes
+# an entry's modification time.
+#
+# An entry is run()'s (source, tokens, node, error, symbol_table), with
+# the node stored as a NodeArena: pickle recurses over a node graph, so
+# deep trees, the ones most worth caching, could not be stored otherwise.
+# An entry that cannot be read back, as after a class it holds has moved,
+# is a miss and is deleted.
+
+# The files that define the language, and those whose classes are pickled
+# in an entry.
+LANGUAGE_FILES = ('keywords.py', 'tokens.py', 'grammar.txt', 'lexer.py', 'constants.py', 'error.py',
+    'lex_token.py', 'position.py', 'token_buffer.py', 'symbol_table.py', 'node_arena.py')
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+ENTRY_SUFFIX = '.pickle'
+
+def language_fingerprint():
+    digest = hashlib.sha256()
+    root = os.path.dirname(os.path.abspath(__file__))
+    for name in LANGUAGE_FILES:
+        digest.update(name.encode())
+        with open(os.path.join(root, name), 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+class CompileCache:
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.fingerprint = language_fingerprint()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, text, engine):
+        digest = hashlib.sha256(self.fingerprint.encode())
+        digest.update(engine.encode())
+        digest.update(b'\0')
+        digest.update(text.encode('utf-8', 'surrogatepass'))
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as file:
+                source, tokens, arena, error, symbol_table = pickle.load(file)
+            node = arena.to_tree() if arena is not None else None
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception:
+            self.misses += 1
+            try: os.unlink(path)
+            except OSError: pass
+            return None
+        try: os.utime(path)
+        except OSError: pass
+        self.hits += 1
+        return source, tokens, node, error, symbol_table
+
+    def put(self, key, entry):
+        source, tokens, node, error, symbol_table = entry
+        arena = node_arena.from_tree(node)
+        data = pickle.dumps((source, tokens, arena, error, symbol_table), pickle.HIGHEST_PROTOCOL)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(data)
+            os.replace(tmp_path, self.path(key))
+        except OSError:
+            try: os.unlink(tmp_path)
+            except OSError: pass
+            return
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        for dir_entry in os.scandir(self.directory):
+            if not dir_entry.name.endswith(ENTRY_SUFFIX): continue
+            try:
+                stat = dir_entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, dir_entry.path))
+            total += stat.st_size
+        if total <= self.max_bytes: return
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes: break
+            try:
+                os.unlink(path)
+                self.evictions += 1
+            except OSError:
+                # Another process evicted it first.
+                pass
+            total -= size
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
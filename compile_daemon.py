@@ -0,0 +1,191 @@
+import asyncio
+import json
+import os
+import signal
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import lexer
+from compile_cache import CompileCache
+from node_arena import from_tree, VIEWS, NO_NODE
+from run_stats import RunStats
+from tokens import TOKEN_TYPES
+
+#######################################
+# COMPILE DAEMON
+#######################################
+# A long-lived compile server, so a compile costs the lex and parse and not
+# an interpreter start. Requests and responses are JSON, one per line, over
+# a Unix socket or stdin/stdout:
+#
+#   {"id": 1, "fn": "a.txt", "text": "HEAD a = 1", "engine": "classic", "tokens": false, "stats": false}
+#   {"id": 1, "ast": {...}, "error": null, "symbols": {...}}
+#
+# Only "text" is required. With "stats" the response also carries the
+# run_stats.RunStats of the compile, as {"times": {...}, "counters": {...}}.
+# Requests are read concurrently and compiled in a pool of worker processes
+# that stay up, with the lexer imported and, given a cache directory, a
+# CompileCache open. Responses are written as they finish, so a client
+# matches them to requests by id.
+#
+# The AST is sent flat, as a list of nodes whose children are indices into
+# the list, so no depth of nesting is too deep to encode or decode.
+
+# Longest request line accepted, in bytes.
+MAX_LINE = 256 * 1024 * 1024
+
+#######################################
+# ENCODING
+#######################################
+
+def encode_position(pos):
+    return {'idx': pos.idx, 'ln': pos.ln, 'col': pos.col}
+
+def encode_error(error):
+    if error is None: return None
+    return {
+        'name': error.error_name,
+        'details': error.details,
+        'start': encode_position(error.pos_start),
+        'end': encode_position(error.pos_end),
+        'message': error.as_string(),
+    }
+
+def encode_tokens(tokens):
+    return [{'type': tok.type, 'value': tok.value, 'start': tok.start, 'end': tok.end} for tok in tokens]
+
+def encode_ast(node):
+    # Nodes children first, from a NodeArena of the tree; "root" is the
+    # index of the top node.
+    if node is None: return None
+    arena = from_tree(node)
+    tokens = arena.tokens
+    nodes = []
+    for index in range(len(arena)):
+        tok = arena.toks[index]
+        entry = {
+            'kind': VIEWS[arena.kinds[index]].__name__[:-len('View')],
+            'token': {'type': tokens.type_at(tok), 'value': tokens.value_at(tok),
+                'start': tokens.starts[tok], 'end': tokens.ends[tok]},
+        }
+        children = [child if child != NO_NODE else None for child in arena.children(index)]
+        if children: entry['children'] = children
+        if arena.ops[index]: entry['op'] = TOKEN_TYPES[arena.ops[index]]
+        nodes.append(entry)
+    return {'root': arena.root, 'nodes': nodes}
+
+def encode_symbols(symbol_table):
+    return {name: {'location': entry['location'], 'dataType': str(entry['dataType'])}
+        for name, entry in symbol_table.items()}
+
+#######################################
+# WORKERS
+#######################################
+
+# The CompileCache of a worker process, when the daemon was given one.
+worker_cache = None
+
+def init_worker(cache_directory):
+    global worker_cache
+    if cache_directory is not None: worker_cache = CompileCache(cache_directory)
+
+def compile_request(request):
+    # Runs in a worker; returns the response without its id.
+    engine = request.get('engine', 'classic')
+    if engine not in lexer.ENGINES: return {'error': {'name': 'Bad Request', 'details': f'unknown engine {engine!r}'}}
+    text = request['text']
+    stats = RunStats() if request.get('stats') else None
+    tokens, node, error, symbol_table = lexer.run_tokens(request.get('fn', '<daemon>'), text, engine, worker_cache, stats)
+    response = {'ast': encode_ast(node), 'error': encode_error(error), 'symbols': encode_symbols(symbol_table)}
+    if stats is not None: response['stats'] = stats.as_dict()
+    # The tokens of the compile itself, from whichever engine or the cache.
+    if request.get('tokens'): response['tokens'] = encode_tokens(tokens)
+    return response
+
+#######################################
+# SERVER
+#######################################
+
+class CompileDaemon:
+    def __init__(self, workers=None, cache_directory=None):
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(cache_directory,))
+        self.requests = 0
+
+    async def respond(self, line, writer):
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict) or not isinstance(request.get('text'), str):
+                raise ValueError('a request needs a "text" string')
+        except ValueError as exc:
+            response = {'id': None, 'error': {'name': 'Bad Request', 'details': str(exc)}}
+        else:
+            loop = asyncio.get_running_loop()
+            try:
+                result = await loop.run_in_executor(self.executor, compile_request, request)
+            except Exception as exc:
+                # Reported to the client, which would otherwise wait forever.
+                result = {'error': {'name': 'Internal Error', 'details': f'{exc.__class__.__name__}: {exc}'}}
+            response = {'id': request.get('id'), **result}
+        self.requests += 1
+        writer.write(json.dumps(response).encode() + b'\n')
+        await writer.drain()
+
+    async def serve_connection(self, reader, writer):
+        # Every request line gets a task, so a long compile does not hold up
+        # the ones after it.
+        pending = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line: break
+                if not line.strip(): continue
+                task = asyncio.create_task(self.respond(line, writer))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            if pending: await asyncio.gather(*pending)
+        finally:
+            writer.close()
+
+    async def serve_socket(self, path):
+        if os.path.exists(path): os.unlink(path)
+        server = await asyncio.start_unix_server(self.serve_connection, path, limit=MAX_LINE)
+        # Stopped by SIGTERM as by an interrupt, so the socket is removed.
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if os.path.exists(path): os.unlink(path)
+
+    async def serve_stdio(self):
+        await self.serve_connection(StdioReader(), StdioWriter())
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+class StdioReader:
+    # stdin may be a file rather than a pipe, which asyncio cannot watch, so
+    # lines are read on a thread instead.
+    async def readline(self):
+        return await asyncio.to_thread(sys.stdin.buffer.readline)
+
+class StdioWriter:
+    def write(self, data):
+        sys.stdout.buffer.write(data)
+
+    async def drain(self):
+        sys.stdout.buffer.flush()
+
+    def close(self):
+        sys.stdout.buffer.flush()
+
+def serve(path=None, workers=None, cache_directory=None):
+    # Serves on the Unix socket at path, or on stdin/stdout when path is
+    # None or '-', until the input ends or the process is interrupted.
+    daemon = CompileDaemon(workers, cache_directory)
+    try:
+        if path is None or path == '-': asyncio.run(daemon.serve_stdio())
+        else: asyncio.run(daemon.serve_socket(path))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    finally:
+        daemon.shutdown()
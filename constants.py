@@ -2,4 +2,11 @@ import string
 
 DIGITS = '0123456789'
 LETTERS = string.ascii_letters
-LETTERS_DIGITS = LETTERS + DIGITS
\ No newline at end of file
+LETTERS_DIGITS = LETTERS + DIGITS
+NUMBER_CHARS = DIGITS + '.'
+IDENTIFIER_CHARS = LETTERS_DIGITS + '_'
+
+ESCAPE_CHARACTERS = {
+    'n': '\n',
+    't': '\t'
+}
\ No newline at end of file
@@ -0,0 +1,594 @@
+from bisect import bisect_left, bisect_right
+from error import IllegalCharError
+from lexer import Lexer, StreamParser, ParseResult, HeadNode
+from lex_token import Token
+from position import Position, Source
+from symbol_table import SymbolTable
+from tokens import TT_KEYWORD, TT_IDENTIFIER
+
+#######################################
+# INCREMENTAL COMPILATION
+#######################################
+# Keeps the tokens and AST of a program so an edit only re-lexes from the
+# token before it until the new tokens line up with the old ones again,
+# and only re-parses the HEAD or BODY section the edit falls in.
+#
+# The text and the tokens are both kept in gap buffers, the gap sitting at
+# the last edit. Offsets before the gap count from the start of the text
+# and offsets after it from the end, so an edit changes nothing beyond
+# itself; its cost is its own size plus the distance from the last edit,
+# not the size of the text. Tokens are kept in blocks, the unit moved
+# across the gap, with offsets relative to their block.
+#
+# The symbol table is the one a full compile would give: names are counted
+# over their identifier tokens, and the table, in order of first
+# occurrence, is rebuilt when read after a name came, went or moved. An
+# identifier token's value, its location, is looked up when read.
+
+BLOCK_SIZE = 512
+# Characters per chunk of text, and read by the lexer at a time.
+CHUNK_SIZE = 4096
+
+#######################################
+# TEXT
+#######################################
+
+class GapText:
+    # The text as chunks of up to CHUNK_SIZE characters. Chunks before the
+    # gap keep their end and the newlines up to it from the start of the
+    # text; those after it, kept in reverse, their start and newlines from
+    # the end. Reads like a str for slicing, as position.MappedText does.
+    def __init__(self, text):
+        self.before = []
+        self.before_ends = []
+        self.before_lines = []
+        self.after = []
+        self.after_sizes = []
+        self.after_lines = []
+        self.length = len(text)
+        for i in range(0, len(text), CHUNK_SIZE):
+            self.push_before(text[i:i + CHUNK_SIZE])
+
+    @property
+    def gap(self):
+        return self.before_ends[-1] if self.before else 0
+
+    @property
+    def lines(self):
+        # Newlines in the whole text.
+        return (self.before_lines[-1] if self.before else 0) + (self.after_lines[-1] if self.after else 0)
+
+    def push_before(self, chunk):
+        self.before_lines.append((self.before_lines[-1] if self.before else 0) + chunk.count('\n'))
+        self.before_ends.append(self.gap + len(chunk))
+        self.before.append(chunk)
+
+    def pop_before(self):
+        self.before_ends.pop()
+        self.before_lines.pop()
+        return self.before.pop()
+
+    def push_after(self, chunk):
+        self.after_lines.append((self.after_lines[-1] if self.after else 0) + chunk.count('\n'))
+        self.after_sizes.append((self.after_sizes[-1] if self.after else 0) + len(chunk))
+        self.after.append(chunk)
+
+    def pop_after(self):
+        self.after_sizes.pop()
+        self.after_lines.pop()
+        return self.after.pop()
+
+    def seek(self, idx):
+        # Moves the gap to the start of the chunk holding idx.
+        while self.before and self.gap > idx:
+            self.push_after(self.pop_before())
+        while self.after and self.gap + len(self.after[-1]) <= idx:
+            self.push_before(self.pop_after())
+
+    def replace(self, offset, removed, inserted):
+        self.seek(offset)
+        start = self.gap
+        pieces = []
+        size = 0
+        while self.after and (not pieces or start + size < offset + removed):
+            pieces.append(self.pop_after())
+            size += len(pieces[-1])
+        text = ''.join(pieces)
+        text = text[:offset - start] + inserted + text[offset - start + removed:]
+        if self.before and len(self.before[-1]) + len(text) <= CHUNK_SIZE:
+            text = self.pop_before() + text
+        for i in range(0, len(text), CHUNK_SIZE):
+            self.push_before(text[i:i + CHUNK_SIZE])
+        self.length += len(inserted) - removed
+
+    def chunk_at(self, idx):
+        # The chunk holding idx, its start and the newlines before it.
+        if idx < self.gap:
+            i = bisect_right(self.before_ends, idx)
+            return self.before[i], self.before_ends[i - 1] if i else 0, self.before_lines[i - 1] if i else 0
+        j = bisect_left(self.after_sizes, self.length - idx)
+        return self.after[j], self.length - self.after_sizes[j], self.lines - self.after_lines[j]
+
+    def chunks(self, idx):
+        # Chunks from the one holding idx to the end, with their starts.
+        if idx < self.gap:
+            i = bisect_right(self.before_ends, idx)
+            start = self.before_ends[i - 1] if i else 0
+            while i < len(self.before):
+                yield start, self.before[i]
+                start = self.before_ends[i]
+                i += 1
+            idx = self.gap
+        if idx < self.length:
+            j = bisect_left(self.after_sizes, self.length - idx)
+            while j >= 0:
+                yield self.length - self.after_sizes[j], self.after[j]
+                j -= 1
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice): index = slice(index, index + 1)
+        start, stop, step = index.indices(self.length)
+        pieces = []
+        for chunk_start, chunk in self.chunks(start):
+            if chunk_start >= stop: break
+            pieces.append(chunk[max(start - chunk_start, 0):stop - chunk_start])
+        return ''.join(pieces)
+
+    def __str__(self):
+        return ''.join(self.before) + ''.join(reversed(self.after))
+
+    def line_of(self, idx):
+        if idx >= self.length: return self.lines
+        chunk, start, lines = self.chunk_at(idx)
+        return lines + chunk.count('\n', 0, idx - start)
+
+    def line_start(self, ln):
+        # Offset just past the ln-th newline.
+        if ln == 0: return 0
+        if self.before and self.before_lines[-1] >= ln:
+            i = bisect_left(self.before_lines, ln)
+            chunk, start, lines = self.before[i], self.before_ends[i - 1] if i else 0, self.before_lines[i - 1] if i else 0
+        else:
+            j = bisect_right(self.after_lines, self.lines - ln)
+            chunk, start, lines = self.after[j], self.length - self.after_sizes[j], self.lines - self.after_lines[j]
+        newline = -1
+        for _ in range(ln - lines):
+            newline = chunk.find('\n', newline + 1)
+        return start + newline + 1
+
+    def next_newline(self, idx):
+        for start, chunk in self.chunks(idx):
+            newline = chunk.find('\n', max(idx - start, 0))
+            if newline >= 0: return start + newline
+        return self.length
+
+class LineStarts:
+    # Source.line_starts of a GapText, each looked up when asked for.
+    def __init__(self, text):
+        self.text = text
+
+    def __len__(self):
+        return self.text.lines + 1
+
+    def __getitem__(self, ln):
+        if ln < 0: ln += len(self)
+        if not 0 <= ln < len(self): raise IndexError('line out of range')
+        return self.text.line_start(ln)
+
+class GapSource(Source):
+    # A Source over a GapText, which answers line lookups itself.
+    @property
+    def line_starts(self):
+        return LineStarts(self.text)
+
+    def line_of(self, idx):
+        return self.text.line_of(idx)
+
+    def next_newline(self, idx):
+        return self.text.next_newline(idx)
+
+class TextReader:
+    # Reads a GapText from start as Lexer.scan reads a file.
+    def __init__(self, text, start):
+        self.text = text
+        self.pos = start
+
+    def read(self, size):
+        chunk = self.text[self.pos:self.pos + size]
+        self.pos += len(chunk)
+        return chunk
+
+#######################################
+# TOKENS
+#######################################
+
+class NameToken(Token):
+    # An identifier. Its value is its name's location in the compilation's
+    # symbol table, read from the table, since locations move as names come
+    # and go.
+    def __init__(self, name, start, end, compilation):
+        self.type = TT_IDENTIFIER
+        self.name = name
+        self.start = start
+        self.end = end
+        self.source = None
+        self.compilation = compilation
+
+    @property
+    def value(self):
+        return self.compilation.symbol_table[self.name]["location"]
+
+class TokenBlock:
+    # Acts as the source of its tokens: a Position built from one of them
+    # resolves to the current Source at the block's offset plus its own.
+    def __init__(self, compilation, base, tokens):
+        self.compilation = compilation
+        self.base = base
+        # A block after the gap counts its base back from the end of the text.
+        self.tail = False
+        self.tokens = tokens
+
+    @property
+    def offset(self):
+        return self.base + self.compilation.text_buffer.length if self.tail else self.base
+
+    def resolve(self, idx):
+        return self.compilation.source, idx + self.offset
+
+    def start_of(self, index):
+        return self.tokens[index].start + self.offset
+
+    def end_of(self, index):
+        return self.tokens[index].end + self.offset
+
+class BlockList:
+    # The blocks in a gap buffer, indexed as one list; those after the gap
+    # are kept in reverse and have tail bases.
+    def __init__(self, text):
+        self.text = text
+        self.before = []
+        self.after = []
+
+    def __len__(self):
+        return len(self.before) + len(self.after)
+
+    def __getitem__(self, index):
+        if index < 0: index += len(self)
+        if index < len(self.before): return self.before[index]
+        return self.after[len(self) - 1 - index]
+
+    def move_gap(self, index):
+        # Puts the gap just before block index.
+        while len(self.before) > index:
+            block = self.before.pop()
+            block.base -= self.text.length
+            block.tail = True
+            self.after.append(block)
+        while len(self.before) < index:
+            block = self.after.pop()
+            block.base += self.text.length
+            block.tail = False
+            self.before.append(block)
+
+#######################################
+# NAMES
+#######################################
+
+class Names:
+    # Each name's identifier tokens counted, with its first one, and the
+    # symbol table a full compile would build from them.
+    def __init__(self, compilation):
+        self.compilation = compilation
+        self.counts = {}
+        self.first = {}
+        self.table = None
+
+    def update(self, removed, added, after):
+        # removed tokens replaced by added, which now lie just before after.
+        # A name that lost its first token keeps the earliest of added, or
+        # failing that the next one after them.
+        compilation = self.compilation
+        counts, first = self.counts, self.first
+        changed = False
+        for tok in removed:
+            if tok.type != TT_IDENTIFIER: continue
+            name = tok.name
+            counts[name] -= 1
+            if counts[name] == 0:
+                del counts[name], first[name]
+                changed = True
+            elif first[name] is tok:
+                first[name] = None
+                changed = True
+        for tok in added:
+            if tok.type != TT_IDENTIFIER: continue
+            name = tok.name
+            counts[name] = counts.get(name, 0) + 1
+            current = first.get(name)
+            if current is None or compilation.start_of(tok) < compilation.start_of(current):
+                first[name] = tok
+                changed = True
+        missing = {name for name, tok in first.items() if tok is None}
+        if missing:
+            block_index, index = compilation.locate(compilation.start_of(after) + 1)
+            for tok in compilation.tokens(block_index, index):
+                if tok.type == TT_IDENTIFIER and tok.name in missing:
+                    first[tok.name] = tok
+                    missing.discard(tok.name)
+                    if not missing: break
+        # A first token's data type is the token before it, which the edit
+        # may have replaced.
+        if after.type == TT_IDENTIFIER and first.get(after.name) is after: changed = True
+        if changed: self.table = None
+
+    def build(self):
+        compilation = self.compilation
+        table = SymbolTable()
+        for name in sorted(self.first, key=lambda name: compilation.start_of(self.first[name])):
+            tok = self.first[name]
+            prev = compilation.token_before(*compilation.locate(compilation.start_of(tok) + 1))
+            if prev is None:
+                table.define(name)
+            else:
+                value = table[prev.name]["location"] if prev.type == TT_IDENTIFIER else prev.value
+                table.define(name, Token(prev.type, value))
+        return table
+
+#######################################
+# INCREMENTAL COMPILATION
+#######################################
+
+class IncrementalCompilation:
+    def __init__(self, fn, text):
+        self.fn = fn
+        self.node = None
+        self.error = None
+        self.lex_error = False
+        self.head_tok = None
+        self.body_tok = None
+        self.reset(text)
+
+    @property
+    def text(self):
+        # The whole text, joined when read.
+        return str(self.text_buffer)
+
+    @property
+    def symbol_table(self):
+        names = self.names
+        if names.table is None: names.table = names.build()
+        return names.table
+
+    def tokens(self, block_index=0, token_index=0):
+        blocks = self.blocks
+        for i in range(block_index, len(blocks)):
+            tokens = blocks[i].tokens
+            for j in range(token_index if i == block_index else 0, len(tokens)):
+                yield tokens[j]
+
+    #######################################
+
+    def reset(self, text):
+        self.text_buffer = GapText(text)
+        self.source = GapSource(self.fn, self.text_buffer)
+        self.blocks = BlockList(self.text_buffer)
+        self.names = Names(self)
+        self.compile(text)
+
+    def compile(self, text):
+        # A full compile of text, as a plain Lexer and parser would do it.
+        lexer = Lexer(self.fn, text)
+        tokens = self.make_tokens(list(lexer.scan()), list(lexer.symbol_table))
+        self.add_blocks(self.blocks.before, tokens)
+        self.names.update((), tokens, tokens[-1])
+        self.names.table = lexer.symbol_table
+        self.lex_error = lexer.error is not None
+        if self.lex_error:
+            self.node, self.error = None, IllegalCharError(
+                Position(lexer.error.pos_start.idx, self.source), Position(lexer.error.pos_end.idx, self.source),
+                lexer.error.details)
+            return
+        self.parse()
+
+    def edit(self, offset, removed, inserted):
+        # Replaces removed characters at offset with inserted and brings the
+        # tokens and AST up to date. Returns the new node and error.
+        if self.lex_error:
+            text = self.text
+            self.reset(text[:offset] + inserted + text[offset + removed:])
+            return self.node, self.error
+
+        delta = len(inserted) - removed
+        edit_end = offset + len(inserted)
+
+        # Resume after the last token that ends before the edit; the lexer is
+        # between lexemes there, even if the edit is inside a comment.
+        first_block, first = self.locate(offset)
+        prev = self.token_before(first_block, first)
+        restart = self.end_of(prev) if prev else 0
+        # The block of the edit stays before the gap, so its offsets do not
+        # move with the text; every block after it does.
+        self.blocks.move_gap(first_block + 1)
+        self.text_buffer.replace(offset, removed, inserted)
+
+        lexer = Lexer(self.fn, '')
+        raw_tokens = []
+        old = self.tokens(first_block, first)
+        old_tok = next(old, None)
+        old_start = self.shifted_start(old_tok, delta)
+        old_index = 0
+        for raw in lexer.scan(TextReader(self.text_buffer, restart), CHUNK_SIZE):
+            start = raw[2] + restart
+            if start >= edit_end:
+                # Beyond the edit the text is unchanged, so once a new token
+                # starts where a shifted old one does, the rest is the same.
+                while old_tok is not None and old_start < start:
+                    old_tok = next(old, None)
+                    old_index += 1
+                    if old_tok is not None: old_start = self.shifted_start(old_tok, delta)
+                if old_tok is not None and old_start == start: break
+            raw_tokens.append(raw)
+        else:
+            old_index = None
+        new_tokens = self.make_tokens(raw_tokens, list(lexer.symbol_table), restart)
+
+        if lexer.error:
+            self.lex_error = True
+            self.node, self.error = None, IllegalCharError(
+                Position(lexer.error.pos_start.idx + restart, self.source),
+                Position(lexer.error.pos_end.idx + restart, self.source), lexer.error.details)
+        removed_tokens = self.splice(first_block, first, old_index, new_tokens, delta)
+        self.names.update(removed_tokens, new_tokens, old_tok if old_index is not None else new_tokens[-1])
+        if self.lex_error:
+            return self.node, self.error
+
+        self.reparse(offset, removed_tokens, new_tokens)
+        return self.node, self.error
+
+    #######################################
+
+    def make_tokens(self, raw_tokens, names, base=0):
+        # Tokens with absolute offsets from the lexer's (type, value, start,
+        # end), whose identifier values are locations into names.
+        tokens = []
+        for tok_type, value, start, end in raw_tokens:
+            if tok_type == TT_IDENTIFIER: tokens.append(NameToken(names[value], start + base, end + base, self))
+            else: tokens.append(Token(tok_type, value, start + base, end + base, None))
+        return tokens
+
+    def add_blocks(self, blocks, tokens):
+        # Groups tokens holding absolute offsets into blocks, rebasing each
+        # token onto its block.
+        for i in range(0, len(tokens), BLOCK_SIZE):
+            chunk = tokens[i:i + BLOCK_SIZE]
+            block = TokenBlock(self, chunk[0].start, chunk)
+            for tok in chunk:
+                tok.start -= block.base
+                tok.end -= block.base
+                tok.source = block
+            blocks.append(block)
+
+    def start_of(self, tok):
+        return tok.start + tok.source.offset
+
+    def end_of(self, tok):
+        return tok.end + tok.source.offset
+
+    def shifted_start(self, tok, delta):
+        # Start of an old token in the edited text. Only the block of the
+        # edit is before the gap, so only its offsets have not moved.
+        if tok is None: return None
+        block = tok.source
+        return tok.start + (block.offset if block.tail else block.base + delta)
+
+    def locate(self, offset):
+        # Block and index of the first token ending at or after offset.
+        blocks = self.blocks
+        block_index = bisect_left(blocks, offset, key=lambda block: block.end_of(-1))
+        if block_index == len(blocks): block_index -= 1
+        block = blocks[block_index]
+        index = bisect_left(block.tokens, offset - block.offset, key=lambda tok: tok.end)
+        return block_index, min(index, len(block.tokens) - 1)
+
+    def token_before(self, block_index, index):
+        if index > 0: return self.blocks[block_index].tokens[index - 1]
+        if block_index > 0: return self.blocks[block_index - 1].tokens[-1]
+        return None
+
+    def splice(self, first_block, first, count, new_tokens, delta):
+        # Replaces count old tokens from (first_block, first) with new_tokens,
+        # or every old token from there on when count is None. Returns the
+        # tokens that were replaced. first_block is the last block before
+        # the gap.
+        blocks = self.blocks
+        removed = []
+        last_block = first_block
+        index = first
+        while last_block < len(blocks):
+            tokens = blocks[last_block].tokens
+            take = len(tokens) - index if count is None else min(count - len(removed), len(tokens) - index)
+            removed.extend(tokens[index:index + take])
+            index += take
+            if count is not None and len(removed) == count: break
+            last_block += 1
+            index = 0
+
+        # Rebuild the touched blocks from absolute offsets in the new text.
+        kept = []
+        for tok in blocks[first_block].tokens[:first]:
+            kept.append(self.absolute(tok, tok.source.base))
+        kept.extend(new_tokens)
+        if last_block < len(blocks):
+            for tok in blocks[last_block].tokens[index:]:
+                kept.append(self.absolute(tok, self.shifted_start(tok, delta) - tok.start))
+        # Fold small leftovers into the next block so blocks stay near size.
+        while len(kept) < BLOCK_SIZE // 2 and last_block + 1 < len(blocks):
+            last_block += 1
+            for tok in blocks[last_block].tokens:
+                kept.append(self.absolute(tok, tok.source.offset))
+        blocks.before.pop()
+        del blocks.after[len(blocks.after) - min(last_block - first_block, len(blocks.after)):]
+        if kept: self.add_blocks(blocks.before, kept)
+        return removed
+
+    def absolute(self, tok, base):
+        tok.start += base
+        tok.end += base
+        return tok
+
+    #######################################
+
+    def parse(self):
+        parser = StreamParser(self.tokens())
+        ast = parser.parse()
+        self.node, self.error = ast.node, ast.error
+        self.head_tok = self.body_tok = None
+        if self.error: return
+        self.head_tok = self.node.op_tok
+        for tok in self.tokens():
+            if tok is not self.head_tok and self.is_keyword(tok, "BODY"):
+                self.body_tok = tok
+                break
+
+    def reparse(self, offset, removed_tokens, new_tokens):
+        if self.error:
+            # Error positions are fixed when the error is made, so they are
+            # rebuilt rather than carried over.
+            self.parse()
+            return
+        if not removed_tokens and not new_tokens:
+            # Only whitespace or comments changed.
+            return
+        structural = offset <= self.head_tok.pos_start.idx or any(
+            tok is self.head_tok or tok is self.body_tok or self.is_keyword(tok, "HEAD") or self.is_keyword(tok, "BODY")
+            for tok in removed_tokens + new_tokens)
+        if structural:
+            self.parse()
+            return
+
+        head = self.node
+        res = ParseResult()
+        if self.body_tok is not None and offset > self.body_tok.pos_start.idx:
+            right_node = self.parse_section(self.body_tok, "BODY", res)
+            node = HeadNode(head.left_node, self.head_tok, right_node)
+        else:
+            left_node = self.parse_section(self.head_tok, "BODY", res)
+            node = HeadNode(left_node, self.head_tok, head.right_node)
+        if res.error:
+            self.node, self.error = None, res.error
+        else:
+            self.node, self.error = node, None
+
+    def parse_section(self, keyword_tok, end_keyword, res):
+        # Only the first statement of a section is part of the AST, so there
+        # is no need to skip the rest of the section as a full parse does.
+        block_index, index = self.locate(keyword_tok.pos_end.idx + 1)
+        parser = StreamParser(self.tokens(block_index, index))
+        if parser.at_section_end(end_keyword): return None
+        return res.register(parser.expr())
+
+    def is_keyword(self, tok, keyword):
+        return tok.type == TT_KEYWORD and tok.value == keyword
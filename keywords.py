@@ -21,4 +21,5 @@ KEYWORDS = [
     ".",
     "!",
     "VAR",
-]
\ No newline at end of file
+]
+KEYWORD_SET = frozenset(KEYWORDS)
@@ -0,0 +1,29 @@
+from position import Position
+
+class Token:
+    def __init__(self, type_, value=None, start=None, end=None, source=None):
+    	self.type = type_
+    	self.value = value
+    	
+    	# Plain offsets into source; Positions are only built when asked for.
+    	self.start = start
+    	self.end = start + 1 if end is None and start is not None else end
+    	self.source = source
+
+    @property
+    def pos_start(self):
+    	return Position(self.start, self.source)
+
+    @property
+    def pos_end(self):
+    	return Position(self.end, self.source)
+
+    def matches(self, type_):
+    	return self.type == type_ 
+
+    def getValue(self):
+        return self.value
+        
+    def __repr__(self):
+    	if self.value is not None: return f'{self.type}:{self.value}'
+    	return f'{self.type}'
@@ -1,29 +1,84 @@
+import mmap
+import os
+import re
 import string
+import time
+from array import array
+from collections import deque
 from error import IllegalCharError, ExpectedCharError, InvalidSyntaxError, RTError
-from position import Position
-from constants import DIGITS, LETTERS, LETTERS_DIGITS
-from keywords import KEYWORDS
+from position import Position, Source, CountingSource, MappedText
+from constants import DIGITS, LETTERS, LETTERS_DIGITS, NUMBER_CHARS, IDENTIFIER_CHARS, ESCAPE_CHARACTERS
 from tokens import (TT_INT, TT_FLOAT, TT_PLUS, TT_MINUS, TT_MUL, TT_DIV, TT_STRING, TT_LEFT_PARENTHESIS, TT_RIGHT_PARENTHESIS, TT_LEFT_CURL_BRACES,
     TT_RIGHT_CURL_BRACES, TT_SEMICOLON, TT_FULLCOLON, TT_EQUAL_EQUAL, TT_NE, TT_LT, TT_GT, TT_LTE, TT_GTE, TT_LSQUAREBRACET, TT_RSQUAREBRACET, TT_COMMA, TT_IDENTIFIER, TT_KEYWORD, TT_EQ, TT_EOF,
     )
-from token import Token
+from lex_token import Token
+from symbol_table import SymbolTable
+from token_buffer import TokenBuffer
+from tokens import TOKEN_TYPES, TYPE_CODES
 
 #######################################
-# LEXER
+# TOKEN SPECIFICATION
 #######################################
-symbolTable = {}
+# Every lexeme the language accepts, as (kind, pattern) pairs. The table
+# driven engine joins these into one master pattern; longer operators must
+# come before their one character prefixes.
+TOKEN_SPEC = [
+    ('SKIP',                r'[ \t\n]+'),
+    ('COMMENT',             r'![^!]*!?'),
+    ('NUMBER',              r'[0-9]+(?:\.[0-9]*)?'),
+    ('NAME',                r'[A-Za-z][A-Za-z0-9_]*'),
+    ('STRING',              r'"(?:[^"\\]|\\.?)*(?P<STRING_END>")?'),
+    (TT_EQUAL_EQUAL,        r'=='),
+    (TT_LTE,                r'<='),
+    (TT_GTE,                r'>='),
+    (TT_EQ,                 r'='),
+    (TT_LT,                 r'<'),
+    (TT_GT,                 r'>'),
+    (TT_PLUS,               r'\+'),
+    (TT_MINUS,              r'-'),
+    (TT_MUL,                r'\*'),
+    (TT_DIV,                r'/'),
+    (TT_LEFT_PARENTHESIS,   r'\('),
+    (TT_RIGHT_PARENTHESIS,  r'\)'),
+    (TT_LEFT_CURL_BRACES,   r'\{'),
+    (TT_RIGHT_CURL_BRACES,  r'\}'),
+    (TT_LSQUAREBRACET,      r'\['),
+    (TT_RSQUAREBRACET,      r'\]'),
+    (TT_SEMICOLON,          r';'),
+    (TT_COMMA,              r','),
+    (TT_FULLCOLON,          r':'),
+    ('DOT',                 r'\.'),
+    ('ILLEGAL',             r'.'),
+]
+MASTER_PATTERN = re.compile('|'.join(f'(?P<{kind}>{pattern})' for kind, pattern in TOKEN_SPEC), re.DOTALL)
+ESCAPE_PATTERN = re.compile(r'\\(.?)', re.DOTALL)
+# The same pattern over bytes, for lexing a memory-mapped file in place.
+MASTER_BYTES_PATTERN = re.compile(MASTER_PATTERN.pattern.encode(), re.DOTALL)
+
+# Kinds that become a token with no value; the kind is the token type.
+OPERATOR_KINDS = frozenset(kind for kind, _ in TOKEN_SPEC
+    if kind not in ('SKIP', 'COMMENT', 'NUMBER', 'NAME', 'STRING', 'DOT', 'ILLEGAL'))
+
+ENGINES = ('classic', 'regex', 'buffer')
+CHUNK_SIZE = 64 * 1024
 
+#######################################
+# LEXER
+#######################################
 class Lexer:
-    def __init__(self, fn, text):
+    def __init__(self, fn, text, symbol_table=None, source=None):
         self.fn = fn
         self.text = text
-        self.pos = Position(-1, 0, -1, fn, text)
+        self.symbol_table = symbol_table if symbol_table is not None else SymbolTable()
+        self.source = source if source is not None else Source(fn, text)
+        self.error = None
+        self.idx = -1
         self.current_char = None
         self.advance()
     
     def advance(self):
-        self.pos.advance(self.current_char)
-        self.current_char = self.text[self.pos.idx] if self.pos.idx < len(self.text) else None
+        self.idx += 1
+        self.current_char = self.text[self.idx] if self.idx < len(self.text) else None
 
     def make_tokens(self):
         tokens = []
@@ -46,16 +101,16 @@ class Lexer:
             elif self.current_char == '!':
                 self.make_comment()
             elif self.current_char == '+':
-                tokens.append(Token(TT_PLUS, pos_start=self.pos))
+                tokens.append(Token(TT_PLUS, start=self.idx, source=self.source))
                 self.advance()
             elif self.current_char == '-':
-                tokens.append(Token(TT_MINUS, pos_start=self.pos))
+                tokens.append(Token(TT_MINUS, start=self.idx, source=self.source))
                 self.advance()
             elif self.current_char == '*':
-                tokens.append(Token(TT_MUL, pos_start=self.pos))
+                tokens.append(Token(TT_MUL, start=self.idx, source=self.source))
                 self.advance()
             elif self.current_char == '/':
-                tokens.append(Token(TT_DIV, pos_start=self.pos))
+                tokens.append(Token(TT_DIV, start=self.idx, source=self.source))
                 self.advance()
             elif self.current_char == '=':
                 tokens.append(self.make_equals())
@@ -63,51 +118,219 @@ class Lexer:
                 tokens.append(self.make_less_than())
             elif self.current_char == '>':
                 tokens.append(self.make_greater_than())
-                self.advance()
             elif self.current_char == '(':
-                tokens.append(Token(TT_LEFT_PARENTHESIS, pos_start=self.pos))
+                tokens.append(Token(TT_LEFT_PARENTHESIS, start=self.idx, source=self.source))
                 self.advance()
             elif self.current_char == ')':
-                tokens.append(Token(TT_RIGHT_PARENTHESIS, pos_start=self.pos))
+                tokens.append(Token(TT_RIGHT_PARENTHESIS, start=self.idx, source=self.source))
                 self.advance()
             elif self.current_char == '{':
-                tokens.append(Token(TT_LEFT_CURL_BRACES, pos_start=self.pos))
+                tokens.append(Token(TT_LEFT_CURL_BRACES, start=self.idx, source=self.source))
                 self.advance()
             elif self.current_char == '}':
-                tokens.append(Token(TT_RIGHT_CURL_BRACES, pos_start=self.pos))
+                tokens.append(Token(TT_RIGHT_CURL_BRACES, start=self.idx, source=self.source))
                 self.advance()
             elif self.current_char == '[':
-                tokens.append(Token(TT_LSQUAREBRACET, pos_start=self.pos))
+                tokens.append(Token(TT_LSQUAREBRACET, start=self.idx, source=self.source))
                 self.advance()
             elif self.current_char == ']':
-                tokens.append(Token(TT_RSQUAREBRACET, pos_start=self.pos))
+                tokens.append(Token(TT_RSQUAREBRACET, start=self.idx, source=self.source))
                 self.advance()
             elif self.current_char == ';':
-                tokens.append(Token(TT_SEMICOLON, pos_start=self.pos))
+                tokens.append(Token(TT_SEMICOLON, start=self.idx, source=self.source))
                 self.advance()
             elif self.current_char == ',':
-                tokens.append(Token(TT_COMMA, pos_start=self.pos))
+                tokens.append(Token(TT_COMMA, start=self.idx, source=self.source))
                 self.advance()
             elif self.current_char == '.':
-                tokens.append(Token(TT_KEYWORD, ".", pos_start=self.pos))
+                tokens.append(Token(TT_KEYWORD, ".", start=self.idx, source=self.source))
                 self.advance()
             elif self.current_char == ':':
-                tokens.append(Token(TT_FULLCOLON, pos_start=self.pos))
+                tokens.append(Token(TT_FULLCOLON, start=self.idx, source=self.source))
                 self.advance()
             else:
-                pos_start = self.pos.copy()
+                start = self.idx
                 char = self.current_char
                 self.advance()
-                return [], IllegalCharError(pos_start, self.pos, "'" + char + "'")
-        tokens.append(Token(TT_EOF, pos_start=self.pos))
+                return [], IllegalCharError(Position(start, self.source), Position(self.idx, self.source), "'" + char + "'")
+        tokens.append(Token(TT_EOF, start=self.idx, source=self.source))
+        return tokens, None
+
+    def scan_tokens(self):
+        # Table driven engine: one master pattern match per lexeme instead of
+        # one branch chain per character. Produces the same tokens as make_tokens.
+        tokens = list(self.iter_tokens())
+        if self.error: return [], self.error
         return tokens, None
 
+    def iter_tokens(self, file=None, chunk_size=CHUNK_SIZE):
+        # Yields Token objects one at a time from scan(). On an illegal
+        # character it sets self.error and ends the stream with an EOF token.
+        scanner = self.scan(file, chunk_size)
+        source = self.source
+        for tok_type, value, start, end in scanner:
+            yield Token(tok_type, value, start, end, source)
+
+    def make_token_buffer(self, file=None, chunk_size=CHUNK_SIZE):
+        # Like scan_tokens, but stores the tokens column-wise in a TokenBuffer
+        # instead of building a Token object for each.
+        scanner = self.scan(file, chunk_size)
+        tokens = TokenBuffer(self.source)
+        append = tokens.append
+        for tok_type, value, start, end in scanner:
+            append(tok_type, value, start, end)
+        if self.error: return tokens, self.error
+        return tokens, None
+
+    def make_mapped_buffer(self, data):
+        # Lexes bytes, such as an mmap of the source file, in place. Number and
+        # string values are left in data and decoded when read, and the
+        # source's text is data itself; only identifiers are decoded here, to
+        # look them up in the symbol table.
+        self.error = None
+        self.source = Source(self.fn, MappedText(data))
+        tokens = MappedTokenBuffer(self.source, data)
+        append, append_mapped = tokens.append, tokens.append_mapped
+        match = MASTER_BYTES_PATTERN.match
+        size = len(data)
+        idx = 0
+        prev_type = prev_value = None
+
+        while idx < size:
+            m = match(data, idx)
+            lexeme_end = m.end()
+            kind = m.lastgroup
+            if kind == 'SKIP' or kind == 'COMMENT':
+                idx = lexeme_end
+                continue
+
+            if kind in OPERATOR_KINDS:
+                append(kind, None, idx, lexeme_end)
+                prev_type, prev_value = kind, None
+            elif kind == 'NAME':
+                if prev_value is MAPPED:
+                    # A new symbol records the token before it, so a value
+                    # left in data is needed after all.
+                    prev_value = tokens.value_at(len(tokens) - 1)
+                tok_type, value = self.classify_identifier(m.group().decode('ascii'), prev_type, prev_value)
+                append(tok_type, value, idx, lexeme_end)
+                prev_type, prev_value = tok_type, value
+            elif kind == 'NUMBER' or kind == 'STRING':
+                if kind == 'STRING':
+                    tok_type = TT_STRING
+                    if m.group('STRING_END') is None: tokens.open_string = len(tokens)
+                else:
+                    tok_type = TT_FLOAT if b'.' in m.group() else TT_INT
+                append_mapped(tok_type, idx, lexeme_end)
+                prev_type, prev_value = tok_type, MAPPED
+            elif kind == 'DOT':
+                append(TT_KEYWORD, ".", idx, lexeme_end)
+                prev_type, prev_value = TT_KEYWORD, "."
+            else:
+                pos_start = Position(idx, self.source)
+                pos_end = Position(lexeme_end, self.source)
+                self.error = IllegalCharError(pos_start, pos_end, "'" + m.group().decode('utf-8', 'replace') + "'")
+                break
+            idx = lexeme_end
+
+        append(TT_EOF, None, idx, idx + 1)
+        if self.error: return tokens, self.error
+        return tokens, None
+
+    def scan(self, file=None, chunk_size=CHUNK_SIZE, start=0, prev=None):
+        # Returns an iterator of (type, value, start, end) for every token,
+        # reading from file in chunk_size pieces when one is given and from
+        # self.text otherwise. A file's text is never held whole, so its line
+        # starts are recorded into self.source as the chunks go by.
+        #
+        # Scanning text can also resume at start, which must be the end of a
+        # token (or 0); prev is the token that ended there.
+        self.error = None
+        if file is not None:
+            self.source = Source(self.fn, None, array('q', [0]))
+        return self.scan_chunks(file, chunk_size, start, prev)
+
+    def scan_chunks(self, file, chunk_size, start=0, prev=None):
+        # On an illegal character this sets self.error and ends the stream
+        # with an EOF token.
+        #
+        # A lexeme that runs into the end of the buffer may continue in the
+        # next chunk, so it is matched again once more input has been read.
+        # No pattern in TOKEN_SPEC needs more than that to decide a match.
+        match = MASTER_PATTERN.match
+        if file is None:
+            buffer, eof, line_starts = self.text, True, None
+        else:
+            buffer, eof, line_starts = '', False, self.source.line_starts
+        base = 0
+        idx = start
+        prev_type, prev_value = (prev.type, prev.value) if prev else (None, None)
+        need_input = not eof
+
+        while True:
+            if need_input:
+                need_input = False
+                chunk = file.read(chunk_size)
+                if chunk:
+                    buffer = buffer[idx:] + chunk
+                    base += idx
+                    idx = 0
+                else:
+                    eof = True
+            if idx == len(buffer):
+                if eof: break
+                need_input = True
+                continue
+
+            m = match(buffer, idx)
+            lexeme_end = m.end()
+            if lexeme_end == len(buffer) and not eof:
+                need_input = True
+                continue
+            kind = m.lastgroup
+
+            if kind == 'SKIP' or kind == 'COMMENT' or kind == 'STRING':
+                if line_starts is not None:
+                    newline = buffer.find('\n', idx, lexeme_end)
+                    while newline >= 0:
+                        line_starts.append(base + newline + 1)
+                        newline = buffer.find('\n', newline + 1, lexeme_end)
+                if kind != 'STRING':
+                    idx = lexeme_end
+                    continue
+
+            if kind in OPERATOR_KINDS:
+                tok_type, value = kind, None
+            elif kind == 'NAME':
+                tok_type, value = self.classify_identifier(m.group(), prev_type, prev_value)
+            elif kind == 'NUMBER':
+                value = m.group()
+                if '.' in value:
+                    tok_type, value = TT_FLOAT, float(value)
+                else:
+                    tok_type, value = TT_INT, int(value)
+            elif kind == 'STRING':
+                body = m.group()[1:-1] if m.group('STRING_END') else m.group()[1:]
+                tok_type, value = TT_STRING, decode_string(body)
+            elif kind == 'DOT':
+                tok_type, value = TT_KEYWORD, "."
+            else:
+                pos_start = Position(base + idx, self.source)
+                pos_end = Position(base + lexeme_end, self.source)
+                self.error = IllegalCharError(pos_start, pos_end, "'" + m.group() + "'")
+                break
+            yield tok_type, value, base + idx, base + lexeme_end
+            prev_type, prev_value = tok_type, value
+            idx = lexeme_end
+
+        yield TT_EOF, None, base + idx, base + idx + 1
+
     def make_number(self):
         num_str = ''
         dot_count = 0
-        pos_start = self.pos.copy()
+        start = self.idx
 
-        while self.current_char != None and self.current_char in DIGITS + '.':
+        while self.current_char != None and self.current_char in NUMBER_CHARS:
             if self.current_char == '.':
                 if dot_count == 1: break
                 dot_count += 1
@@ -117,60 +340,64 @@ class Lexer:
             self.advance()
 
         if dot_count == 0:
-            return Token(TT_INT, int(num_str), pos_start, self.pos)
+            return Token(TT_INT, int(num_str), start, self.idx, self.source)
         else:
-            return Token(TT_FLOAT, float(num_str), pos_start, self.pos)
+            return Token(TT_FLOAT, float(num_str), start, self.idx, self.source)
 
     def make_identifier(self, t=None):
         id_str = ''
-        pos_start = self.pos
+        start = self.idx
 
-        while self.current_char != None and self.current_char in LETTERS_DIGITS + "_":
+        while self.current_char != None and self.current_char in IDENTIFIER_CHARS:
             id_str += self.current_char
             self.advance()
-        if id_str in KEYWORDS:
-            tok_type = TT_KEYWORD
+        if t == None:
+            tok_type, value = self.classify_identifier(id_str)
         else:
-            tok_type = TT_IDENTIFIER
-            if id_str in symbolTable:
-                id_str = symbolTable[id_str]["location"]
+            tok_type, value = self.classify_identifier(id_str, t.type, t.value)
+
+        return Token(tok_type, value, start, self.idx, self.source)
+
+    def classify_identifier(self, id_str, prev_type=None, prev_value=None):
+        # prev_type and prev_value describe the token before the identifier,
+        # which a new symbol table entry records as its data type.
+        symbol_table = self.symbol_table
+        if symbol_table.is_keyword(id_str):
+            return TT_KEYWORD, id_str
+
+        # The value is the name's location, the same for every occurrence.
+        entry = symbol_table.lookup(id_str)
+        if entry is None:
+            if prev_type == None:
+                entry = symbol_table.define(id_str)
             else:
-                if t == None:
-                    symbolTable[id_str] = {"name":id_str, "location":len(symbolTable), "address":hex(id(id_str)), "dataType":"Initial"}
-                else:
-                    symbolTable[id_str] = {"name":id_str, "location":len(symbolTable), "address":hex(id(id_str)), "dataType":t}
-                id_str = len(symbolTable)
-        
-        return Token(tok_type, id_str, pos_start, self.pos)
+                entry = symbol_table.define(id_str, Token(prev_type, prev_value))
+        return TT_IDENTIFIER, entry["location"]
 
     def make_string(self):
         string = ''
-        pos_start = self.pos.copy()
+        start = self.idx
         escape_character = False
         self.advance()
 
-        escape_characters = {
-            'n': '\n',
-            't': '\t'
-        }
-
         while self.current_char != None and (self.current_char != '"' or escape_character):
             if escape_character:
-                string += escape_characters.get(self.current_char, self.current_char)
+                string += ESCAPE_CHARACTERS.get(self.current_char, self.current_char)
+                escape_character = False
             else:
                 if self.current_char == '\\':
                     escape_character = True
                 else:
                     string += self.current_char
             self.advance()
-            escape_character = False
         
-        self.advance()
-        return Token(TT_STRING, string, pos_start, self.pos)
+        if self.current_char == '"':
+            self.advance()
+        return Token(TT_STRING, string, start, self.idx, self.source)
 
     def make_comment(self):
         string = ''
-        pos_start = self.pos.copy()
+        start = self.idx
         escape_character = False
         self.advance()
 
@@ -180,73 +407,137 @@ class Lexer:
             self.advance()
             escape_character = False
         
-        self.advance()
+        if self.current_char == '!':
+            self.advance()
         return None
+
     def make_equals(self):
         tok_type = TT_EQ
-        
+        start = self.idx
         self.advance()
 
         if self.current_char == '=':
             self.advance()
             tok_type = TT_EQUAL_EQUAL
 
-        return Token(tok_type, pos_start=self.pos)
+        return Token(tok_type, None, start, self.idx, self.source)
 
     def make_less_than(self):
         tok_type = TT_LT
-        
+        start = self.idx
         self.advance()
 
         if self.current_char == '=':
             self.advance()
             tok_type = TT_LTE
 
-        return Token(tok_type, pos_start=self.pos)
+        return Token(tok_type, None, start, self.idx, self.source)
 
     def make_greater_than(self):
         tok_type = TT_GT
-        
+        start = self.idx
         self.advance()
 
         if self.current_char == '=':
             self.advance()
             tok_type = TT_GTE
 
-        return Token(tok_type, pos_start=self.pos)
+        return Token(tok_type, None, start, self.idx, self.source)
+
+def decode_string(body):
+    if '\\' not in body:
+        return body
+    return ESCAPE_PATTERN.sub(lambda m: ESCAPE_CHARACTERS.get(m.group(1), m.group(1)), body)
+
+#######################################
+# MAPPED TOKENS
+#######################################
+
+# Value id of a token whose value is decoded from its bytes when read.
+MAPPED = 0xFFFFFFFF
+
+class MappedTokenBuffer(TokenBuffer):
+    # A TokenBuffer lexed from bytes by Lexer.make_mapped_buffer. Numbers and
+    # strings keep only their offsets; their values are decoded from data on
+    # every read, which is rarer than lexing them for a large file.
+    def __init__(self, source, data):
+        super().__init__(source)
+        self.data = data
+        # Index of a string token left open at the end of the input, or -1.
+        self.open_string = -1
+
+    def append_mapped(self, tok_type, start, end):
+        self.types.append(TYPE_CODES[tok_type])
+        self.starts.append(start)
+        self.ends.append(end)
+        self.value_ids.append(MAPPED)
+
+    def value_at(self, index):
+        value_id = self.value_ids[index]
+        if value_id != MAPPED: return self.values[value_id]
+        lexeme = self.data[self.starts[index]:self.ends[index]]
+        tok_type = TOKEN_TYPES[self.types[index]]
+        if tok_type == TT_INT: return int(lexeme)
+        if tok_type == TT_FLOAT: return float(lexeme)
+        body = lexeme[1:] if index == self.open_string else lexeme[1:-1]
+        return decode_string(body.decode('utf-8', 'replace'))
 
 #######################################
 # NODES
 #######################################
+# Nodes keep only their tokens; positions are derived from them on demand,
+# from the first and last token of the node, found with a loop down its
+# leftmost or rightmost children so a deep tree does not recurse.
 class NumberNode:
     def __init__(self, tok):
         self.tok = tok
 
-        self.pos_start = self.tok.pos_start
-        self.pos_end = self.tok.pos_end
+    @property
+    def pos_start(self):
+        return self.tok.pos_start
+
+    @property
+    def pos_end(self):
+        return self.tok.pos_end
 
     def __repr__(self):
-        return f'{self.tok}'
+        return ''.join(repr_pieces(self))
 
 
 class NumberAccessNode:
     def __init__(self, Number_name_tok):
         self.Number_name_tok = Number_name_tok
+        # Variable slot, set by resolver.resolve.
+        self.slot = None
+
+    @property
+    def pos_start(self):
+        return self.Number_name_tok.pos_start
+
+    @property
+    def pos_end(self):
+        return self.Number_name_tok.pos_end
 
-        self.pos_start = self.Number_name_tok.pos_start
-        self.pos_end = self.Number_name_tok.pos_end
     def __repr__(self):
-        return f'{self.Number_name_tok}'
+        return ''.join(repr_pieces(self))
 
 class NumberAssignNode:
     def __init__(self, Number_name_tok, value_node):
         self.Number_name_tok = Number_name_tok
         self.value_node = value_node
+        # Variable slot, set by resolver.resolve.
+        self.slot = None
+
+    @property
+    def pos_start(self):
+        return self.Number_name_tok.pos_start
+
+    @property
+    def pos_end(self):
+        return last_token(self).pos_end
 
-        self.pos_start = self.Number_name_tok.pos_start
-        self.pos_end = self.value_node.pos_end
     def __repr__(self):
-        return f'{self.Number_name_tok} = {self.value_node}'
+        return ''.join(repr_pieces(self))
 
 class BinOpNode:
     def __init__(self, left_node, op_tok, right_node):
@@ -254,34 +545,145 @@ class BinOpNode:
         self.op_tok = op_tok
         self.right_node = right_node
 
-        self.pos_start = self.left_node.pos_start
-        self.pos_end = self.right_node.pos_end
+    @property
+    def pos_start(self):
+        return first_token(self).pos_start
+
+    @property
+    def pos_end(self):
+        return last_token(self).pos_end
 
     def __repr__(self):
-        return f'({self.left_node}, {self.op_tok}, {self.right_node})'
+        return ''.join(repr_pieces(self))
 class HeadNode:
     def __init__(self,left_node, op_tok, right_node):
         
         self.op_tok = op_tok
         self.left_node = left_node
         self.right_node = right_node
-        self.pos_start = self.op_tok.pos_start
-        self.pos_end = self.op_tok.pos_end
+
+    @property
+    def pos_start(self):
+        return self.op_tok.pos_start
+
+    @property
+    def pos_end(self):
+        return self.op_tok.pos_end
 
     def __repr__(self):
-        
-        return f'({self.left_node}) ({self.op_tok}) ({self.right_node})'
+        return ''.join(repr_pieces(self))
 
 class UnaryOpNode:
     def __init__(self, op_tok, node):
         self.op_tok = op_tok
         self.node = node
 
-        self.pos_start = self.op_tok.pos_start
-        self.pos_end = node.pos_end
+    @property
+    def pos_start(self):
+        return self.op_tok.pos_start
+
+    @property
+    def pos_end(self):
+        return last_token(self).pos_end
 
     def __repr__(self):
-        return f'({self.op_tok}, {self.node})'
+        return ''.join(repr_pieces(self))
+
+def name_of(tok):
+    # Identifier tokens carry their symbol table location rather than their
+    # name, so the name is read back from the source text when there is one.
+    pos_start = tok.pos_start
+    text = pos_start.ftxt
+    if text is None: return tok.value
+    return text[pos_start.idx:tok.pos_end.idx]
+
+def first_token(node):
+    while node.__class__ is BinOpNode: node = node.left_node
+    return token_of(node)
+
+def last_token(node):
+    while True:
+        node_type = node.__class__
+        if node_type is BinOpNode: node = node.right_node
+        elif node_type is UnaryOpNode: node = node.node
+        elif node_type is NumberAssignNode: node = node.value_node
+        else: return token_of(node)
+
+def token_of(node):
+    # The token a node was made from: an operator's, or its number's or name's.
+    node_type = node.__class__
+    if node_type is NumberNode: return node.tok
+    if node_type is NumberAccessNode or node_type is NumberAssignNode: return node.Number_name_tok
+    return node.op_tok
+
+def line_of(tok):
+    # 0-based source line of a token, without building a Position.
+    source, idx = tok.source.resolve(tok.start)
+    return source.line_of(idx)
+
+def children(node):
+    node_type = node.__class__
+    if node_type is BinOpNode or node_type is HeadNode: return (node.left_node, node.right_node)
+    if node_type is UnaryOpNode: return (node.node,)
+    if node_type is NumberAssignNode: return (node.value_node,)
+    return ()
+
+def repr_pieces(node):
+    # The text of repr(node) in pieces, made with an explicit stack rather
+    # than by each node formatting its children, so a deep tree neither
+    # recurses nor copies its text once per level. main.py writes the
+    # pieces out as they come.
+    work = [node]
+    while work:
+        item = work.pop()
+        if item.__class__ is str:
+            yield item
+            continue
+        node_type = item.__class__
+        if node_type is BinOpNode:
+            work.extend((')', item.right_node, ', ', item.op_tok, ', ', item.left_node, '('))
+        elif node_type is HeadNode:
+            work.extend((')', item.right_node, ') (', item.op_tok, ') (', item.left_node, '('))
+        elif node_type is UnaryOpNode:
+            work.extend((')', item.node, ', ', item.op_tok, '('))
+        elif node_type is NumberAssignNode:
+            work.extend((item.value_node, ' = ', item.Number_name_tok))
+        elif node_type is NumberNode:
+            yield f'{item.tok}'
+        elif node_type is NumberAccessNode:
+            yield f'{item.Number_name_tok}'
+        else:
+            yield f'{item}'
+
+def count_nodes(node):
+    # Nodes in the tree, counting a shared node each time it is reached.
+    count = 0
+    work = [node]
+    while work:
+        node = work.pop()
+        if node is None: continue
+        count += 1
+        work.extend(children(node))
+    return count
+
+# The nodes a backend computes once into a temporary when they are shared.
+OPERATOR_NODES = (BinOpNode, UnaryOpNode)
+
+def shared_nodes(node, types=None):
+    # Ids of nodes reached more than once, as in the DAG left by optimizer's
+    # common subexpression pass; only those of the classes in types, if given.
+    seen = set()
+    shared = set()
+    work = [node]
+    while work:
+        current = work.pop()
+        if current is None: continue
+        if id(current) in seen:
+            if types is None or current.__class__ in types: shared.add(id(current))
+            continue
+        seen.add(id(current))
+        work.extend(children(current))
+    return shared
 
 #######################################
 # PARSE RESULT
@@ -314,20 +716,47 @@ class ParseResult:
 # PARSER
 #######################################
 
+# How tightly each binary operator binds; all are left associative.
+BINDING_POWERS = {
+    TT_EQUAL_EQUAL: 10, TT_NE: 10, TT_LT: 10, TT_GT: 10, TT_LTE: 10, TT_GTE: 10,
+    TT_PLUS: 20, TT_MINUS: 20,
+    TT_MUL: 30, TT_DIV: 30,
+}
+UNARY_OPERATORS = (TT_PLUS, TT_MINUS)
+
+# Kinds of entry on the operator stack of Parser.expr.
+EXPR_BINARY = 0
+EXPR_UNARY = 1
+EXPR_PAREN = 2
+EXPR_ASSIGN = 3
+
 class Parser:
+    # Sections are parsed in place as index ranges of the one token sequence.
+    # The parser never reads past self.stop, the index of the token that
+    # ends the current range: the next section keyword, or EOF.
+    # parse_results counts the ParseResults this parser built, for run_stats.
+    parse_results = 0
+
     def __init__(self, tokens):
         self.tokens = tokens
         self.tok_idx = -1
+        self.stop = len(tokens) - 1
         self.advance()
 
     def advance(self, ):
         self.tok_idx += 1
-        if self.tok_idx < len(self.tokens):
+        if self.tok_idx <= self.stop:
             self.current_tok = self.tokens[self.tok_idx]
         return self.current_tok
 
-    def parse(self):
-        res = self.head()
+    def peek(self):
+        # The token after the current one, without moving.
+        if self.tok_idx < self.stop: return self.tokens[self.tok_idx + 1]
+        return self.current_tok
+
+    def parse(self, sections=None):
+        # sections is section_bounds(), if the caller has found them already.
+        res = self.head(sections)
         res.register_advancement()
         self.advance()
 
@@ -337,6 +766,7 @@ class Parser:
     ###################################
     def atom(self):
         res = ParseResult()
+        self.parse_results += 1
         tok = self.current_tok
 
         if tok.type in (TT_INT, TT_FLOAT):
@@ -369,140 +799,314 @@ class Parser:
             "Expected int, float, identifier, '+', '-' or '('"
         ))
 
-    def factor(self):
+    def head(self, sections=None):
         res = ParseResult()
-        tok = self.current_tok
-
-        if tok.type in (TT_PLUS, TT_MINUS):
-            res.register_advancement()
-            self.advance()
-            factor = res.register(self.factor())
-            if res.error: return res
-            return res.success(UnaryOpNode(tok, factor))
-        
-        elif tok.type in (TT_INT, TT_FLOAT):
-            res.register_advancement()
-            self.advance()
-            return res.success(NumberNode(tok))
-
-        elif tok.type == TT_LEFT_PARENTHESIS:
-            res.register_advancement()
-            self.advance()
-            expr = res.register(self.expr())
-            if res.error: return res
-            if self.current_tok.type == TT_RIGHT_PARENTHESIS:
-                res.register(self.advance())
-                return res.success(expr)
-            else:
-                return res.failure(InvalidSyntaxError(
+        self.parse_results += 1
+        if sections is None: sections = self.section_bounds()
+        if self.current_tok.getValue() != "HEAD":
+            return res.failure(InvalidSyntaxError(
                     self.current_tok.pos_start, self.current_tok.pos_end,
-                    "Expected ')'"
+                    "Expected 'HEAD'"
                 ))
 
-        return res.failure(InvalidSyntaxError(
-            tok.pos_start, tok.pos_end,
-            "Expected int or float"
-        ))
-
-    def term(self):
-        return self.bin_op(self.factor, (TT_MUL, TT_DIV))
-   
-    def head(self):
-        res = ParseResult()
-        if self.current_tok.getValue() == "HEAD":
-            headStr = self.current_tok
-            if res.error: 
-                return res
-            res.register_advancement()
-            self.advance()
-            left_node = None
-            right_node = None
-            body = None
-            if self.current_tok.getValue() != None:
-                newTokens = []
-                bodyIndex = None
-                for index, token in enumerate(self.tokens):
-                    if token.getValue() == "BODY":
-                        body = self.tokens[index + 1:]
-                        bodyIndex = index
-                        break
-                    else:
-                        newTokens.append(token)
-                self.tokens = newTokens[:]
-                left_node = res.register(self.expr())
-                
-                self.tokens = body[:]
-                res.register_advancement()
-                self.advance()
-                
-                right_node = res.register(self.expr())
-            return res.success(HeadNode(left_node, headStr, right_node))
+        headStr = self.current_tok
+        left_node = self.section(res, *sections[0])
+        if res.error: return res
 
+        right_node = None
+        if len(sections) > 1:
+            right_node = self.section(res, *sections[1])
+            if res.error: return res
+        return res.success(HeadNode(left_node, headStr, right_node))
+
+    def section_bounds(self):
+        # (keyword index, stop index) of every section, found in one pass. The
+        # first section starts the program and each BODY keyword starts
+        # another; a section runs up to the next, the last one to EOF.
+        starts = [0]
+        tokens = self.tokens
+        if isinstance(tokens, TokenBuffer):
+            stop = tokens.find(TT_EOF)
+            body = tokens.find(TT_KEYWORD, "BODY", 1)
+            while 0 < body < stop:
+                starts.append(body)
+                body = tokens.find(TT_KEYWORD, "BODY", body + 1)
         else:
-            return res.failure(InvalidSyntaxError(
-                    self.current_tok.pos_start, self.current_tok.pos_end,
-                    "Expected 'HEAD'"
-                ))
+            stop = len(tokens) - 1
+            for index, tok in enumerate(tokens):
+                if tok.type == TT_KEYWORD and tok.value == "BODY" and index > 0:
+                    starts.append(index)
+                elif tok.type == TT_EOF:
+                    stop = index
+                    break
+        return [(start, starts[i + 1] if i + 1 < len(starts) else stop) for i, start in enumerate(starts)]
+
+    def section(self, res, start, stop):
+        # Parses the first statement of the section whose keyword is at start;
+        # the rest of the section is not part of the AST.
+        self.tok_idx = start
+        self.stop = stop
+        res.register_advancement()
+        self.advance()
+        if self.tok_idx >= stop: return None
+        return res.register(self.expr())
 
     def expr(self):
+        # Operator precedence parsing with explicit stacks, so nesting depth
+        # is bounded by memory rather than the recursion limit. ops holds
+        # pending operators and the markers that open a nested expression:
+        # an assignment's '=' or a '('. An identifier starts an assignment
+        # when '=' follows it, and is read as an operand otherwise.
         res = ParseResult()
+        self.parse_results += 1
+        values = []
+        ops = []
+        advance = self.advance
+        at_expr_start = True
+        tok = self.current_tok
 
-        if self.current_tok.matches("IDENTIFIER"):
-            Number_name = self.current_tok
-            res.register_advancement()
-            self.advance()
+        while True:
+            if at_expr_start:
+                if tok.type == TT_IDENTIFIER and self.peek().type == TT_EQ:
+                    ops.append((EXPR_ASSIGN, tok))
+                    advance()
+                    res.advance_count += 2
+                    tok = advance()
+                    continue
+                first = True
+                at_expr_start = False
+
+            # Operand: any unary operators, then a number, identifier or '('.
+            while tok.type in UNARY_OPERATORS:
+                ops.append((EXPR_UNARY, tok))
+                res.advance_count += 1
+                tok = advance()
+                first = False
+            if tok.type in (TT_INT, TT_FLOAT):
+                values.append(NumberNode(tok))
+            elif tok.type == TT_IDENTIFIER:
+                values.append(NumberAccessNode(tok))
+            elif tok.type == TT_LEFT_PARENTHESIS:
+                ops.append((EXPR_PAREN, tok))
+                res.advance_count += 1
+                tok = advance()
+                at_expr_start = True
+                continue
+            elif first:
+                # Nothing of this expression was read yet.
+                return res.failure(InvalidSyntaxError(tok.pos_start, tok.pos_end,
+                    "Expected 'Number', int, float, identifier, '+', '-' or '('"))
+            else:
+                return res.failure(InvalidSyntaxError(tok.pos_start, tok.pos_end, "Expected int, float or identifier"))
+            res.advance_count += 1
+            tok = advance()
+
+            # Operator: reduce what binds at least as tightly, then continue
+            # with the next operand; or close the nested expressions that end
+            # here.
+            while True:
+                while ops and ops[-1][0] == EXPR_UNARY:
+                    values.append(UnaryOpNode(ops.pop()[1], values.pop()))
+                binding_power = BINDING_POWERS.get(tok.type)
+                while ops and ops[-1][0] == EXPR_BINARY and (binding_power is None or ops[-1][2] >= binding_power):
+                    right = values.pop()
+                    values.append(BinOpNode(values.pop(), ops.pop()[1], right))
+                if binding_power is not None:
+                    ops.append((EXPR_BINARY, tok, binding_power))
+                    res.advance_count += 1
+                    tok = advance()
+                    first = False
+                    break
+
+                while ops and ops[-1][0] == EXPR_ASSIGN:
+                    values.append(NumberAssignNode(ops.pop()[1], values.pop()))
+                if not ops:
+                    return res.success(values.pop())
+                # Only a '(' is left on top.
+                if tok.type != TT_RIGHT_PARENTHESIS:
+                    return res.failure(InvalidSyntaxError(tok.pos_start, tok.pos_end, "Expected ')'"))
+                ops.pop()
+                res.advance_count += 1
+                tok = advance()
+
+class TokenStream:
+    # Pulls tokens from an iterator on demand. Only the tokens peeked at but
+    # not yet consumed are held, never the whole token list. Like a token
+    # list, the iterator must end with an EOF token, which is then repeated.
+    def __init__(self, tokens):
+        self.tokens = iter(tokens)
+        self.window = deque()
+        self.last = None
+
+    def peek(self, offset=0):
+        while len(self.window) <= offset:
+            tok = next(self.tokens, None)
+            if tok is None: return self.last
+            self.window.append(tok)
+            self.last = tok
+        return self.window[offset]
+
+    def next(self):
+        tok = self.peek()
+        if self.window: self.window.popleft()
+        return tok
+
+class StreamParser(Parser):
+    # Parser that pulls tokens lazily from a TokenStream, so memory is bounded
+    # by the lookahead window plus the AST rather than by the input size.
+    def __init__(self, tokens):
+        self.tokens = TokenStream(tokens)
+        self.tok_idx = -1
+        self.advance()
+
+    def advance(self, ):
+        self.tok_idx += 1
+        self.current_tok = self.tokens.next()
+        return self.current_tok
 
-            
+    def peek(self):
+        return self.tokens.peek()
 
-            if self.current_tok.type != TT_EQ:
-                return res.failure(InvalidSyntaxError(
+    def head(self, sections=None):
+        # Sections are found as the tokens arrive, so sections is unused.
+        res = ParseResult()
+        self.parse_results += 1
+        if not self.current_tok.matches(TT_KEYWORD) or self.current_tok.getValue() != "HEAD":
+            return res.failure(InvalidSyntaxError(
                     self.current_tok.pos_start, self.current_tok.pos_end,
-                    "Expected '='"
+                    "Expected 'HEAD'"
                 ))
 
+        headStr = self.current_tok
+        res.register_advancement()
+        self.advance()
+        left_node = self.section(res, "BODY")
+        if res.error: return res
+
+        right_node = None
+        if self.current_tok.matches(TT_KEYWORD) and self.current_tok.getValue() == "BODY":
             res.register_advancement()
             self.advance()
-            expr = res.register(self.expr())
+            right_node = self.section(res, "BODY")
             if res.error: return res
-            return res.success(NumberAssignNode(Number_name, expr))
-
-        node = res.register(self.bin_op(self.term, (TT_PLUS, TT_MINUS)))
 
-        if res.error:
-            return res.failure(InvalidSyntaxError(
-                self.current_tok.pos_start, self.current_tok.pos_end,
-                "Expected 'Number', int, float, identifier, '+', '-' or '('"
-            ))
-
-        return res.success(node)
-
-    ###################################
+        # Later sections are not part of the AST, but are still read so the
+        # lexer sees, and reports errors in, the whole input.
+        while self.current_tok.type != TT_EOF:
+            self.advance()
+        return res.success(HeadNode(left_node, headStr, right_node))
 
-    def bin_op(self, func, ops):
-        res = ParseResult()
-        left = res.register(func())
-        if res.error: return res
+    def section(self, res, end_keyword):
+        # Parses the first statement of a section and skips the rest of it,
+        # as Parser.head does by moving to the end of the section's range.
+        if self.at_section_end(end_keyword): return None
+        node = res.register(self.expr())
+        if res.error: return None
 
-        while self.current_tok.type in ops:
-            op_tok = self.current_tok
-            res.register_advancement()
+        while not self.at_section_end(end_keyword):
             self.advance()
-            right = res.register(func())
-            if res.error: return res
-            left = BinOpNode(left, op_tok, right)
+        return node
 
-        return res.success(left)
+    def at_section_end(self, end_keyword):
+        tok = self.current_tok
+        if tok.type == TT_EOF: return True
+        return tok.type == TT_KEYWORD and tok.value == end_keyword
 
 #######################################
 # RUN
 #######################################
 
-def run(fn, text):
-    lexer = Lexer(fn, text)
-    tokens, error = lexer.make_tokens()
-    if error:return None, error
-
-    #Generate AST
-    parser = Parser(tokens)
+def run(fn, text, engine='classic', cache=None, stats=None):
+    # cache is an optional compile_cache.CompileCache, and stats an optional
+    # run_stats.RunStats, filled in and published before returning.
+    return run_tokens(fn, text, engine, cache, stats)[1:]
+
+def run_tokens(fn, text, engine='classic', cache=None, stats=None):
+    # Like run, with the tokens the engine made, or the cache kept, first.
+    if stats is not None: start = time.perf_counter()
+
+    if cache is not None:
+        key = cache.key(text, engine)
+        entry = cache.get(key)
+        if entry is not None:
+            source, tokens, node, error, symbol_table = entry
+            source.fn = fn
+            if stats is not None:
+                stats.times['cache'] = time.perf_counter() - start
+                stats.count('cache hits')
+                record_stats(stats, tokens, node, symbol_table, 0, 0)
+            return tokens, node, error, symbol_table
+
+    # Positions are counted on this run's own source, and ParseResults on
+    # its parser, so runs on other threads are not counted with it.
+    lexer = Lexer(fn, text, source=CountingSource(fn, text) if stats is not None else None)
+    parser = None
+    if engine == 'regex':
+        tokens, error = lexer.scan_tokens()
+    elif engine == 'buffer':
+        tokens, error = lexer.make_token_buffer()
+    else:
+        tokens, error = lexer.make_tokens()
+    if stats is not None:
+        lexed = time.perf_counter()
+        stats.times['lex'] = lexed - start
+    if error:
+        node = None
+    else:
+        #Generate AST
+        parser = Parser(tokens)
+        sections = parser.section_bounds()
+        if stats is not None:
+            sectioned = time.perf_counter()
+            stats.times['sections'] = sectioned - lexed
+        ast = parser.parse(sections)
+        node, error = ast.node, ast.error
+        if stats is not None:
+            stats.times['parse'] = time.perf_counter() - sectioned
+
+    if cache is not None:
+        cache.put(key, (lexer.source, tokens, node, error, lexer.symbol_table))
+    if stats is not None:
+        record_stats(stats, tokens, node, lexer.symbol_table, lexer.source.positions,
+            parser.parse_results if parser is not None else 0)
+    return tokens, node, error, lexer.symbol_table
+
+def record_stats(stats, tokens, node, symbol_table, positions, parse_results):
+    stats.count('tokens', len(tokens))
+    stats.count('positions', positions)
+    stats.count('parse results', parse_results)
+    stats.count('nodes', count_nodes(node))
+    stats.count('symbols', len(symbol_table))
+    stats.publish()
+
+def run_mapped(fn, path):
+    # Lexes and parses the file at path through a memory map instead of
+    # reading it into a str. The tokens and AST keep the map open.
+    with open(path, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+    lexer = Lexer(fn, '')
+    tokens, error = lexer.make_mapped_buffer(data)
+    if error: return None, error, lexer.symbol_table
+    ast = Parser(tokens).parse()
+    return ast.node, ast.error, lexer.symbol_table
+
+def run_stream(fn, file, chunk_size=CHUNK_SIZE):
+    start = file.tell() if file.seekable() else None
+    lexer = Lexer(fn, '')
+    tokens = lexer.iter_tokens(file, chunk_size)
+    parser = StreamParser(tokens)
     ast = parser.parse()
-    return ast.node, ast.error, symbolTable
\ No newline at end of file
+    if ast.error:
+        # The parser stopped early; the rest is still lexed, as run() does,
+        # so a lexer error and the symbol table cover the whole input.
+        for tok in tokens: pass
+    error = lexer.error or ast.error
+
+    if error and start is not None:
+        # A streamed source keeps no text; reload it so the error can still
+        # be shown with arrows.
+        file.seek(start)
+        lexer.source.load(file.read())
+    if error: return None, error, lexer.symbol_table
+    return ast.node, None, lexer.symbol_table
\ No newline at end of file
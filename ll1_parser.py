@@ -0,0 +1,555 @@
+import hashlib
+import os
+import pickle
+import re
+import tempfile
+from error import InvalidSyntaxError
+from keywords import KEYWORD_SET
+from lexer import Parser, ParseResult, Lexer, NumberNode, NumberAccessNode, NumberAssignNode, BinOpNode, UnaryOpNode
+from tokens import TOKEN_TYPES, TT_KEYWORD, TT_IDENTIFIER, TT_EQ, TT_EQUAL_EQUAL, TT_LEFT_PARENTHESIS, TT_RIGHT_PARENTHESIS, TT_EOF
+
+#######################################
+# LL(1) PARSER
+#######################################
+# A parser generated from grammar.txt. The grammar's EBNF is rewritten into
+# plain productions, FIRST and FOLLOW sets give a prediction table, and a
+# loop with an explicit symbol stack parses by looking the next token up in
+# the table: one step per symbol, no backtracking, no recursion.
+#
+# Rewriting the grammar:
+#
+#   ( a | b )   a new nonterminal with the alternatives a and b
+#   ( a )*      a new nonterminal R : a R | (empty)
+#
+# A cell of the table that two productions claim is split on the token
+# after next, as Parser.expr does with peek() to tell an assignment from an
+# expression; a grammar that still conflicts is rejected. A nonterminal
+# that can derive nothing does so on any token its row does not have, so a
+# parse stops at the first token that cannot continue it, as Parser.expr
+# does.
+#
+# The table is plain data. It is pickled under __pycache__ next to the
+# grammar, keyed by a hash of the grammar text, and rebuilt only when the
+# grammar changes.
+#
+# Nodes are built as productions complete: each production of a grammar
+# rule passes the values of its symbols, tokens for terminals, to the
+# rule's entry in ACTIONS.
+
+GRAMMAR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'grammar.txt')
+TABLE_VERSION = 1
+
+# Grammar names of token types whose names differ; every other terminal is
+# a token type or a keyword.
+TERMINAL_TYPES = {
+    'EQ': TT_EQ,
+    'EE': TT_EQUAL_EQUAL,
+    'LPAREN': TT_LEFT_PARENTHESIS,
+    'RPAREN': TT_RIGHT_PARENTHESIS,
+}
+END = 'EOF'
+
+# How terminals are named in errors, in the order they are listed.
+DISPLAY_NAMES = {
+    'INT': 'int', 'FLOAT': 'float', 'IDENTIFIER': 'identifier',
+    'PLUS': "'+'", 'MINUS': "'-'", 'LPAREN': "'('", 'RPAREN': "')'",
+    'MUL': "'*'", 'DIV': "'/'", 'EQ': "'='", 'EE': "'=='", 'NE': "'!='",
+    'LT': "'<'", 'GT': "'>'", 'LTE': "'<='", 'GTE': "'>='",
+}
+
+# Kinds of production.
+RULE = 0
+GROUP = 1
+STAR = 2
+
+class GrammarError(ValueError):
+    pass
+
+#######################################
+# GRAMMAR
+#######################################
+
+GRAMMAR_TOKEN = re.compile(r'\s*(?:([A-Za-z_]\w*)|([():|*]))')
+
+def read_grammar(text):
+    # {rule: [alternative, ...]} in file order. An alternative is a list of
+    # items: ('name', name), or ('group', alternatives, starred).
+    rules = {}
+    current = None
+    for number, line in enumerate(text.splitlines(), 1):
+        if not line.strip(): continue
+        tokens = []
+        pos = 0
+        while pos < len(line.rstrip()):
+            m = GRAMMAR_TOKEN.match(line, pos)
+            if m is None: raise GrammarError(f'line {number}: unexpected {line[pos:].strip()[:1]!r}')
+            tokens.append(m.group(1) or m.group(2))
+            pos = m.end()
+        if tokens[0] != ':':
+            if len(tokens) < 2 or tokens[1] != ':': raise GrammarError(f"line {number}: expected 'name :'")
+            current = tokens[0]
+            if current in rules: raise GrammarError(f'line {number}: {current} is defined twice')
+            rules[current] = []
+            tokens = tokens[2:]
+        elif current is None:
+            raise GrammarError(f'line {number}: alternative before any rule')
+        else:
+            tokens = tokens[1:]
+
+        alternatives, end = read_alternatives(tokens, 0, number)
+        if end != len(tokens): raise GrammarError(f"line {number}: unmatched ')'")
+        rules[current].extend(alternatives)
+    return rules
+
+def read_alternatives(tokens, pos, number):
+    # Alternatives separated by '|', up to a ')' or the end of the line.
+    alternatives = [[]]
+    while pos < len(tokens) and tokens[pos] != ')':
+        tok = tokens[pos]
+        if tok == '|':
+            alternatives.append([])
+            pos += 1
+        elif tok == '(':
+            group, pos = read_alternatives(tokens, pos + 1, number)
+            if pos == len(tokens): raise GrammarError(f"line {number}: expected ')'")
+            pos += 1
+            starred = pos < len(tokens) and tokens[pos] == '*'
+            if starred: pos += 1
+            alternatives[-1].append(('group', group, starred))
+        elif tok in (':', '*'):
+            raise GrammarError(f'line {number}: unexpected {tok!r}')
+        else:
+            alternatives[-1].append(('name', tok))
+            pos += 1
+    return alternatives, pos
+
+#######################################
+# TABLE GENERATION
+#######################################
+
+class Grammar:
+    # Plain productions, with symbols as ints: terminals first, then
+    # nonterminals.
+    def __init__(self, rules):
+        self.terminals = [END]
+        self.nonterminals = list(rules)
+        names = set(rules)
+        for alternatives in rules.values():
+            for name in item_names(alternatives):
+                if name not in names and name not in self.terminals:
+                    terminal_type(name)
+                    self.terminals.append(name)
+        # (lhs, rhs, kind, rule name) for every production.
+        self.productions = []
+        self.rules = rules
+        for rule in rules:
+            for alternative in rules[rule]:
+                self.add(rule, self.lower(rule, alternative), RULE)
+
+    def symbol(self, name):
+        if name in self.terminals: return self.terminals.index(name)
+        return len(self.terminals) + self.nonterminals.index(name)
+
+    def new_nonterminal(self, rule):
+        name = f'{rule}.{len(self.nonterminals)}'
+        self.nonterminals.append(name)
+        return name
+
+    def lower(self, rule, alternative):
+        rhs = []
+        for item in alternative:
+            if item[0] == 'name':
+                rhs.append(self.symbol(item[1]))
+                continue
+            alternatives, starred = item[1], item[2]
+            name = self.new_nonterminal(rule)
+            for group_alternative in alternatives:
+                group_rhs = self.lower(rule, group_alternative)
+                if starred:
+                    self.add(name, group_rhs + [self.symbol(name)], STAR)
+                else:
+                    self.add(name, group_rhs, GROUP)
+            if starred: self.add(name, [], STAR)
+            rhs.append(self.symbol(name))
+        return rhs
+
+    def add(self, lhs, rhs, kind):
+        self.productions.append((self.symbol(lhs), tuple(rhs), kind, lhs.split('.')[0]))
+
+    def sets(self):
+        # Nullable nonterminals, FIRST, FOLLOW and FIRST2 (strings of up to
+        # two terminals), each iterated to a fixed point.
+        terminal_count = len(self.terminals)
+        first = {symbol: {symbol} for symbol in range(terminal_count)}
+        first2 = {symbol: {(symbol,)} for symbol in range(terminal_count)}
+        follow = {}
+        nullable = set()
+        for index in range(len(self.nonterminals)):
+            symbol = terminal_count + index
+            first[symbol] = set()
+            first2[symbol] = set()
+            follow[symbol] = set()
+        follow[terminal_count].add(0)
+
+        changed = True
+        while changed:
+            changed = False
+            for lhs, rhs, kind, rule in self.productions:
+                if lhs not in nullable and all(symbol in nullable for symbol in rhs):
+                    nullable.add(lhs)
+                    changed = True
+                for symbol in rhs:
+                    if not first[symbol] <= first[lhs]:
+                        first[lhs] |= first[symbol]
+                        changed = True
+                    if symbol not in nullable: break
+                strings = self.first2_of(rhs, first2)
+                if not strings <= first2[lhs]:
+                    first2[lhs] |= strings
+                    changed = True
+                for index, symbol in enumerate(rhs):
+                    if symbol < terminal_count: continue
+                    rest = rhs[index + 1:]
+                    after = self.first_of(rest, first, nullable)
+                    if all(other in nullable for other in rest): after = after | follow[lhs]
+                    if not after <= follow[symbol]:
+                        follow[symbol] |= after
+                        changed = True
+        return nullable, first, follow, first2
+
+    def first_of(self, rhs, first, nullable):
+        result = set()
+        for symbol in rhs:
+            result |= first[symbol]
+            if symbol not in nullable: break
+        return result
+
+    def first2_of(self, rhs, first2):
+        strings = {()}
+        for symbol in rhs:
+            strings = {string if len(string) == 2 else (string + more)[:2]
+                for string in strings for more in (first2[symbol] if len(string) < 2 else ((),))}
+        return strings
+
+    def table(self):
+        # One row per nonterminal mapping a terminal to a production, or to
+        # (productions by the terminal after it, production for any other).
+        # defaults holds the empty production of each nullable nonterminal.
+        nullable, first, follow, first2 = self.sets()
+        terminal_count = len(self.terminals)
+        claims = [{} for name in self.nonterminals]
+        defaults = [None] * len(self.nonterminals)
+        for index, (lhs, rhs, kind, rule) in enumerate(self.productions):
+            row = claims[lhs - terminal_count]
+            lookahead = self.first_of(rhs, first, nullable)
+            if all(symbol in nullable for symbol in rhs):
+                lookahead = lookahead | follow[lhs]
+                if defaults[lhs - terminal_count] is not None: self.conflict(lhs, None)
+                defaults[lhs - terminal_count] = index
+            for terminal in lookahead:
+                row.setdefault(terminal, []).append(index)
+
+        rows = []
+        for row_index, row in enumerate(claims):
+            lhs = terminal_count + row_index
+            table_row = {}
+            for terminal, indices in row.items():
+                table_row[terminal] = indices[0] if len(indices) == 1 else self.split(lhs, terminal, indices, first2, follow)
+            rows.append(table_row)
+        return rows, defaults
+
+    def split(self, lhs, terminal, indices, first2, follow):
+        # Decides a shared cell on the terminal after next, with lhs standing
+        # for the terminals that may follow it. The one production that can
+        # derive terminal alone also takes any terminal the others do not.
+        by_second = {}
+        default = None
+        strings = dict(first2)
+        strings[lhs] = {(follower,) for follower in follow[lhs]}
+        for index in indices:
+            rhs = self.productions[index][1]
+            for string in self.first2_of(rhs + (lhs,), strings):
+                if string[0] == terminal and len(string) == 2:
+                    if by_second.get(string[1], index) != index: self.conflict(lhs, terminal)
+                    by_second[string[1]] = index
+            if (terminal,) in self.first2_of(rhs, first2):
+                if default is not None: self.conflict(lhs, terminal)
+                default = index
+        return by_second, default
+
+    def conflict(self, lhs, terminal):
+        where = f' on {self.terminals[terminal]}' if terminal is not None else ''
+        raise GrammarError(f'{self.nonterminals[lhs - len(self.terminals)]} is ambiguous{where}')
+
+def build_table(text):
+    grammar = Grammar(read_grammar(text))
+    rows, defaults = grammar.table()
+    return {
+        'terminals': grammar.terminals,
+        'nonterminals': grammar.nonterminals,
+        'productions': grammar.productions,
+        'rows': rows,
+        'defaults': defaults,
+    }
+
+def item_names(alternatives):
+    for alternative in alternatives:
+        for item in alternative:
+            if item[0] == 'name': yield item[1]
+            else: yield from item_names(item[1])
+
+def terminal_type(name):
+    # (token type, keyword or None) a terminal matches.
+    if name in TERMINAL_TYPES: return TERMINAL_TYPES[name], None
+    if name in KEYWORD_SET: return TT_KEYWORD, name
+    if name in TOKEN_TYPES: return name, None
+    raise GrammarError(f'{name} is neither a rule, a token type nor a keyword')
+
+#######################################
+# TABLE CACHE
+#######################################
+
+def cache_path(grammar_path):
+    directory, name = os.path.split(grammar_path)
+    return os.path.join(directory, '__pycache__', name + '.ll1.pickle')
+
+def load_table(grammar_path=GRAMMAR_PATH):
+    with open(grammar_path, 'rb') as file:
+        text = file.read()
+    digest = hashlib.sha256(text + f'\0{TABLE_VERSION}'.encode()).hexdigest()
+    path = cache_path(grammar_path)
+    try:
+        with open(path, 'rb') as file:
+            cached_digest, table = pickle.load(file)
+        if cached_digest == digest: return table
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+        pass
+
+    table = build_table(text.decode('utf-8'))
+    # Written to a temporary file and renamed into place, as CompileCache
+    # does; a cache that cannot be written is only a slower startup.
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    except OSError:
+        return table
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            pickle.dump((digest, table), file, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except OSError:
+        try: os.unlink(tmp_path)
+        except OSError: pass
+    return table
+
+#######################################
+# ACTIONS
+#######################################
+
+def build_expr(values):
+    # IDENTIFIER EQ expr | comp
+    if len(values) == 3: return NumberAssignNode(values[0], values[2])
+    return values[0]
+
+def build_binary(values):
+    # operand (operator operand)*, left associative.
+    node = values[0]
+    for op_tok, right in values[1]:
+        node = BinOpNode(node, op_tok, right)
+    return node
+
+def build_factor(values):
+    # INT | FLOAT | IDENTIFIER | (PLUS|MINUS) factor | LPAREN expr RPAREN
+    if len(values) == 1:
+        tok = values[0]
+        if tok.type == TT_IDENTIFIER: return NumberAccessNode(tok)
+        return NumberNode(tok)
+    if len(values) == 2: return UnaryOpNode(values[0], values[1])
+    return values[1]
+
+# By rule name; a rule without one yields its single value, or the list of
+# its values.
+ACTIONS = {
+    'expr': build_expr,
+    'comp': build_binary,
+    'arith': build_binary,
+    'term': build_binary,
+    'factor': build_factor,
+}
+
+#######################################
+# TABLE PARSER
+#######################################
+
+class ParseTable:
+    def __init__(self, table):
+        self.terminals = table['terminals']
+        self.nonterminals = table['nonterminals']
+        self.productions = table['productions']
+        self.rows = table['rows']
+        self.defaults = table['defaults']
+        self.terminal_count = len(self.terminals)
+        # Terminal of each token type, and of each keyword a rule names.
+        self.type_terminals = {TT_EOF: 0}
+        self.keyword_terminals = {}
+        for terminal, name in enumerate(self.terminals[1:], 1):
+            tok_type, keyword = terminal_type(name)
+            if keyword is None: self.type_terminals[tok_type] = terminal
+            else: self.keyword_terminals[keyword] = terminal
+        # Per production: its symbols reversed, for pushing, how many
+        # values it takes and the function that makes them one, or None when
+        # it takes one value and leaves it as it is.
+        self.pushes = [tuple(reversed(rhs)) for lhs, rhs, kind, rule in self.productions]
+        self.lengths = [len(rhs) for lhs, rhs, kind, rule in self.productions]
+        star_symbols = {lhs for lhs, rhs, kind, rule in self.productions if kind == STAR}
+        self.reducers = [self.reducer(production, star_symbols) for production in self.productions]
+        # Per row, what a terminal pushes: its production, and then those
+        # of every nonterminal that production leaves on top, until a
+        # terminal is on top or a cell needs more than the one terminal.
+        self.expansions = [{terminal: self.expansion(production, terminal)
+            for terminal, production in row.items() if production.__class__ is int and self.lengths[production]}
+            for row in self.rows]
+
+    def expansion(self, production, terminal):
+        entries = []
+        while True:
+            if self.reducers[production] is not None: entries.append(~production)
+            entries.extend(self.pushes[production])
+            top = entries[-1]
+            if top < self.terminal_count: return tuple(entries)
+            production = self.rows[top - self.terminal_count].get(terminal)
+            if production.__class__ is not int or not self.lengths[production]: return tuple(entries)
+            entries.pop()
+
+    def reducer(self, production, star_symbols):
+        lhs, rhs, kind, rule = production
+        if kind == STAR:
+            if not rhs: return list
+            # The list is built from the last repetition back.
+            def append_item(values):
+                items = values.pop()
+                items.append(values[0] if len(values) == 1 else values)
+                return items
+            return append_item
+        if kind == GROUP:
+            if len(rhs) == 1: return None
+            return list
+
+        stars = tuple(index for index, symbol in enumerate(rhs) if symbol in star_symbols)
+        action = ACTIONS.get(rule)
+        if action is None:
+            if len(rhs) == 1 and not stars: return None
+            action = unwrap
+        if not stars: return action
+        def reduce(values):
+            # Lists of repetitions are put back in order.
+            for index in stars:
+                values[index].reverse()
+            return action(values)
+        return reduce
+
+    def terminal(self, tok):
+        # -1 for a token no rule names.
+        if tok.type == TT_KEYWORD: return self.keyword_terminals.get(tok.value, -1)
+        return self.type_terminals.get(tok.type, -1)
+
+    def symbol(self, name):
+        if name in self.terminals: return self.terminals.index(name)
+        return self.terminal_count + self.nonterminals.index(name)
+
+    def expected(self, symbol):
+        # 'Expected ...' for a token that cannot start symbol.
+        if symbol < self.terminal_count: names = [self.terminals[symbol]]
+        else: names = [self.terminals[terminal] for terminal in self.rows[symbol - self.terminal_count]]
+        order = list(DISPLAY_NAMES)
+        names.sort(key=lambda name: order.index(name) if name in DISPLAY_NAMES else len(order))
+        names = [DISPLAY_NAMES.get(name, f"'{name}'") for name in names]
+        if len(names) == 1: return f'Expected {names[0]}'
+        return f"Expected {', '.join(names[:-1])} or {names[-1]}"
+
+def unwrap(values):
+    return values[0] if len(values) == 1 else values
+
+TABLES = {}
+
+def parse_table(grammar_path=GRAMMAR_PATH):
+    table = TABLES.get(grammar_path)
+    if table is None: table = TABLES[grammar_path] = ParseTable(load_table(grammar_path))
+    return table
+
+class TableParser(Parser):
+    # Parses sections as Parser does, with each statement parsed from the
+    # table rather than by Parser.expr.
+    def __init__(self, tokens, table=None):
+        self.table = table or parse_table()
+        self.start = self.table.symbol('expr')
+        super().__init__(tokens)
+
+    def expr(self):
+        return self.parse_symbol(self.start)
+
+    def parse_symbol(self, start):
+        res = ParseResult()
+        self.parse_results += 1
+        table = self.table
+        terminal_count = table.terminal_count
+        rows, defaults, pushes, lengths, reducers = table.rows, table.defaults, table.pushes, table.lengths, table.reducers
+        expansions = table.expansions
+        terminal_of = table.terminal
+        keyword_terminal, type_terminal = table.keyword_terminals.get, table.type_terminals.get
+        advance = self.advance
+        tok = self.current_tok
+        terminal = terminal_of(tok)
+        values = []
+        # Symbols still to parse, and ~production for a production whose
+        # symbols have all been parsed.
+        stack = [start]
+        pop, push, extend = stack.pop, stack.append, stack.extend
+
+        while stack:
+            symbol = pop()
+            if symbol < 0:
+                production = ~symbol
+                count = lengths[production]
+                args = values[-count:]
+                del values[-count:]
+                values.append(reducers[production](args))
+            elif symbol < terminal_count:
+                if terminal != symbol:
+                    return res.failure(InvalidSyntaxError(tok.pos_start, tok.pos_end, table.expected(symbol)))
+                values.append(tok)
+                res.advance_count += 1
+                tok = advance()
+                tok_type = tok.type
+                terminal = keyword_terminal(tok.value, -1) if tok_type == TT_KEYWORD else type_terminal(tok_type, -1)
+            else:
+                row = symbol - terminal_count
+                expansion = expansions[row].get(terminal)
+                if expansion is not None:
+                    extend(expansion)
+                    continue
+                production = rows[row].get(terminal)
+                if production is None:
+                    production = defaults[row]
+                    if production is None:
+                        return res.failure(InvalidSyntaxError(tok.pos_start, tok.pos_end, table.expected(symbol)))
+                elif production.__class__ is tuple:
+                    by_second, default = production
+                    production = by_second.get(terminal_of(self.peek()), default)
+                    if production is None:
+                        return res.failure(InvalidSyntaxError(tok.pos_start, tok.pos_end, table.expected(symbol)))
+                if not lengths[production]:
+                    values.append(reducers[production]([]))
+                    continue
+                if reducers[production] is not None: push(~production)
+                extend(pushes[production])
+        return res.success(values.pop())
+
+def run_table(fn, text, engine='buffer'):
+    lexer = Lexer(fn, text)
+    if engine == 'regex': tokens, error = lexer.scan_tokens()
+    elif engine == 'buffer': tokens, error = lexer.make_token_buffer()
+    else: tokens, error = lexer.make_tokens()
+    if error: return None, error, lexer.symbol_table
+    ast = TableParser(tokens).parse()
+    return ast.node, ast.error, lexer.symbol_table
@@ -1,16 +1,104 @@
+import argparse
+import sys
+from contextlib import nullcontext
 import lexer
+import vm
+import pycodegen
+import profiler
+import type_inference
+import ast_serializer
+from optimizer import Optimizer
+from batch import run_many, BatchStats
+from run_stats import RunStats
+from compile_daemon import serve
 
-with open("program.txt") as file:  
-	data = file.read() 
-
-result, error, symbolTable = lexer.run('program', data)
-
-if error: print(error.as_string())
-else: 
-	print(result)
-
-if not error:
+def print_symbol_table(symbolTable):
 	print("\n\n Below is our Symbol Table \n\n")
 	print("Name\tAddress \t\tType\n")
 	for entry in symbolTable:
-		print(entry + "\t"+ str(symbolTable[entry]["address"]) + "\t" + str(symbolTable[entry]["dataType"]))
\ No newline at end of file
+		print(entry + "\t"+ str(symbolTable[entry]["address"]) + "\t" + str(symbolTable[entry]["dataType"]))
+
+def print_ast(node):
+	# Written in pieces, so a deep tree neither recurses nor is held whole.
+	sys.stdout.writelines(lexer.repr_pieces(node))
+	print()
+
+def dump_ast(node, path):
+	format = ast_serializer.JSONL if path.endswith('.jsonl') else ast_serializer.SEXPR
+	with open(path, 'w') as file:
+		ast_serializer.dump(node, file, format)
+
+def phase(stats, name):
+	return stats.phase(name) if stats is not None else nullcontext()
+
+def compile_program(execute=False, optimize=False, backend='vm', profile=False, dump_path=None, disassemble=False):
+	stats = None
+	if profile:
+		# Timed phases need lexing and parsing apart, so the file is read whole.
+		stats = RunStats()
+		with open("program.txt") as file:
+			result, error, symbolTable = lexer.run('program', file.read(), stats=stats)
+		print(stats)
+	else:
+		with open("program.txt") as file:  
+			result, error, symbolTable = lexer.run_stream('program', file)
+
+	if error: print(error.as_string())
+	else: 
+		print_ast(result)
+
+	if optimize and not error:
+		optimizer = Optimizer()
+		with phase(stats, 'optimize'):
+			result = optimizer.optimize(result)
+		print_ast(result)
+		print(optimizer)
+
+	if dump_path and not error: dump_ast(result, dump_path)
+
+	if disassemble and not error and result is not None:
+		print(vm.compile_node(result, symbolTable).disassemble())
+
+	if execute and not error:
+		line_profile = None
+		with phase(stats, 'execute'):
+			if backend == 'python': values, run_error = pycodegen.execute(result, 'program', symbolTable)
+			elif profile: values, run_error, line_profile = profiler.profile(result, 'program', symbolTable)
+			else: values, run_error = vm.execute(result, 'program', symbolTable)
+		if run_error: print(run_error.as_string())
+		else: print(values)
+		if line_profile is not None: print(f'\n{line_profile}')
+
+	if not error:
+		if result is not None: type_inference.infer(result, symbolTable)
+		print_symbol_table(symbolTable)
+
+	if stats is not None and (optimize or execute) and not error:
+		# The phases after run(), timed on the same stats.
+		print(f'\n{stats}')
+
+def compile_many(paths, workers):
+	stats = BatchStats()
+	for path, result, error, symbolTable in run_many(paths, workers):
+		stats.add(path, error)
+		if error: print(error.as_string())
+		else: print(f'{path}: {len(symbolTable)} symbols')
+	print(f'\n{stats}')
+
+if __name__ == '__main__':
+	arg_parser = argparse.ArgumentParser(description='Compile program.txt, or many files across a process pool.')
+	arg_parser.add_argument('paths', nargs='*', help='source files to compile in parallel')
+	arg_parser.add_argument('--execute', action='store_true', help='run program.txt on the bytecode VM after compiling it')
+	arg_parser.add_argument('--backend', choices=('vm', 'python'), default='vm', help='what --execute runs the program on')
+	arg_parser.add_argument('--optimize', action='store_true', help='optimise program.txt and report node counts per pass')
+	arg_parser.add_argument('--profile', action='store_true', help='report time per phase and counters for program.txt, and time per source line when executed on the VM')
+	arg_parser.add_argument('--dump-ast', metavar='PATH', help='write the AST of program.txt to PATH, as JSON Lines for .jsonl and S-expressions otherwise')
+	arg_parser.add_argument('--disassemble', action='store_true', help='print the bytecode program.txt compiles to for the VM')
+	arg_parser.add_argument('--serve', metavar='SOCKET', help="run as a compile daemon on a Unix socket, or on stdin/stdout for '-'")
+	arg_parser.add_argument('--cache', metavar='DIRECTORY', help='compile cache the daemon keeps open')
+	arg_parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per core)')
+	args = arg_parser.parse_args()
+
+	if args.serve: serve(args.serve, args.workers, args.cache)
+	elif args.paths: compile_many(args.paths, args.workers)
+	else: compile_program(args.execute, args.optimize, args.backend, args.profile, args.dump_ast, args.disassemble)
\ No newline at end of file
@@ -0,0 +1,286 @@
+from array import array
+from lexer import NumberNode, NumberAccessNode, NumberAssignNode, BinOpNode, UnaryOpNode, HeadNode
+from tokens import TOKEN_TYPES, TYPE_CODES
+from token_buffer import TokenBuffer, TokenView
+
+#######################################
+# NODE ARENA
+#######################################
+# An AST stored column-wise, like TokenBuffer: one array entry per node for
+# its kind, operator type code, first and second child index and token
+# index, instead of a node object holding Token objects. The tokens go into
+# a TokenBuffer of the arena's own.
+#
+# Node views give the attribute API of the lexer's node classes, built on
+# access. The backends dispatch on the exact node class, so to run an
+# arena's program, to_tree() rebuilds node objects from it.
+#
+# A node reached twice, as in the DAG left by the optimiser, is stored once
+# and stays shared through to_tree().
+
+KIND_NUMBER = 0
+KIND_ACCESS = 1
+KIND_ASSIGN = 2
+KIND_BINOP = 3
+KIND_UNARY = 4
+KIND_HEAD = 5
+
+NO_NODE = -1
+
+class NodeArena:
+    def __init__(self, source):
+        self.tokens = TokenBuffer(source)
+        self.kinds = array('B')
+        # Type code of the operator token, or 0, so operators can be told
+        # apart without building a view of the token.
+        self.ops = array('B')
+        self.lefts = array('q')
+        self.rights = array('q')
+        self.toks = array('q')
+        self.root = NO_NODE
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def add(self, kind, tok, left=NO_NODE, right=NO_NODE, op=0):
+        self.kinds.append(kind)
+        self.ops.append(op)
+        self.lefts.append(left)
+        self.rights.append(right)
+        self.toks.append(self.add_token(tok))
+        return len(self.kinds) - 1
+
+    def add_token(self, tok):
+        if tok.__class__ is TokenView:
+            buffer, index = tok.buffer, tok.index
+            source = buffer.source
+            start, end = buffer.starts[index], buffer.ends[index]
+        else:
+            source, start, end = tok.source, tok.start, tok.end
+        # Positions into a TokenBlock (incremental.py) resolve to the
+        # program's source.
+        source, start = source.resolve(start)
+        end = source.resolve(end)[1]
+        if source is not self.tokens.source:
+            raise ValueError('nodes from more than one source')
+        self.tokens.append(tok.type, tok.value, start, end)
+        return len(self.tokens) - 1
+
+    def node(self, index):
+        if index == NO_NODE: return None
+        return VIEWS[self.kinds[index]](self, index)
+
+    def children(self, index):
+        kind = self.kinds[index]
+        if kind == KIND_BINOP or kind == KIND_HEAD: return (self.lefts[index], self.rights[index])
+        if kind == KIND_UNARY or kind == KIND_ASSIGN: return (self.lefts[index],)
+        return ()
+
+    def token(self, index):
+        return TokenView(self.tokens, self.toks[index])
+
+    def first_token(self, index):
+        # Leftmost token of a node, as lexer.first_token finds it.
+        kinds, lefts = self.kinds, self.lefts
+        while kinds[index] == KIND_BINOP: index = lefts[index]
+        return self.token(index)
+
+    def last_token(self, index):
+        kinds, lefts, rights = self.kinds, self.lefts, self.rights
+        while True:
+            kind = kinds[index]
+            if kind == KIND_BINOP: index = rights[index]
+            elif kind == KIND_UNARY or kind == KIND_ASSIGN: index = lefts[index]
+            else: return self.token(index)
+
+    def repr_pieces(self, index):
+        # The pieces of lexer.repr_pieces for the node at index, with an
+        # explicit stack over the arrays.
+        kinds, lefts, rights = self.kinds, self.lefts, self.rights
+        work = [index]
+        while work:
+            item = work.pop()
+            if item.__class__ is str:
+                yield item
+                continue
+            if item == NO_NODE:
+                yield 'None'
+                continue
+            kind = kinds[item]
+            tok = self.token(item)
+            if kind == KIND_BINOP:
+                work.extend((')', rights[item], ', ', f'{tok}', ', ', lefts[item], '('))
+            elif kind == KIND_HEAD:
+                work.extend((')', rights[item], ') (', f'{tok}', ') (', lefts[item], '('))
+            elif kind == KIND_UNARY:
+                work.extend((')', lefts[item], ', ', f'{tok}', '('))
+            elif kind == KIND_ASSIGN:
+                work.extend((lefts[item], ' = ', f'{tok}'))
+            else:
+                yield f'{tok}'
+
+    @property
+    def root_node(self):
+        return self.node(self.root)
+
+    def to_tree(self):
+        # Node objects for every node, children first; indices always point
+        # back to earlier nodes, so one forward pass is enough.
+        nodes = []
+        token = self.tokens.__getitem__
+        kinds, lefts, rights, toks = self.kinds, self.lefts, self.rights, self.toks
+        for index in range(len(kinds)):
+            kind = kinds[index]
+            tok = token(toks[index])
+            if kind == KIND_NUMBER: node = NumberNode(tok)
+            elif kind == KIND_ACCESS: node = NumberAccessNode(tok)
+            elif kind == KIND_ASSIGN: node = NumberAssignNode(tok, nodes[lefts[index]])
+            elif kind == KIND_BINOP: node = BinOpNode(nodes[lefts[index]], tok, nodes[rights[index]])
+            elif kind == KIND_UNARY: node = UnaryOpNode(tok, nodes[lefts[index]])
+            else:
+                left, right = lefts[index], rights[index]
+                node = HeadNode(nodes[left] if left != NO_NODE else None, tok, nodes[right] if right != NO_NODE else None)
+            nodes.append(node)
+        return nodes[self.root] if self.root != NO_NODE else None
+
+def from_tree(node):
+    # Walks the tree with an explicit stack, children before parents, as
+    # vm.Compiler does.
+    if node is None: return None
+    arena = None
+    indices = {}
+    work = [(node, False)]
+    while work:
+        current, done = work.pop()
+        if current is None or id(current) in indices: continue
+        node_type = current.__class__
+        if node_type is NumberNode:
+            tok = current.tok
+        elif node_type is NumberAccessNode or node_type is NumberAssignNode:
+            tok = current.Number_name_tok
+        else:
+            tok = current.op_tok
+
+        if arena is None:
+            source = tok.buffer.source if tok.__class__ is TokenView else tok.source
+            arena = NodeArena(source.resolve(0)[0])
+
+        if node_type is NumberNode:
+            index = arena.add(KIND_NUMBER, tok)
+        elif node_type is NumberAccessNode:
+            index = arena.add(KIND_ACCESS, tok)
+        elif not done:
+            work.append((current, True))
+            if node_type is UnaryOpNode:
+                work.append((current.node, False))
+            elif node_type is NumberAssignNode:
+                work.append((current.value_node, False))
+            elif node_type is BinOpNode or node_type is HeadNode:
+                work.append((current.right_node, False))
+                work.append((current.left_node, False))
+            else:
+                raise TypeError(f'cannot store {node_type.__name__}')
+            continue
+        elif node_type is NumberAssignNode:
+            index = arena.add(KIND_ASSIGN, tok, indices[id(current.value_node)])
+        elif node_type is UnaryOpNode:
+            index = arena.add(KIND_UNARY, tok, indices[id(current.node)], op=TYPE_CODES[tok.type])
+        else:
+            left = indices[id(current.left_node)] if current.left_node is not None else NO_NODE
+            right = indices[id(current.right_node)] if current.right_node is not None else NO_NODE
+            kind = KIND_BINOP if node_type is BinOpNode else KIND_HEAD
+            index = arena.add(kind, tok, left, right, TYPE_CODES[tok.type])
+        indices[id(current)] = index
+    arena.root = indices[id(node)]
+    return arena
+
+#######################################
+# NODE VIEWS
+#######################################
+
+class NodeView:
+    # A handle onto one node of a NodeArena.
+    __slots__ = ('arena', 'index')
+
+    def __init__(self, arena, index):
+        self.arena = arena
+        self.index = index
+
+    @property
+    def op_type(self):
+        code = self.arena.ops[self.index]
+        return TOKEN_TYPES[code] if code else None
+
+    def token(self):
+        return self.arena.token(self.index)
+
+    def child(self, column):
+        return self.arena.node(column[self.index])
+
+    @property
+    def pos_start(self):
+        return self.arena.first_token(self.index).pos_start
+
+    @property
+    def pos_end(self):
+        return self.arena.last_token(self.index).pos_end
+
+    def __repr__(self):
+        return ''.join(self.arena.repr_pieces(self.index))
+
+class NumberNodeView(NodeView):
+    __slots__ = ()
+
+    @property
+    def tok(self):
+        return self.token()
+
+class NumberAccessNodeView(NodeView):
+    __slots__ = ()
+
+    @property
+    def Number_name_tok(self):
+        return self.token()
+
+class NumberAssignNodeView(NodeView):
+    __slots__ = ()
+
+    @property
+    def Number_name_tok(self):
+        return self.token()
+
+    @property
+    def value_node(self):
+        return self.child(self.arena.lefts)
+
+class BinOpNodeView(NodeView):
+    __slots__ = ()
+
+    @property
+    def left_node(self):
+        return self.child(self.arena.lefts)
+
+    @property
+    def op_tok(self):
+        return self.token()
+
+    @property
+    def right_node(self):
+        return self.child(self.arena.rights)
+
+class HeadNodeView(BinOpNodeView):
+    __slots__ = ()
+
+class UnaryOpNodeView(NodeView):
+    __slots__ = ()
+
+    @property
+    def op_tok(self):
+        return self.token()
+
+    @property
+    def node(self):
+        return self.child(self.arena.lefts)
+
+# Indexed by kind.
+VIEWS = (NumberNodeView, NumberAccessNodeView, NumberAssignNodeView, BinOpNodeView, UnaryOpNodeView, HeadNodeView)
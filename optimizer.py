@@ -0,0 +1,210 @@
+from lexer import NumberNode, NumberAccessNode, NumberAssignNode, BinOpNode, UnaryOpNode, HeadNode, children
+from lex_token import Token
+from tokens import TT_INT, TT_FLOAT, TT_PLUS, TT_MINUS, TT_MUL, TT_DIV
+from vm import name_of, BINARY_OPS, COMPARISONS, OP_EQ
+
+#######################################
+# OPTIMISER
+#######################################
+# Rewrites a parsed AST before it reaches a backend. Every pass walks the
+# tree with an explicit stack, like vm.Compiler, since long operator
+# chains are deeper than the recursion limit. Nodes are never mutated; a
+# pass rebuilds only the nodes above a change.
+#
+# Common subexpression elimination runs last and leaves a DAG: equal
+# subtrees become one shared node, which vm.Compiler evaluates once.
+
+def with_children(node, new_children):
+    node_type = node.__class__
+    if node_type is BinOpNode: return BinOpNode(new_children[0], node.op_tok, new_children[1])
+    if node_type is HeadNode: return HeadNode(new_children[0], node.op_tok, new_children[1])
+    if node_type is UnaryOpNode: return UnaryOpNode(node.op_tok, new_children[0])
+    if node_type is NumberAssignNode:
+        rebuilt = NumberAssignNode(node.Number_name_tok, new_children[0])
+        rebuilt.slot = node.slot
+        return rebuilt
+    return node
+
+def walk(node):
+    # Yields every distinct node once, children before parents, in the order
+    # a backend evaluates them.
+    seen = set()
+    work = [(node, False)]
+    while work:
+        current, expanded = work.pop()
+        if current is None: continue
+        if not expanded:
+            if id(current) in seen: continue
+            seen.add(id(current))
+            kids = children(current)
+            if kids:
+                work.append((current, True))
+                for kid in reversed(kids):
+                    work.append((kid, False))
+                continue
+        yield current
+
+def transform(node, visit):
+    # Rebuilds node bottom-up. visit(original, rebuilt) is called once per
+    # distinct node, with rebuilt holding the already transformed children,
+    # and returns the node to use in its place.
+    if node is None: return None
+    done = {}
+    for current in walk(node):
+        kids = children(current)
+        rebuilt = current
+        if kids:
+            new_kids = tuple(None if kid is None else done[id(kid)] for kid in kids)
+            if any(new is not old for new, old in zip(new_kids, kids)):
+                rebuilt = with_children(current, new_kids)
+        done[id(current)] = visit(current, rebuilt)
+    return done[id(node)]
+
+def count_nodes(node):
+    return sum(1 for _ in walk(node))
+
+#######################################
+# CONSTANT FOLDING
+#######################################
+
+def number_node(value, node):
+    # A literal spanning the folded expression, so errors still point at it.
+    pos_start = node.pos_start
+    tok_type = TT_INT if value.__class__ is int else TT_FLOAT
+    return NumberNode(Token(tok_type, value, pos_start.idx, node.pos_end.idx, pos_start.source))
+
+def fold_node(original, node):
+    node_type = node.__class__
+    if node_type is BinOpNode:
+        left, right = node.left_node, node.right_node
+        if left.__class__ is not NumberNode or right.__class__ is not NumberNode: return node
+        a, b = left.tok.value, right.tok.value
+        op = node.op_tok.type
+        if op == TT_PLUS: return number_node(a + b, node)
+        if op == TT_MINUS: return number_node(a - b, node)
+        if op == TT_MUL: return number_node(a * b, node)
+        if op == TT_DIV:
+            # Left for the backend to report with the program's context.
+            if b == 0: return node
+            return number_node(a / b, node)
+        return number_node(1 if COMPARISONS[BINARY_OPS[op] - OP_EQ](a, b) else 0, node)
+
+    elif node_type is UnaryOpNode:
+        operand = node.node
+        if operand.__class__ is NumberNode:
+            value = operand.tok.value
+            return number_node(value if node.op_tok.type == TT_PLUS else -value, node)
+        if node.op_tok.type == TT_PLUS: return operand
+    return node
+
+def fold_constants(node):
+    return transform(node, fold_node)
+
+#######################################
+# DEAD STORES
+#######################################
+
+def eliminate_dead_stores(node):
+    # A store is dead when the next use of its name, in evaluation order, is
+    # another store. Its value stays, as the value of the expression and in
+    # case it raises. The last store to each name is always kept.
+    dead = set()
+    pending = {}
+    for current in walk(node):
+        node_type = current.__class__
+        if node_type is NumberAccessNode:
+            pending.pop(name_of(current.Number_name_tok), None)
+        elif node_type is NumberAssignNode:
+            name = name_of(current.Number_name_tok)
+            if name in pending: dead.add(id(pending[name]))
+            pending[name] = current
+    if not dead: return node
+
+    def visit(original, rebuilt):
+        if id(original) in dead: return rebuilt.value_node
+        return rebuilt
+    return transform(node, visit)
+
+#######################################
+# COMMON SUBEXPRESSIONS
+#######################################
+
+def eliminate_common_subexpressions(node):
+    # HEAD is evaluated, and may assign, before BODY, so each section shares
+    # only within itself.
+    if node.__class__ is HeadNode:
+        left_node = share_section(node.left_node)
+        right_node = share_section(node.right_node)
+        if left_node is node.left_node and right_node is node.right_node: return node
+        return HeadNode(left_node, node.op_tok, right_node)
+    return share_section(node)
+
+def share_section(node):
+    if node is None: return None
+    # With an assignment inside the expression a name can change value
+    # part way through, so reads of names are not shared.
+    assignments = sum(1 for current in walk(node) if current.__class__ is NumberAssignNode)
+    reads_stable = assignments <= (1 if node.__class__ is NumberAssignNode else 0)
+
+    # Value numbering: equal subtrees get the same number, and keys are built
+    # from the children's numbers so they stay flat however deep the
+    # expression is. Literals and names are numbered but not merged, which
+    # would buy nothing and lose their own positions for error messages.
+    numbers = {}
+    values = {}
+    shared = {}
+    def visit(original, rebuilt):
+        node_type = rebuilt.__class__
+        key = None
+        if node_type is NumberNode:
+            # repr keeps 0.0 and -0.0 apart.
+            key = ('n', rebuilt.tok.type, repr(rebuilt.tok.value))
+        elif node_type is NumberAccessNode:
+            if reads_stable: key = ('v', name_of(rebuilt.Number_name_tok))
+        elif node_type is BinOpNode:
+            left, right = numbers.get(id(rebuilt.left_node)), numbers.get(id(rebuilt.right_node))
+            if left is not None and right is not None: key = ('b', rebuilt.op_tok.type, left, right)
+        elif node_type is UnaryOpNode:
+            operand = numbers.get(id(rebuilt.node))
+            if operand is not None: key = ('u', rebuilt.op_tok.type, operand)
+        if key is None: return rebuilt
+
+        number = values.setdefault(key, len(values))
+        if node_type is BinOpNode or node_type is UnaryOpNode:
+            existing = shared.get(number)
+            if existing is not None: return existing
+            shared[number] = rebuilt
+        numbers[id(rebuilt)] = number
+        return rebuilt
+    return transform(node, visit)
+
+#######################################
+# PIPELINE
+#######################################
+
+PASSES = (
+    ('fold constants', fold_constants),
+    ('dead stores', eliminate_dead_stores),
+    ('common subexpressions', eliminate_common_subexpressions),
+)
+
+class Optimizer:
+    def __init__(self, passes=PASSES):
+        self.passes = passes
+        # (pass name, nodes before, nodes after) for each pass run.
+        self.stats = []
+
+    def optimize(self, node):
+        if node is None: return None
+        for name, run_pass in self.passes:
+            before = count_nodes(node)
+            node = run_pass(node)
+            self.stats.append((name, before, count_nodes(node)))
+        return node
+
+    def __repr__(self):
+        return '\n'.join(f'{name:>22}: {before} -> {after} nodes' for name, before, after in self.stats)
+
+def optimize(node):
+    optimizer = Optimizer()
+    return optimizer.optimize(node), optimizer.stats
@@ -0,0 +1,149 @@
+import os
+import re
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from error import IllegalCharError
+from lex_token import Token
+from lexer import Lexer, Parser, TOKEN_SPEC
+from position import Position
+from token_buffer import TokenBuffer
+from tokens import TT_IDENTIFIER, TT_EOF, TOKEN_TYPES, TYPE_CODES
+
+#######################################
+# PARALLEL LEXING
+#######################################
+# Lexes one large text in a process pool. The text is cut at newlines that
+# lie outside strings and comments, the only lexemes that can hold one, so
+# no token crosses a cut and each piece lexes alone exactly as it would in
+# place.
+#
+# Symbol numbering is sequential, so the pieces cannot number identifiers
+# themselves: a worker records each identifier by name, with the index of
+# its first occurrence. Merging the pieces in order then defines every new
+# name in the same order, with the same data type (the token before its
+# first occurrence), as one sequential pass would. The result is the
+# TokenBuffer and symbol table Lexer.make_token_buffer gives.
+
+# Strings and comments, the lexemes that may hold a newline. Any '"' or
+# '!' outside one starts one, so finding them from the start of the text
+# tracks exactly what the lexer would.
+SPANNING_PATTERN = re.compile('|'.join(pattern for kind, pattern in TOKEN_SPEC if kind in ('STRING', 'COMMENT')), re.DOTALL)
+
+# Pieces smaller than this are not worth a process.
+MIN_PIECE = 1024 * 1024
+
+def split_points(text, count):
+    # Up to count - 1 offsets just past a newline outside any string or
+    # comment, near equal divisions of text.
+    points = []
+    search = SPANNING_PATTERN.search
+    pos = 0
+    m = search(text, pos)
+    for i in range(1, count):
+        cut = text.find('\n', max(len(text) * i // count, points[-1] if points else 0))
+        while cut >= 0:
+            # Skip past every string or comment that ends before the cut.
+            while m is not None and m.end() <= cut:
+                pos = m.end()
+                m = search(text, pos)
+            if m is None or m.start() > cut: break
+            cut = text.find('\n', m.end())
+        if cut < 0: break
+        if not points or cut + 1 > points[-1]: points.append(cut + 1)
+    return points
+
+def lex_piece(fn, text, base):
+    # Runs in a worker. Returns the piece's token columns with offsets
+    # rebased by base, its first occurrences as (name, token index) in
+    # order and any illegal character as (start, end, lexeme).
+    #
+    # An identifier is valued ~n for the nth name of the piece. INT values
+    # are never negative, so these share no value table entry with them.
+    lexer = Lexer(fn, text)
+    first = []
+    tokens = TokenBuffer(None)
+    append = tokens.append
+    for tok_type, value, start, end in lexer.scan():
+        if tok_type == TT_IDENTIFIER:
+            if value == len(first): first.append((text[start:end], len(tokens)))
+            value = ~value
+        append(tok_type, value, base + start, base + end)
+    error = None
+    if lexer.error:
+        error = (lexer.error.pos_start.idx + base, lexer.error.pos_end.idx + base, lexer.error.details)
+    return tokens.types, tokens.starts, tokens.ends, tokens.value_ids, tokens.values, first, error
+
+def merge(lexer, pieces):
+    # Joins piece results, in text order, into one TokenBuffer and fills
+    # lexer.symbol_table as a sequential pass would.
+    symbol_table = lexer.symbol_table
+    tokens = TokenBuffer(lexer.source)
+    identifier_code = TYPE_CODES[TT_IDENTIFIER]
+    for types, starts, ends, value_ids, values, first, error in pieces:
+        # Every piece but the last ends in an EOF of its own.
+        count = len(types) - 1
+        # Global location of each name of the piece.
+        locations = []
+        for name, index in first:
+            # A new name's data type is the token before it, which for the
+            # first token of a piece is the last of the piece before.
+            entry = symbol_table.lookup(name)
+            if entry is None:
+                if index > 0:
+                    value = values[value_ids[index - 1]]
+                    if types[index - 1] == identifier_code: value = locations[~value]
+                    entry = symbol_table.define(name, Token(TOKEN_TYPES[types[index - 1]], value))
+                elif len(tokens):
+                    last = len(tokens) - 1
+                    entry = symbol_table.define(name, Token(tokens.type_at(last), tokens.value_at(last)))
+                else:
+                    entry = symbol_table.define(name)
+            locations.append(entry["location"])
+
+        remap = array('I')
+        for value in values:
+            if value.__class__ is int and value < 0: value = locations[~value]
+            if value is None:
+                remap.append(0)
+                continue
+            key = (value.__class__, repr(value) if value.__class__ is float else value)
+            value_id = tokens.value_index.get(key)
+            if value_id is None:
+                value_id = tokens.value_index[key] = len(tokens.values)
+                tokens.values.append(value)
+            remap.append(value_id)
+
+        tokens.types.extend(types[:count])
+        tokens.starts.extend(starts[:count])
+        tokens.ends.extend(ends[:count])
+        tokens.value_ids.extend(array('I', [remap[value_id] for value_id in value_ids[:count]]))
+        if error is not None:
+            start, end, details = error
+            lexer.error = IllegalCharError(Position(start, lexer.source), Position(end, lexer.source), details)
+            break
+    tokens.append(TT_EOF, None, starts[count], ends[count])
+    return tokens
+
+def make_parallel_buffer(lexer, workers=None, min_piece=MIN_PIECE):
+    # Like lexer.make_token_buffer(), lexing pieces of lexer.text in
+    # workers processes, or sequentially when the text is too short to
+    # split.
+    text = lexer.text
+    workers = workers or os.cpu_count() or 1
+    count = min(workers, max(1, len(text) // min_piece))
+    if count < 2: return lexer.make_token_buffer()
+
+    lexer.error = None
+    bounds = [0] + split_points(text, count) + [len(text)]
+    with ProcessPoolExecutor(max_workers=count) as executor:
+        futures = [executor.submit(lex_piece, lexer.fn, text[start:stop], start)
+            for start, stop in zip(bounds, bounds[1:])]
+        tokens = merge(lexer, (future.result() for future in futures))
+    return tokens, lexer.error
+
+def run_parallel(fn, text, workers=None):
+    lexer = Lexer(fn, text)
+    tokens, error = make_parallel_buffer(lexer, workers)
+    if error: return None, error, lexer.symbol_table
+    ast = Parser(tokens).parse()
+    return ast.node, ast.error, lexer.symbol_table
@@ -1,20 +1,100 @@
-class Position:
-    def __init__(self, idx, ln, col, fn, ftxt):
-        self.idx = idx
-        self.ln = ln
-        self.col = col
+from array import array
+from bisect import bisect_right
+
+class Source:
+    # A program's text plus the offset of every line start, built once on
+    # first use and shared by every Position into that text. A streamed
+    # source has no text and is given line_starts recorded by the lexer.
+    def __init__(self, fn, text, line_starts=None):
         self.fn = fn
-        self.ftxt = ftxt
+        self.text = text
+        self._line_starts = line_starts
 
-    def advance(self, current_char=None):
-        self.idx += 1
-        self.col += 1
+    @property
+    def line_starts(self):
+        if self._line_starts is None:
+            line_starts = array('q', [0])
+            newline = self.text.find('\n')
+            while newline >= 0:
+                line_starts.append(newline + 1)
+                newline = self.text.find('\n', newline + 1)
+            self._line_starts = line_starts
+        return self._line_starts
+
+    def resolve(self, idx):
+        # The source and offset a Position at idx should use; see
+        # TokenBlock in incremental.py for a source that is not itself.
+        return self, idx
+
+    def load(self, text):
+        # Attaches the full text to a streamed source. Line starts recorded
+        # while streaming may stop short of the end, so they are re-indexed.
+        self.text = text
+        self._line_starts = None
 
-        if current_char == '\n':
-            self.ln += 1
-            self.col = 0
+    def line_of(self, idx):
+        return bisect_right(self.line_starts, idx) - 1
+
+    def next_newline(self, idx):
+        # Offset of the first '\n' at or after idx, or len(text) if none.
+        line_starts = self.line_starts
+        line = bisect_right(line_starts, idx)
+        if line < len(line_starts): return line_starts[line] - 1
+        return len(self.text)
+
+class CountingSource(Source):
+    # A Source that counts the Positions built into it, for run_stats. Each
+    # resolves its offset here once, so a Source that is not counted pays
+    # nothing, and one run's count is not mixed with another's.
+    def __init__(self, fn, text, line_starts=None):
+        super().__init__(fn, text, line_starts)
+        self.positions = 0
+
+    def resolve(self, idx):
+        self.positions += 1
+        return self, idx
+
+class Position:
+    # An offset into a Source; the line and column are looked up on demand.
+    def __init__(self, idx, source):
+        self.source, self.idx = source.resolve(idx)
 
+    @property
+    def ln(self):
+        return self.source.line_of(self.idx)
+
+    @property
+    def col(self):
+        return self.idx - self.source.line_starts[self.ln]
+
+    @property
+    def fn(self):
+        return self.source.fn
+
+    @property
+    def ftxt(self):
+        return self.source.text
+
+    def advance(self, current_char=None):
+        self.idx += 1
         return self
 
     def copy(self):
-        return Position(self.idx, self.ln, self.col, self.fn, self.ftxt)
\ No newline at end of file
+        return Position(self.idx, self.source)
+
+class MappedText:
+    # Stands in for a Source's text when the program is a memory-mapped
+    # file: slices are decoded from the bytes when taken, so the file is
+    # never held as one str. Offsets into it are byte offsets.
+    def __init__(self, data):
+        self.data = data
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice): index = slice(index, index + 1)
+        return self.data[index].decode('utf-8', 'replace')
+
+    def find(self, sub, start=0, end=None):
+        return self.data.find(sub.encode(), start, len(self.data) if end is None else end)
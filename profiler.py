@@ -0,0 +1,156 @@
+import time
+from array import array
+from bisect import bisect_right
+from lexer import children, token_of, line_of
+from position import Position
+from resolver import resolve
+from strings_with_arrows import string_with_arrows
+from vm import Chunk, Compiler, Context, VM, OP_HALT
+
+#######################################
+# LINE PROFILER
+#######################################
+# Runs a program on the VM and reports, for each line of its source, how
+# many instructions ran for it and how long they took.
+#
+# The compiler records the source line of every instruction, that of the
+# token its node was made from. The code is then cut into runs of
+# instructions from one line, each followed by a HALT, and the VM is
+# entered once per run, so the clock is read only where the line changes
+# and the VM's own loop runs unchanged. Times include entering the VM once
+# per run. An instruction that fails counts its whole run.
+#
+# The report lists the source with counts and times beside each line, and
+# underlines the hottest lines as errors are, with string_with_arrows.
+
+# Hottest lines shown underlined in a report.
+HOT_LINES = 5
+
+class LineProfile:
+    def __init__(self, node, source):
+        # The program, kept to find what to underline in a report.
+        self.node = node
+        self.source = source
+        # Instructions run and nanoseconds taken per 0-based source line.
+        self.hits = {}
+        self.times = {}
+
+    @property
+    def total_hits(self):
+        return sum(self.hits.values())
+
+    @property
+    def total_time(self):
+        return sum(self.times.values())
+
+    def hottest(self, count=HOT_LINES):
+        return sorted(self.times, key=self.times.__getitem__, reverse=True)[:count]
+
+    def line_text(self, line):
+        text = self.source.text
+        start = self.source.line_starts[line]
+        return text[start:self.source.next_newline(start)].rstrip('\r')
+
+    def row(self, line, total):
+        if line not in self.hits: return f'{line + 1:>6} {"":>10} {"":>11} {"":>6}'
+        nanoseconds = self.times[line]
+        return (f'{line + 1:>6} {self.hits[line]:>10} {nanoseconds / 1e6:>11.3f} '
+            f'{100 * nanoseconds / total if total else 0.0:>5.1f}%')
+
+    def report(self, hot_lines=HOT_LINES):
+        total = self.total_time
+        lines = [f'Line profile of {self.source.fn}: {self.total_hits} instructions in {total / 1e6:.3f} ms', '',
+            f'{"line":>6} {"hits":>10} {"time (ms)":>11} {"%":>6}  source']
+        if self.source.text is None:
+            lines.extend(self.row(line, total) for line in sorted(self.hits))
+        else:
+            line_count = len(self.source.line_starts)
+            # A text ending in a newline has no last line to show.
+            if self.source.line_starts[-1] == len(self.source.text): line_count -= 1
+            lines.extend(f'{self.row(line, total)}  {self.line_text(line)}' for line in range(line_count))
+
+        hottest = self.hottest(hot_lines)
+        if hottest and self.source.text is not None:
+            spans = line_spans(self.node, set(hottest))
+            lines.extend(('', 'Hottest lines:'))
+            for line in hottest:
+                source, start, end = spans[line]
+                lines.append('')
+                lines.append(f'line {line + 1}: {self.hits[line]} instructions, {self.times[line] / 1e6:.3f} ms '
+                    f'({100 * self.times[line] / total if total else 0.0:.1f}%)')
+                lines.append(string_with_arrows(self.source.text,
+                    Position(start, source), Position(end, source)))
+        return '\n'.join(lines)
+
+    def __repr__(self):
+        return self.report()
+
+def line_spans(node, lines):
+    # Source, first and last offsets of the tree's tokens on each of lines.
+    spans = {}
+    seen = set()
+    work = [node]
+    while work:
+        current = work.pop()
+        if current is None or id(current) in seen: continue
+        seen.add(id(current))
+        work.extend(children(current))
+        tok = token_of(current)
+        line = line_of(tok)
+        if line not in lines: continue
+        source, start = tok.source.resolve(tok.start)
+        end = start + tok.end - tok.start
+        if line in spans:
+            spans[line] = (source, min(spans[line][1], start), max(spans[line][2], end))
+        else:
+            spans[line] = (source, start, end)
+    return spans
+
+def split_lines(chunk):
+    # A copy of chunk with a HALT after every run of instructions from one
+    # line, and the runs as (code offset, line, instructions).
+    code = chunk.code
+    lines = chunk.lines
+    split = Chunk()
+    split.constants = chunk.constants
+    split.names = chunk.names
+    runs = []
+    # The closing HALT is left out; the last run's HALT stands for it.
+    count = len(code) // 2 - 1
+    first = 0
+    while first < count:
+        line = lines[first]
+        last = first
+        while last < count and lines[last] == line: last += 1
+        runs.append((len(split.code), line, last - first))
+        split.code.extend(code[2 * first:2 * last])
+        split.code.extend((OP_HALT, 0))
+        first = last
+    # Each run moves the code after it on by one HALT.
+    starts = array('l')
+    offset = 0
+    for start, line, instructions in runs:
+        starts.append(offset)
+        offset += 2 * instructions
+    for pc, node in chunk.nodes.items():
+        split.nodes[pc + 2 * (bisect_right(starts, pc) - 1)] = node
+    return split, runs
+
+def profile(node, display_name='<program>', symbol_table=None):
+    # Like vm.execute, returning the values, an error and a LineProfile.
+    chunk = Compiler(resolve(node, symbol_table), lines=True).compile(node)
+    split, runs = split_lines(chunk)
+    result = LineProfile(node, token_of(node).pos_start.source)
+    hits = result.hits
+    times = result.times
+    machine = VM(split, Context(display_name))
+    clock = time.perf_counter_ns
+    stack = []
+    for start, line, instructions in runs:
+        before = clock()
+        stack, error = machine.run(start, stack)
+        elapsed = clock() - before
+        hits[line] = hits.get(line, 0) + instructions
+        times[line] = times.get(line, 0) + elapsed
+        if error: return None, error, result
+    return stack, None, result
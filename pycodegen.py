@@ -0,0 +1,256 @@
+import ast
+import weakref
+from error import RTError
+from lexer import NumberNode, NumberAccessNode, NumberAssignNode, BinOpNode, UnaryOpNode, HeadNode, shared_nodes, OPERATOR_NODES
+from tokens import TT_MINUS, TT_PLUS, TT_MUL, TT_DIV, TT_EQUAL_EQUAL, TT_NE, TT_LT, TT_GT, TT_LTE, TT_GTE
+from resolver import resolve
+from type_inference import infer, FLOAT
+from vm import Context, name_of
+
+#######################################
+# PYTHON CODE GENERATION
+#######################################
+# Translates an AST into a Python function built from ast nodes and
+# compiled once, so running a program again costs only a call at CPython
+# bytecode speed.
+#
+# The generated code has no source text. Each ast node that can fail gets
+# the index of its program node as its line number, so the line a
+# ZeroDivisionError or NameError is raised on leads back to the program.
+#
+# CPython's compiler recurses over expressions, so a subexpression deeper
+# than SPILL_DEPTH is moved into a statement of its own. Any value computed
+# before it is moved out first, which keeps the program's evaluation order.
+#
+# Given the types from type_inference, an int constant whose other operand
+# is a FLOAT is written as the equal float. CPython specialises arithmetic
+# and comparisons only between two ints or two floats, so this keeps such
+# operations on the float-only path instead of converting every time.
+
+SPILL_DEPTH = 200
+
+# Line numbers below FIRST_NODE_LINE stand for no program node.
+NO_NODE_LINE = 1
+FIRST_NODE_LINE = 2
+
+OPERATORS = {
+    TT_PLUS: ast.Add,
+    TT_MINUS: ast.Sub,
+    TT_MUL: ast.Mult,
+    TT_DIV: ast.Div,
+}
+COMPARISONS = {
+    TT_EQUAL_EQUAL: ast.Eq,
+    TT_NE: ast.NotEq,
+    TT_LT: ast.Lt,
+    TT_GT: ast.Gt,
+    TT_LTE: ast.LtE,
+    TT_GTE: ast.GtE,
+}
+
+def variable(name):
+    # Prefixed so program names never clash with Python names or temporaries.
+    return f'v_{name}'
+
+def at(node, line):
+    node.lineno = node.end_lineno = line
+    node.col_offset = node.end_col_offset = 0
+    return node
+
+def promoted(expr):
+    # An int constant as the float of the same value, or expr unchanged.
+    if expr.__class__ is ast.Constant and expr.value.__class__ is int:
+        try:
+            value = float(expr.value)
+        except OverflowError:
+            return expr
+        if value == expr.value: return at(ast.Constant(value=value), NO_NODE_LINE)
+    return expr
+
+#######################################
+# PROGRAM
+#######################################
+
+class PyProgram:
+    def __init__(self, function, nodes, names=None):
+        self.function = function
+        self.code = function.__code__
+        self.nodes = nodes
+        # The name held in each slot, when the program was resolved.
+        self.names = names
+
+    def run(self, display_name='<program>'):
+        # Returns the values of each section, and an error, like vm.VM.run.
+        try:
+            return self.function(), None
+        except ZeroDivisionError as exc:
+            return None, self.error(exc, 'Division by zero', display_name)
+        except NameError as exc:
+            node = self.failed_node(exc)
+            if node is None: raise
+            name = self.names[node.slot] if self.names is not None else name_of(node.Number_name_tok)
+            return None, self.error(exc, f"'{name}' is not defined", display_name)
+
+    def failed_node(self, exc):
+        line = None
+        tb = exc.__traceback__
+        while tb is not None:
+            if tb.tb_frame.f_code is self.code: line = tb.tb_lineno
+            tb = tb.tb_next
+        if line is None or line < FIRST_NODE_LINE: return None
+        return self.nodes[line]
+
+    def error(self, exc, details, display_name):
+        node = self.failed_node(exc)
+        if node is None: raise exc
+        return RTError(node.pos_start, node.pos_end, details, Context(display_name))
+
+#######################################
+# COMPILER
+#######################################
+
+class PyCompiler:
+    def __init__(self, types=None, resolution=None):
+        # types is a type_inference.TypeInfo of the program, or None. With a
+        # resolver.Resolution, variables are named by the slots the resolver
+        # gave their nodes, as in vm.Compiler.
+        self.types = types
+        self.resolution = resolution
+        self.statements = []
+        self.nodes = [None] * FIRST_NODE_LINE
+        self.temps = 0
+
+    def compile(self, node):
+        shared = shared_nodes(node, OPERATOR_NODES)
+        shared_temps = {}
+        results = []
+        sections = (node.left_node, node.right_node) if node.__class__ is HeadNode else (node,)
+        for section in sections:
+            if section is None: continue
+            value = self.expression(section, shared, shared_temps)
+            results.append(self.temp())
+            self.statements.append(at(ast.Assign(targets=[self.name(results[-1], ast.Store)], value=value), NO_NODE_LINE))
+        values = at(ast.List(elts=[self.name(result) for result in results], ctx=ast.Load()), NO_NODE_LINE)
+        self.statements.append(at(ast.Return(value=values), NO_NODE_LINE))
+
+        arguments = ast.arguments(posonlyargs=[], args=[], vararg=None, kwonlyargs=[],
+            kw_defaults=[], kwarg=None, defaults=[])
+        function = at(ast.FunctionDef(name='program', args=arguments, body=self.statements,
+            decorator_list=[], returns=None, type_params=[]), NO_NODE_LINE)
+        namespace = {}
+        exec(compile(ast.Module(body=[function], type_ignores=[]), '<program>', 'exec'), namespace)
+        names = list(self.resolution.names) if self.resolution is not None else None
+        return PyProgram(namespace['program'], self.nodes, names)
+
+    def expression(self, node, shared, shared_temps):
+        # Post-order walk with an explicit stack, like vm.Compiler. values
+        # holds (expression, depth, pure) for operands not yet used; a pure
+        # operand gives the same value whenever it is evaluated.
+        values = []
+        work = [(node, False)]
+        while work:
+            node, done = work.pop()
+            if not done and id(node) in shared_temps:
+                values.append((self.name(shared_temps[id(node)]), 1, True))
+                continue
+            node_type = node.__class__
+
+            if node_type is NumberNode:
+                values.append((at(ast.Constant(value=node.tok.value), NO_NODE_LINE), 1, True))
+                continue
+
+            if node_type is NumberAccessNode:
+                name = self.name(self.variable(node), line=self.line(node))
+                values.append((name, 1, False))
+                continue
+
+            if not done:
+                work.append((node, True))
+                if node_type is BinOpNode:
+                    work.append((node.right_node, False))
+                    work.append((node.left_node, False))
+                elif node_type is UnaryOpNode:
+                    work.append((node.node, False))
+                elif node_type is NumberAssignNode:
+                    work.append((node.value_node, False))
+                else:
+                    raise TypeError(f'cannot compile {node_type.__name__}')
+                continue
+
+            if node_type is BinOpNode:
+                right, right_depth, _ = values.pop()
+                left, left_depth, _ = values.pop()
+                op_type = node.op_tok.type
+                if self.types is not None:
+                    if self.types.type_of(node.left_node) == FLOAT: right = promoted(right)
+                    if self.types.type_of(node.right_node) == FLOAT: left = promoted(left)
+                if op_type in COMPARISONS:
+                    # 1 if left op right else 0, as the VM gives.
+                    test = at(ast.Compare(left=left, ops=[COMPARISONS[op_type]()], comparators=[right]), NO_NODE_LINE)
+                    expr = at(ast.IfExp(test=test, body=at(ast.Constant(value=1), NO_NODE_LINE),
+                        orelse=at(ast.Constant(value=0), NO_NODE_LINE)), NO_NODE_LINE)
+                else:
+                    line = self.line(node) if op_type == TT_DIV else NO_NODE_LINE
+                    expr = at(ast.BinOp(left=left, op=OPERATORS[op_type](), right=right), line)
+                depth = max(left_depth, right_depth) + 1
+            elif node_type is UnaryOpNode:
+                operand, depth, pure = values.pop()
+                if node.op_tok.type != TT_MINUS:
+                    values.append((operand, depth, pure))
+                    continue
+                expr = at(ast.UnaryOp(op=ast.USub(), operand=operand), NO_NODE_LINE)
+                depth += 1
+            else:
+                value, depth, _ = values.pop()
+                target = self.name(self.variable(node), ast.Store)
+                expr = at(ast.NamedExpr(target=target, value=value), NO_NODE_LINE)
+                depth += 1
+
+            if id(node) in shared:
+                # Evaluated where it first appears and reused from then on.
+                shared_temps[id(node)] = self.temp()
+                expr = at(ast.NamedExpr(target=self.name(shared_temps[id(node)], ast.Store), value=expr), NO_NODE_LINE)
+                depth += 1
+            values.append((expr, depth, False))
+            if depth > SPILL_DEPTH: self.spill(values)
+
+        return values.pop()[0]
+
+    def spill(self, values):
+        for i, (expr, depth, pure) in enumerate(values):
+            if pure: continue
+            temp = self.temp()
+            self.statements.append(at(ast.Assign(targets=[self.name(temp, ast.Store)], value=expr), NO_NODE_LINE))
+            values[i] = (self.name(temp), 1, True)
+
+    def variable(self, node):
+        return variable(node.slot if self.resolution is not None else name_of(node.Number_name_tok))
+
+    def temp(self):
+        self.temps += 1
+        return f't_{self.temps}'
+
+    def name(self, id, ctx=ast.Load, line=NO_NODE_LINE):
+        return at(ast.Name(id=id, ctx=ctx()), line)
+
+    def line(self, node):
+        self.nodes.append(node)
+        return len(self.nodes) - 1
+
+#######################################
+# EXECUTE
+#######################################
+
+# Compiled programs by AST, kept while the AST is alive, with the symbol
+# table they were resolved against.
+programs = weakref.WeakKeyDictionary()
+
+def compile_program(node, symbol_table=None):
+    cached = programs.get(node)
+    if cached is not None and cached[0] is symbol_table: return cached[1]
+    program = PyCompiler(infer(node), resolve(node, symbol_table)).compile(node)
+    programs[node] = (symbol_table, program)
+    return program
+
+def execute(node, display_name='<program>', symbol_table=None):
+    return compile_program(node, symbol_table).run(display_name)
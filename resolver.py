@@ -0,0 +1,116 @@
+from lexer import NumberAccessNode, NumberAssignNode, children, name_of
+
+#######################################
+# NAME RESOLUTION
+#######################################
+# Gives every variable a fixed slot after parsing, so a backend can keep
+# variables in an array indexed by slot instead of looking names up. Each
+# NumberAccessNode and NumberAssignNode gets the slot of its name as .slot.
+#
+# Names in the program scope take their symbol table location as their
+# slot, which is also the value of their identifier tokens, so slots stay
+# the same from one compilation of a program to the next. Names first seen
+# in a nested scope take slots after those.
+#
+# Names are resolved in evaluation order. A read finds the innermost scope
+# that has the name; a name read before any assignment is given a slot in
+# the program scope, so it is reported as not defined when run. An
+# assignment to a name no enclosing scope has defines it in the current
+# scope.
+
+# Keywords whose blocks will open a scope once the parser has statements
+# for them. A resolver enters and exits them through enter_scope and
+# exit_scope; every scope draws its slots from the one array.
+SCOPE_KEYWORDS = ('FUNC', 'FUNCT', 'IF', 'If', 'ELSE', 'Else', 'While')
+
+class Scope:
+    def __init__(self, parent=None, keyword=None):
+        self.parent = parent
+        self.keyword = keyword
+        self.slots = {}
+
+    def lookup(self, name):
+        scope = self
+        while scope is not None:
+            slot = scope.slots.get(name)
+            if slot is not None: return slot
+            scope = scope.parent
+        return None
+
+class Resolution:
+    def __init__(self, names, program_slots):
+        # The name held in each slot.
+        self.names = names
+        # Slots of the program scope by name.
+        self.program_slots = program_slots
+
+    def __len__(self):
+        return len(self.names)
+
+class Resolver:
+    def __init__(self, symbol_table=None):
+        self.program = self.scope = Scope()
+        self.names = []
+        # Slots kept for names of the symbol table until the program scope
+        # defines them.
+        self.reserved = {}
+        if symbol_table is not None:
+            for name, entry in symbol_table.items():
+                location = entry["location"]
+                while len(self.names) <= location:
+                    self.names.append(None)
+                self.names[location] = name
+                self.reserved[name] = location
+
+    def enter_scope(self, keyword):
+        if keyword not in SCOPE_KEYWORDS: raise ValueError(f'{keyword!r} does not open a scope')
+        self.scope = Scope(self.scope, keyword)
+
+    def exit_scope(self):
+        if self.scope is self.program: raise ValueError('no scope to exit')
+        self.scope = self.scope.parent
+
+    def name(self, tok):
+        # A streamed source keeps no text, and name_of gives the token's
+        # value, which is the name's symbol table location.
+        name = name_of(tok)
+        if name.__class__ is int and name < len(self.names) and self.names[name] is not None:
+            return self.names[name]
+        return name
+
+    def define(self, scope, name):
+        slot = self.reserved.get(name) if scope is self.program else None
+        if slot is None:
+            slot = len(self.names)
+            self.names.append(name)
+        scope.slots[name] = slot
+        return slot
+
+    def resolve(self, node):
+        # Post-order walk with an explicit stack, like vm.Compiler, so an
+        # assignment's value is resolved before its name is defined.
+        work = [(node, False)]
+        while work:
+            current, done = work.pop()
+            if current is None: continue
+            node_type = current.__class__
+            if not done:
+                work.append((current, True))
+                for child in reversed(children(current)):
+                    work.append((child, False))
+                continue
+
+            if node_type is NumberAccessNode:
+                name = self.name(current.Number_name_tok)
+                slot = self.scope.lookup(name)
+                if slot is None: slot = self.define(self.program, name)
+                current.slot = slot
+            elif node_type is NumberAssignNode:
+                name = self.name(current.Number_name_tok)
+                slot = self.scope.lookup(name)
+                if slot is None: slot = self.define(self.scope, name)
+                current.slot = slot
+        return Resolution(self.names, self.program.slots)
+
+def resolve(node, symbol_table=None):
+    return Resolver(symbol_table).resolve(node)
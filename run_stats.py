@@ -0,0 +1,57 @@
+import time
+from contextlib import contextmanager
+
+#######################################
+# RUN STATISTICS
+#######################################
+# Opt-in timings and counters for one call of lexer.run. Pass a RunStats
+# and run() fills it in: wall time per phase (lex, sections, parse, or
+# cache on a hit) and counters such as tokens, Positions and ParseResults
+# built, AST nodes and symbols.
+#
+# When run() is done the stats are published to the RunStats' own hook
+# and to every hook in HOOKS, each called with the RunStats, so they can
+# be forwarded to a metrics system. phase() times further steps on the same
+# stats, as main.py's --profile does for optimising and executing, and
+# as_dict() gives them as plain data, as the compile daemon sends them.
+
+HOOKS = []
+
+def add_hook(hook):
+    HOOKS.append(hook)
+
+class RunStats:
+    def __init__(self, hook=None):
+        self.hook = hook
+        # Phase name to seconds, in the order the phases ran.
+        self.times = {}
+        self.counters = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.times[name] = self.times.get(name, 0.0) + time.perf_counter() - start
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    @property
+    def total(self):
+        return sum(self.times.values())
+
+    def as_dict(self):
+        return {'times': dict(self.times), 'counters': dict(self.counters)}
+
+    def publish(self):
+        if self.hook is not None: self.hook(self)
+        for hook in HOOKS:
+            hook(self)
+
+    def __repr__(self):
+        lines = [f'{name:>16}: {seconds * 1000:10.3f} ms' for name, seconds in self.times.items()]
+        lines.append(f'{"total":>16}: {self.total * 1000:10.3f} ms')
+        lines.extend(f'{name:>16}: {value}' for name, value in self.counters.items())
+        return '\n'.join(lines)
@@ -1,13 +1,14 @@
 def string_with_arrows(text, pos_start, pos_end):
     result = ''
+    source = pos_start.source
 
     # Calculate indices
-    idx_start = max(text.rfind('\n', 0, pos_start.idx), 0)
-    idx_end = text.find('\n', idx_start + 1)
-    if idx_end < 0: idx_end = len(text)
+    ln = pos_start.ln
+    idx_start = source.line_starts[ln] - 1 if ln > 0 else 0
+    idx_end = source.next_newline(idx_start + 1)
     
     # Generate each line
-    line_count = pos_end.ln - pos_start.ln + 1
+    line_count = pos_end.ln - ln + 1
     for i in range(line_count):
         # Calculate line columns
         line = text[idx_start:idx_end]
@@ -20,7 +21,6 @@ def string_with_arrows(text, pos_start, pos_end):
 
         # Re-calculate indices
         idx_start = idx_end
-        idx_end = text.find('\n', idx_start + 1)
-        if idx_end < 0: idx_end = len(text)
+        idx_end = source.next_newline(idx_start + 1)
 
     return result.replace('\t', '')
\ No newline at end of file
@@ -0,0 +1,40 @@
+import sys
+from keywords import KEYWORD_SET
+
+#######################################
+# SYMBOL TABLE
+#######################################
+# One table per compilation, so nothing is shared between runs or threads.
+# Entries keep the {"name", "location", "address", "dataType"} layout; each
+# name gets the next free location when first defined and keeps it.
+
+class SymbolTable:
+    def __init__(self):
+        self.symbols = {}
+
+    def is_keyword(self, name):
+        return name in KEYWORD_SET
+
+    def lookup(self, name):
+        return self.symbols.get(name)
+
+    def define(self, name, dataType="Initial"):
+        name = sys.intern(name)
+        entry = {"name":name, "location":len(self.symbols), "address":hex(id(name)), "dataType":dataType}
+        self.symbols[name] = entry
+        return entry
+
+    def __contains__(self, name):
+        return name in self.symbols
+
+    def __getitem__(self, name):
+        return self.symbols[name]
+
+    def __iter__(self):
+        return iter(self.symbols)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def items(self):
+        return self.symbols.items()
@@ -1,21 +0,0 @@
-class Token:
-    def __init__(self, type_, value=None, pos_start=None, pos_end=None):
-    	self.type = type_
-    	self.value = value
-    	
-    	if pos_start:
-    		self.pos_start = pos_start.copy()
-    		self.pos_end = pos_start.copy()
-    		self.pos_end.advance()
-    	if pos_end:
-    		self.pos_end = pos_end
-
-    def matches(self, type_):
-    	return self.type == type_ 
-
-    def getValue(self):
-        return self.value
-        
-    def __repr__(self):
-    	if self.value: return f'{self.type}:{self.value}'
-    	return f'{self.type}'
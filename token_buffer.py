@@ -0,0 +1,117 @@
+from array import array
+from position import Position
+from tokens import TOKEN_TYPES, TYPE_CODES
+
+#######################################
+# TOKEN BUFFER
+#######################################
+# Tokens stored column-wise: one array entry per token for the type code,
+# start offset, end offset and an index into a shared value table, instead
+# of a Token with two Position objects each. Positions are only built when
+# a TokenView is asked for one.
+
+class TokenBuffer:
+    def __init__(self, source):
+        self.source = source
+        self.types = array('B')
+        self.starts = array('q')
+        self.ends = array('q')
+        self.value_ids = array('I')
+        # Index 0 is None; equal values of the same type share one entry.
+        self.values = [None]
+        self.value_index = {}
+
+    def append(self, tok_type, value, start, end):
+        self.types.append(TYPE_CODES[tok_type])
+        self.starts.append(start)
+        self.ends.append(end)
+        if value is None:
+            self.value_ids.append(0)
+            return
+        # repr keeps 0.0 and -0.0 apart.
+        key = (value.__class__, repr(value) if value.__class__ is float else value)
+        value_id = self.value_index.get(key)
+        if value_id is None:
+            value_id = self.value_index[key] = len(self.values)
+            self.values.append(value)
+        self.value_ids.append(value_id)
+
+    def __len__(self):
+        return len(self.types)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [TokenView(self, i) for i in range(*index.indices(len(self.types)))]
+        if index < 0: index += len(self.types)
+        if not 0 <= index < len(self.types):
+            raise IndexError('token index out of range')
+        return TokenView(self, index)
+
+    def __iter__(self):
+        for index in range(len(self.types)):
+            yield TokenView(self, index)
+
+    def type_at(self, index):
+        return TOKEN_TYPES[self.types[index]]
+
+    def value_at(self, index):
+        return self.values[self.value_ids[index]]
+
+    def find(self, tok_type, value=None, start=0):
+        # Index of the first token from start with this type and value, or -1.
+        # Scans the type column, so no views are built along the way.
+        code = TYPE_CODES[tok_type]
+        while True:
+            try:
+                index = self.types.index(code, start)
+            except ValueError:
+                return -1
+            if self.values[self.value_ids[index]] == value: return index
+            start = index + 1
+
+class TokenView:
+    # A Token-compatible handle onto one row of a TokenBuffer.
+    __slots__ = ('buffer', 'index')
+
+    def __init__(self, buffer, index):
+        self.buffer = buffer
+        self.index = index
+
+    @property
+    def type(self):
+        return TOKEN_TYPES[self.buffer.types[self.index]]
+
+    @property
+    def value(self):
+        return self.buffer.value_at(self.index)
+
+    @property
+    def start(self):
+        return self.buffer.starts[self.index]
+
+    @property
+    def end(self):
+        return self.buffer.ends[self.index]
+
+    @property
+    def source(self):
+        return self.buffer.source
+
+    @property
+    def pos_start(self):
+        return Position(self.buffer.starts[self.index], self.buffer.source)
+
+    @property
+    def pos_end(self):
+        return Position(self.buffer.ends[self.index], self.buffer.source)
+
+    def matches(self, type_):
+        return self.type == type_
+
+    def getValue(self):
+        return self.value
+
+    def __repr__(self):
+        value = self.value
+        if value is not None: return f'{self.type}:{value}'
+        return f'{self.type}'
@@ -28,3 +28,12 @@ TT_KEYWORD      = "KEYWORD"
 TT_EQ           = "EQUAL"
 
 TT_EOF 		= "EOF"
+
+# Every token type, in a fixed order so a type can be stored as a small code.
+TOKEN_TYPES = (
+    TT_INT, TT_FLOAT, TT_PLUS, TT_MINUS, TT_MUL, TT_DIV, TT_STRING,
+    TT_LEFT_PARENTHESIS, TT_RIGHT_PARENTHESIS, TT_LEFT_CURL_BRACES, TT_RIGHT_CURL_BRACES,
+    TT_SEMICOLON, TT_FULLCOLON, TT_EQUAL_EQUAL, TT_NE, TT_LT, TT_GT, TT_LTE, TT_GTE,
+    TT_LSQUAREBRACET, TT_RSQUAREBRACET, TT_COMMA, TT_IDENTIFIER, TT_KEYWORD, TT_EQ, TT_EOF,
+)
+TYPE_CODES = {tok_type: code for code, tok_type in enumerate(TOKEN_TYPES)}
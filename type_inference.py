@@ -0,0 +1,136 @@
+from lexer import NumberNode, NumberAccessNode, NumberAssignNode, BinOpNode, UnaryOpNode, HeadNode, children, name_of
+from tokens import TT_PLUS, TT_MINUS, TT_MUL, TT_DIV
+
+#######################################
+# TYPE INFERENCE
+#######################################
+# Gives every node the type of the values it can produce, following the
+# program in evaluation order as the backends run it: a variable has the
+# type of its last assignment, and a name read before any assignment is
+# UNKNOWN, since running it fails.
+#
+# The types are those of the runtime values: INT and FLOAT literals, '/'
+# always giving FLOAT and comparisons INT, as in the VM. NUMBER is a value
+# that may be either, where a name is assigned both in different places
+# and a later read cannot tell which. STRING is kept for string values,
+# which only '+' and '*' by an int accept; no node makes one yet.
+#
+# Backends use the types to pick specialised operations; pycodegen, for
+# one, writes int constants as floats next to a FLOAT operand, so CPython
+# runs float-only arithmetic instead of converting on every step.
+
+INT = 'int'
+FLOAT = 'float'
+NUMBER = 'number'
+STRING = 'string'
+UNKNOWN = 'unknown'
+
+NUMERIC = (INT, FLOAT, NUMBER)
+ARITHMETIC = (TT_PLUS, TT_MINUS, TT_MUL)
+
+def join(left, right):
+    # The type of a value that is either a left or a right value.
+    if left == right: return left
+    if left in NUMERIC and right in NUMERIC: return NUMBER
+    return UNKNOWN
+
+def literal_type(value):
+    if value.__class__ is int: return INT
+    if value.__class__ is float: return FLOAT
+    if value.__class__ is str: return STRING
+    return UNKNOWN
+
+def binary_type(op_type, left, right):
+    if op_type in ARITHMETIC:
+        if left == INT and right == INT: return INT
+        if left in NUMERIC and right in NUMERIC:
+            return FLOAT if FLOAT in (left, right) else NUMBER
+        if op_type == TT_PLUS and left == STRING and right == STRING: return STRING
+        if op_type == TT_MUL and STRING in (left, right) and INT in (left, right): return STRING
+        return UNKNOWN
+    if op_type == TT_DIV:
+        return FLOAT if left in NUMERIC and right in NUMERIC else UNKNOWN
+    # Comparisons give 1 or 0.
+    return INT
+
+def unary_type(op_type, operand):
+    if operand in NUMERIC: return operand
+    return UNKNOWN
+
+class TypeInfo:
+    def __init__(self, types, names):
+        # Type of each node by id(node).
+        self.types = types
+        # Type of each assigned name, over all its assignments.
+        self.names = names
+
+    def type_of(self, node):
+        return self.types.get(id(node), UNKNOWN)
+
+    def __repr__(self):
+        return f'TypeInfo({self.names})'
+
+class TypeInferrer:
+    def __init__(self, symbol_table=None):
+        self.symbol_table = symbol_table
+        # Names by symbol table location, for sources that keep no text.
+        self.locations = {}
+        if symbol_table is not None:
+            self.locations = {entry["location"]: name for name, entry in symbol_table.items()}
+
+    def name(self, tok):
+        name = name_of(tok)
+        if name.__class__ is int: return self.locations.get(name, name)
+        return name
+
+    def infer(self, node):
+        # Post-order walk with an explicit stack, like resolver.Resolver. An
+        # operator node reached twice, as in the optimiser's DAG, is
+        # evaluated once by the backends, and so typed once; any other node
+        # is typed each time it is reached, with the types joined.
+        types = {}
+        current_types = {}
+        names = {}
+        work = [(node, False)]
+        while work:
+            current, done = work.pop()
+            if current is None: continue
+            node_type = current.__class__
+            if not done and (node_type is BinOpNode or node_type is UnaryOpNode) and id(current) in types: continue
+            if not done:
+                kids = children(current)
+                if kids:
+                    work.append((current, True))
+                    for kid in reversed(kids):
+                        work.append((kid, False))
+                    continue
+
+            if node_type is NumberNode:
+                result = literal_type(current.tok.value)
+            elif node_type is NumberAccessNode:
+                result = current_types.get(self.name(current.Number_name_tok), UNKNOWN)
+            elif node_type is NumberAssignNode:
+                result = types.get(id(current.value_node), UNKNOWN)
+                name = self.name(current.Number_name_tok)
+                current_types[name] = result
+                names[name] = join(names[name], result) if name in names else result
+            elif node_type is BinOpNode:
+                result = binary_type(current.op_tok.type,
+                    types.get(id(current.left_node), UNKNOWN), types.get(id(current.right_node), UNKNOWN))
+            elif node_type is UnaryOpNode:
+                result = unary_type(current.op_tok.type, types.get(id(current.node), UNKNOWN))
+            elif node_type is HeadNode:
+                result = UNKNOWN
+            else:
+                raise TypeError(f'cannot infer {node_type.__name__}')
+            types[id(current)] = join(types[id(current)], result) if id(current) in types else result
+
+        if self.symbol_table is not None:
+            # Real types replace whatever the lexer recorded for a name the
+            # program assigns.
+            for name, name_type in names.items():
+                if name in self.symbol_table: self.symbol_table[name]["dataType"] = name_type
+        return TypeInfo(types, names)
+
+def infer(node, symbol_table=None):
+    return TypeInferrer(symbol_table).infer(node)
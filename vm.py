@@ -0,0 +1,299 @@
+import operator
+from array import array
+from error import RTError
+from lexer import NumberNode, NumberAccessNode, NumberAssignNode, BinOpNode, UnaryOpNode, HeadNode, name_of, token_of, line_of, shared_nodes, OPERATOR_NODES
+from resolver import resolve
+from tokens import TT_PLUS, TT_MINUS, TT_MUL, TT_DIV, TT_EQUAL_EQUAL, TT_NE, TT_LT, TT_GT, TT_LTE, TT_GTE
+
+#######################################
+# OPCODES
+#######################################
+# Every instruction is an opcode followed by one operand, so code is a flat
+# array of ints the VM steps through two at a time without decoding.
+
+OP_CONST = 0    # push constants[arg]
+OP_LOAD  = 1    # push slots[arg]
+OP_STORE = 2    # slots[arg] = top of stack, which stays on the stack
+OP_ADD   = 3
+OP_SUB   = 4
+OP_MUL   = 5
+OP_DIV   = 6
+OP_NEG   = 7
+OP_HALT  = 8
+# An operator whose right operand is constants[arg]; the compiler fuses a
+# CONST into the operator after it, which halves dispatch on typical chains.
+OP_ADD_CONST = 9
+OP_SUB_CONST = 10
+OP_MUL_CONST = 11
+OP_DIV_CONST = 12
+# Comparisons push 1 or 0.
+OP_EQ    = 13
+OP_NE    = 14
+OP_LT    = 15
+OP_GT    = 16
+OP_LTE   = 17
+OP_GTE   = 18
+
+OPCODE_NAMES = ('CONST', 'LOAD', 'STORE', 'ADD', 'SUB', 'MUL', 'DIV', 'NEG', 'HALT',
+    'ADDK', 'SUBK', 'MULK', 'DIVK', 'EQ', 'NE', 'LT', 'GT', 'LTE', 'GTE')
+
+BINARY_OPS = {
+    TT_PLUS: OP_ADD,
+    TT_MINUS: OP_SUB,
+    TT_MUL: OP_MUL,
+    TT_DIV: OP_DIV,
+    TT_EQUAL_EQUAL: OP_EQ,
+    TT_NE: OP_NE,
+    TT_LT: OP_LT,
+    TT_GT: OP_GT,
+    TT_LTE: OP_LTE,
+    TT_GTE: OP_GTE,
+}
+# Indexed by opcode - OP_EQ.
+COMPARISONS = (operator.eq, operator.ne, operator.lt, operator.gt, operator.le, operator.ge)
+CONST_FORMS = {
+    OP_ADD: OP_ADD_CONST,
+    OP_SUB: OP_SUB_CONST,
+    OP_MUL: OP_MUL_CONST,
+    OP_DIV: OP_DIV_CONST,
+}
+
+#######################################
+# CHUNK
+#######################################
+
+class Chunk:
+    def __init__(self, lines=False):
+        self.code = array('l')
+        self.constants = []
+        self.constant_index = {}
+        self.names = []
+        self.name_index = {}
+        # The node behind each instruction that can fail at run time, by
+        # code offset, so a runtime error can point at its source.
+        self.nodes = {}
+        self.last = None
+        # With lines, the source line of every instruction, by code offset
+        # / 2, taken from line as each is emitted; see profiler.py.
+        self.lines = array('l') if lines else None
+        self.line = -1
+
+    def emit(self, op, arg=0, node=None):
+        self.last = len(self.code)
+        if node is not None: self.nodes[self.last] = node
+        if self.lines is not None: self.lines.append(self.line)
+        self.code.append(op)
+        self.code.append(arg)
+
+    def emit_binary(self, op, node=None):
+        # There are no jumps, so a CONST just emitted is always the right
+        # operand and can be folded into the operator.
+        last = self.last
+        if last is not None and self.code[last] == OP_CONST and op in CONST_FORMS:
+            self.code[last] = CONST_FORMS[op]
+            if node is not None: self.nodes[last] = node
+            if self.lines is not None: self.lines[last // 2] = self.line
+            return
+        self.emit(op, 0, node)
+
+    def add_constant(self, value):
+        # 1 and 1.0, or 0.0 and -0.0, are equal but must stay distinct.
+        key = (value.__class__, repr(value))
+        index = self.constant_index.get(key)
+        if index is None:
+            index = self.constant_index[key] = len(self.constants)
+            self.constants.append(value)
+        return index
+
+    def add_name(self, name):
+        slot = self.name_index.get(name)
+        if slot is None:
+            slot = self.name_index[name] = len(self.names)
+            self.names.append(name)
+        return slot
+
+    def disassemble(self):
+        lines = []
+        code = self.code
+        for pc in range(0, len(code), 2):
+            op, arg = code[pc], code[pc + 1]
+            line = f'{pc:>6} {OPCODE_NAMES[op]:<6}'
+            if op == OP_CONST or OP_ADD_CONST <= op <= OP_DIV_CONST: line += f' {arg} ({self.constants[arg]!r})'
+            elif op in (OP_LOAD, OP_STORE): line += f' {arg} ({self.names[arg]})'
+            lines.append(line)
+        return '\n'.join(lines)
+
+#######################################
+# COMPILER
+#######################################
+
+class Compiler:
+    def __init__(self, resolution=None, lines=False):
+        # With a resolver.Resolution, variables use the slots the resolver
+        # gave their nodes, and names are not looked up while compiling.
+        # With lines, the chunk records the source line of each instruction.
+        self.chunk = Chunk(lines)
+        self.resolved = resolution is not None
+        if self.resolved:
+            self.chunk.names = list(resolution.names)
+            self.chunk.name_index = dict(resolution.program_slots)
+
+    def compile(self, node):
+        # Walks the tree with an explicit stack: the parser builds chains of
+        # BinOpNode left-deep, and long ones are far deeper than the
+        # recursion limit. An entry marked done has had its children emitted.
+        # A shared node is evaluated once into a temporary slot, named so it
+        # cannot clash with a program name, and loaded from there after.
+        chunk = self.chunk
+        shared = shared_nodes(node, OPERATOR_NODES)
+        temps = {}
+        work = [(node, False)]
+        while work:
+            node, done = work.pop()
+            if node is None: continue
+            if chunk.lines is not None: chunk.line = line_of(token_of(node))
+            if not done and id(node) in temps:
+                chunk.emit(OP_LOAD, temps[id(node)])
+                continue
+            node_type = node.__class__
+
+            if node_type is NumberNode:
+                chunk.emit(OP_CONST, chunk.add_constant(node.tok.value))
+
+            elif node_type is BinOpNode:
+                if done:
+                    chunk.emit_binary(BINARY_OPS[node.op_tok.type], node if node.op_tok.type == TT_DIV else None)
+                else:
+                    work.append((node, True))
+                    work.append((node.right_node, False))
+                    work.append((node.left_node, False))
+
+            elif node_type is UnaryOpNode:
+                if done:
+                    if node.op_tok.type == TT_MINUS: chunk.emit(OP_NEG)
+                else:
+                    work.append((node, True))
+                    work.append((node.node, False))
+
+            elif node_type is NumberAccessNode:
+                slot = node.slot if self.resolved else chunk.add_name(name_of(node.Number_name_tok))
+                chunk.emit(OP_LOAD, slot, node)
+
+            elif node_type is NumberAssignNode:
+                if done:
+                    slot = node.slot if self.resolved else chunk.add_name(name_of(node.Number_name_tok))
+                    chunk.emit(OP_STORE, slot)
+                else:
+                    work.append((node, True))
+                    work.append((node.value_node, False))
+
+            elif node_type is HeadNode:
+                # Each section leaves its value on the stack.
+                work.append((node.right_node, False))
+                work.append((node.left_node, False))
+
+            else:
+                raise TypeError(f'cannot compile {node_type.__name__}')
+
+            if done and id(node) in shared:
+                temps[id(node)] = chunk.add_name(f'${len(temps)}')
+                chunk.emit(OP_STORE, temps[id(node)])
+
+        chunk.emit(OP_HALT)
+        return chunk
+
+#######################################
+# CONTEXT
+#######################################
+
+class Context:
+    def __init__(self, display_name, parent=None, parent_entry_pos=None):
+        self.display_name = display_name
+        self.parent = parent
+        self.parent_entry_pos = parent_entry_pos
+
+#######################################
+# VM
+#######################################
+
+UNDEFINED = object()
+
+class VM:
+    def __init__(self, chunk, context=None):
+        self.chunk = chunk
+        self.context = context or Context('<program>')
+        self.slots = [UNDEFINED] * len(chunk.names)
+
+    def run(self, pc=0, stack=None):
+        # Returns the values left by each section, and an error. Given pc and
+        # the stack a HALT left, it carries on from there instead.
+        code = self.chunk.code
+        constants = self.chunk.constants
+        slots = self.slots
+        if stack is None: stack = []
+        push = stack.append
+        pop = stack.pop
+
+        # Opcodes as locals; the comparisons below are the hot path.
+        const, load, store, add, sub, mul, div, neg = (
+            OP_CONST, OP_LOAD, OP_STORE, OP_ADD, OP_SUB, OP_MUL, OP_DIV, OP_NEG)
+        add_const, sub_const, mul_const, div_const = OP_ADD_CONST, OP_SUB_CONST, OP_MUL_CONST, OP_DIV_CONST
+
+        while True:
+            op = code[pc]
+            if op == const:
+                push(constants[code[pc + 1]])
+            elif op == add_const:
+                stack[-1] = stack[-1] + constants[code[pc + 1]]
+            elif op == mul_const:
+                stack[-1] = stack[-1] * constants[code[pc + 1]]
+            elif op == sub_const:
+                stack[-1] = stack[-1] - constants[code[pc + 1]]
+            elif op == div_const:
+                right = constants[code[pc + 1]]
+                if right == 0:
+                    return None, self.error(pc, 'Division by zero')
+                stack[-1] = stack[-1] / right
+            elif op == add:
+                right = pop()
+                stack[-1] = stack[-1] + right
+            elif op == mul:
+                right = pop()
+                stack[-1] = stack[-1] * right
+            elif op == sub:
+                right = pop()
+                stack[-1] = stack[-1] - right
+            elif op == div:
+                right = pop()
+                if right == 0:
+                    return None, self.error(pc, 'Division by zero')
+                stack[-1] = stack[-1] / right
+            elif op == neg:
+                stack[-1] = -stack[-1]
+            elif op == load:
+                value = slots[code[pc + 1]]
+                if value is UNDEFINED:
+                    return None, self.error(pc, f"'{self.chunk.names[code[pc + 1]]}' is not defined")
+                push(value)
+            elif op == store:
+                slots[code[pc + 1]] = stack[-1]
+            elif op >= OP_EQ:
+                right = pop()
+                stack[-1] = 1 if COMPARISONS[op - OP_EQ](stack[-1], right) else 0
+            else:
+                return stack, None
+            pc += 2
+
+    def error(self, pc, details):
+        node = self.chunk.nodes[pc]
+        return RTError(node.pos_start, node.pos_end, details, self.context)
+
+#######################################
+# EXECUTE
+#######################################
+
+def compile_node(node, symbol_table=None):
+    return Compiler(resolve(node, symbol_table)).compile(node)
+
+def execute(node, display_name='<program>', symbol_table=None):
+    return VM(compile_node(node, symbol_table), Context(display_name)).run()